@@ -0,0 +1,716 @@
+import sys
+import json
+from json.encoder import encode_basestring_ascii
+import asyncio
+import time
+import contextlib
+import os
+import tempfile
+import tracemalloc
+import platform
+import shutil
+import subprocess
+from parse_game import parse_game_data, load_game_data, save_tree, CustomEncoder, SAVE_FORMATS
+from print_game import print_tree, print_routes
+from paths import iter_paths, path_stats
+from cumulative import cumulative_deaths
+from traverse import walk, preorder, postorder
+import columns
+from validate import validate_tree
+from export_site import export_site
+from serve import Service
+from watch import Watcher
+from utils import sort_by_days
+import synth
+import profiling
+from edit_ops import apply_op, apply_ops, keep_history, route_path
+
+class NullWriter:
+    def __init__(self):
+        self.size = 0
+
+    def write(self, text):
+        self.size += len(text)
+
+    def flush(self):
+        pass
+
+def best_time(fn, repeat = 20):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def build_chain(depth):
+    route_json = {"name": f"Route {depth}", "deaths": [{"id": "a", "count": 1, "days": [depth]}]}
+    for level in range(depth - 1, -1, -1):
+        route_json = {
+            "name": f"Route {level}",
+            "events": [{"name": f"Event {level}", "days": [level]}],
+            "branch": {"name": f"Branch {level}", "day": level, "choices": [
+                {"direction": "left", "name": "Continue", "route": route_json},
+                {"direction": "right", "name": "Stop", "route": {"name": f"Leaf {level}"}},
+            ]},
+        }
+    return route_json
+
+def bench_deep_tree(depth = 20000):
+    chain = build_chain(depth)
+    game_tree = parse_game_data({"names": [{"id": "a", "full": "A"}], "routes": [chain]})
+    route = game_tree.base_routes["Route 0"]
+
+    with contextlib.redirect_stdout(NullWriter()) as out:
+        print_routes(game_tree.names, route)
+    printed = out.size
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "deep.json")
+        save_tree(filename, game_tree, format = "minified")
+        saved = os.path.getsize(filename)
+        reloaded = load_game_data(filename, lazy = True).base_routes["Route 0"]
+        levels = 0
+        while reloaded.branch:
+            reloaded = reloaded.branch.choices[0].route
+            levels += 1
+    return {"depth": depth, "levels_reloaded": levels, "printed_chars": printed, "saved_bytes": saved}
+
+def build_binary(depth, level = 0):
+    route_json = {"name": f"Route {level}", "deaths": [{"id": "a", "count": level % 3, "days": [level]}]}
+    if level < depth:
+        route_json["branch"] = {"name": f"Branch {level}", "day": level, "choices": [
+            {"direction": "left", "name": "Left", "route": build_binary(depth, level + 1)},
+            {"direction": "right", "name": "Right", "route": build_binary(depth, level + 1)},
+        ]}
+    return route_json
+
+# The recursive traversals walk, preorder and postorder replaced, as the
+# reference for their order (tests/test_traverse.py) and their speed
+def recursive_walk(node, enter, exit, depth = 0):
+    enter(node, depth)
+    for child in node.children():
+        recursive_walk(child, enter, exit, depth + 1)
+    exit(node, depth)
+
+def recursive_preorder(node, depth = 0):
+    yield node, depth
+    for child in node.children():
+        yield from recursive_preorder(child, depth + 1)
+
+def recursive_postorder(node, depth = 0):
+    for child in node.children():
+        yield from recursive_postorder(child, depth + 1)
+    yield node, depth
+
+def bench_walk(depth = 13, repeat = 5):
+    # the explicit stacks against plain recursion on a tree shallow enough for both
+    route = parse_game_data({"names": [{"id": "a", "full": "A"}], "routes": [build_binary(depth)]}).base_routes["Route 0"]
+    nothing = lambda node, depth: None
+    results = {
+        "walk": best_time(lambda: walk(route, nothing, nothing), repeat),
+        "recursive_walk": best_time(lambda: recursive_walk(route, nothing, nothing), repeat),
+        "preorder": best_time(lambda: sum(1 for visit in preorder(route)), repeat),
+        "recursive_preorder": best_time(lambda: sum(1 for visit in recursive_preorder(route)), repeat),
+        "postorder": best_time(lambda: sum(1 for visit in postorder(route)), repeat),
+        "recursive_postorder": best_time(lambda: sum(1 for visit in recursive_postorder(route)), repeat),
+    }
+    for name in ("walk", "preorder", "postorder"):
+        results[f"{name}_ratio"] = results[name] / results[f"recursive_{name}"]
+    return results
+
+def enumerated_stats(route):
+    # what path_stats works out bottom-up, counted one playthrough at a time
+    paths = 0
+    totals = {}
+    for path in iter_paths(route):
+        paths += 1
+        for id, death in path.deaths().items():
+            totals.setdefault(id, []).append(death.count)
+    return paths, {id: (min(counts) if len(counts) == paths else 0, max(counts), sum(counts)) for id, counts in totals.items()}
+
+def path_stats_mismatches(route):
+    # [(id, from path_stats, from enumeration)] wherever the two differ
+    stats = path_stats(route)
+    paths, enumerated = enumerated_stats(route)
+    mismatches = [("paths", stats.paths, paths)] if stats.paths != paths else []
+    for id in set(stats.deaths) | set(enumerated):
+        entry = stats.deaths.get(id)
+        dp = (entry.least, entry.most, entry.total) if entry else None
+        if dp != enumerated.get(id):
+            mismatches.append((id, dp, enumerated.get(id)))
+    return mismatches
+
+def bench_paths(depth = 16):
+    game_tree = parse_game_data({"names": [{"id": "a", "full": "A"}], "routes": [build_binary(depth)]})
+    route = game_tree.base_routes["Route 0"]
+    stats_seconds = best_time(lambda: path_stats(route), repeat = 3)
+    start = time.perf_counter()
+    paths = 0
+    for path in iter_paths(route):
+        paths += 1
+        path.deaths()
+    enumerate_seconds = time.perf_counter() - start
+    chain = parse_game_data({"names": [{"id": "a", "full": "A"}], "routes": [build_chain(20000)]})
+    chain_stats = path_stats(chain.base_routes["Route 0"])
+    # the counts, least, most and totals checked against enumeration on a
+    # synthetic tree small enough to list
+    synthetic = parse_game_data(synth.generate(depth = 5, branching = 3))
+    mismatches = [mismatch for base_route in synthetic.base_routes.values() for mismatch in path_stats_mismatches(base_route)]
+    if paths != path_stats(route).paths or chain_stats.paths != 20000 + 1 or mismatches:
+        raise AssertionError(f"path_stats disagrees with enumeration: {paths} vs {path_stats(route).paths} paths, {chain_stats.paths} on the chain, {mismatches[ : 5]}")
+    return {"paths": paths, "dp_paths": path_stats(route).paths, "dp_seconds": stats_seconds, "enumerate_seconds": enumerate_seconds, "deep_chain_paths": chain_stats.paths}
+
+def legacy_class(*fields):
+    def __init__(self, *values):
+        for field, value in zip(fields, values):
+            setattr(self, field, value)
+    return type("Legacy", (), {"__init__": __init__})
+
+# The node model as it was before __slots__, kept to measure against
+LegacyName = legacy_class("id", "full", "first", "last", "title", "position", "web_title")
+LegacyDeath = legacy_class("id", "count", "days")
+LegacyEvent = legacy_class("name", "days")
+LegacyChoice = legacy_class("branch", "direction", "name", "route")
+LegacyBranch = legacy_class("parent", "name", "day", "choices")
+LegacyRoute = legacy_class("parent", "name", "deaths", "events", "branch")
+
+def legacy_parse_game_data(data):
+    names = {}
+    for name_json in data["names"]:
+        fields = [name_json.get(key) for key in ("full", "first", "last", "title", "position", "web_title")]
+        names[name_json["id"].lower()] = LegacyName(name_json["id"].lower(), *fields)
+    routes = []
+    stack = [(None, route_json, None) for route_json in data["routes"]]
+    while stack:
+        parent, route_json, choice = stack.pop()
+        events = [LegacyEvent(event["name"], list(event["days"])) for event in route_json.get("events", [])]
+        deaths = {death["id"].lower(): LegacyDeath(death["id"].lower(), death["count"], list(death["days"])) for death in route_json.get("deaths", [])}
+        route = LegacyRoute(parent, route_json["name"], deaths, events, None)
+        if choice:
+            choice.route = route
+        else:
+            routes.append(route)
+        if "branch" in route_json:
+            branch_json = route_json["branch"]
+            route.branch = LegacyBranch(route, branch_json["name"], branch_json["day"], [])
+            for choice_json in branch_json["choices"]:
+                new_choice = LegacyChoice(route.branch, choice_json["direction"], choice_json["name"], None)
+                route.branch.choices.append(new_choice)
+                stack.append((route, choice_json["route"], new_choice))
+    return names, routes
+
+def retained_memory(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return retained
+
+def bench_memory(filename, copies = 20):
+    data = replicated_data(filename, copies)
+    return {
+        "legacy_bytes": retained_memory(lambda: legacy_parse_game_data(data)),
+        "slotted_bytes": retained_memory(lambda: parse_game_data(data)),
+    }
+
+def build_repeated(depth, fanout = 3, level = 0, variant = 0):
+    # most routes repeat one of a handful of death and event lists, and every
+    # leaf is the same placeholder route
+    if level == depth:
+        return {"name": "[UNKNOWN]", "deaths": [{"id": "a", "count": 1, "days": [-1]}], "events": [{"name": "[UNKNOWN]", "days": [-1]}]}
+    route_json = {
+        "name": f"Route {level} ({variant % 4})",
+        "deaths": [{"id": "a", "count": variant % 4, "days": [level, level + 1]}, {"id": "b", "count": 1, "days": [level]}],
+        "events": [{"name": f"Event {variant % 4}", "days": [level]} for i in range(3)],
+    }
+    route_json["branch"] = {"name": f"Branch {level}", "day": level, "choices": [
+        {"direction": direction, "name": direction.title(), "route": build_repeated(depth, fanout, level + 1, variant * fanout + i)}
+        for i, direction in enumerate(["left", "right", "top"][ : fanout])
+    ]}
+    return route_json
+
+def bench_sharing(depth = 8):
+    data = {"names": [{"id": "a", "full": "A"}, {"id": "b", "full": "B"}], "routes": [build_repeated(depth)]}
+    return {
+        "routes": sum(3 ** level for level in range(depth + 1)),
+        "separate_bytes": retained_memory(lambda: parse_game_data(data)),
+        "shared_bytes": retained_memory(lambda: parse_game_data(data, share = True)),
+    }
+
+def replicated_data(filename, copies):
+    with open(filename) as f:
+        data = json.load(f)
+    data["routes"] = [dict(route, name = f"{route['name']} ({i})") for i in range(copies) for route in data["routes"]]
+    return data
+
+def peak_memory(fn):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def bench_save(filename, copies = 20, repeat = 3):
+    game_tree = parse_game_data(replicated_data(filename, copies))
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "legacy.json")
+
+        def legacy_save():
+            with open(output, "w") as f:
+                json.dump(game_tree, f, cls = CustomEncoder, indent = 2)
+
+        elapsed = best_time(legacy_save, repeat)
+        results["legacy"] = {"seconds": elapsed, "bytes": os.path.getsize(output), "peak_bytes": peak_memory(legacy_save)}
+        for format in SAVE_FORMATS:
+            output = os.path.join(directory, f"tree.{format}")
+            save = lambda: save_tree(output, game_tree, format)
+            elapsed = best_time(save, repeat)
+            results[format] = {"seconds": elapsed, "bytes": os.path.getsize(output), "peak_bytes": peak_memory(save)}
+    for result in results.values():
+        result["mb_per_second"] = results["legacy"]["bytes"] / result["seconds"] / 1e6
+    return results
+
+# The generic JSON writer saves went through before write_tree, walking the
+# as_dict() output. Kept as the old encoder bench_traversal measures against.
+def encode_scalar(value):
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, int):
+        return int.__repr__(value)
+    return json.dumps(value)
+
+def json_children(node):
+    value = node[1]
+    if isinstance(value, dict):
+        return value.items()
+    if isinstance(value, list):
+        return ((None, item) for item in value)
+    return ()
+
+def write_json(f, value, indent = 2):
+    counts = []
+    key_separator = ": " if indent is not None else ":"
+    
+    def enter(node, depth):
+        key, value = node
+        parts = []
+        if counts:
+            if counts[-1]:
+                parts.append(",")
+            counts[-1] += 1
+            if indent is not None:
+                parts.append("\n" + " " * (indent * depth))
+        if key is not None:
+            parts.append(encode_basestring_ascii(key) + key_separator)
+        if isinstance(value, dict):
+            parts.append("{" if value else "{}")
+        elif isinstance(value, list):
+            parts.append("[" if value else "[]")
+        else:
+            parts.append(encode_scalar(value))
+        if value and isinstance(value, (dict, list)):
+            counts.append(0)
+        f.write("".join(parts))
+    
+    def exit(node, depth):
+        value = node[1]
+        if value and isinstance(value, (dict, list)):
+            counts.pop()
+            if indent is not None:
+                f.write("\n" + " " * (indent * depth))
+            f.write("}" if isinstance(value, dict) else "]")
+    
+    walk((None, value), enter, exit, json_children)
+
+def bench_traversal(filename, repeat = 20):
+    with open(filename) as f:
+        data = json.load(f)
+    game_tree = parse_game_data(data)
+    results = {}
+    results["parse"] = best_time(lambda: parse_game_data(data), repeat)
+    with contextlib.redirect_stdout(NullWriter()):
+        results["print"] = best_time(lambda: print_tree(parse_game_data(data)), repeat) - results["parse"]
+    results["as_dict"] = best_time(lambda: game_tree.as_dict(), repeat)
+    results["save"] = best_time(lambda: write_json(NullWriter(), game_tree.as_dict()), repeat)
+    return results
+
+def python_route_totals(game_tree):
+    totals = []
+    per_day = {}
+    for base_route in game_tree.base_routes.values():
+        for route, depth in preorder(base_route, lambda node: node.child_routes()):
+            totals.append(sum(death.count for death in cumulative_deaths(route).values()))
+            for death in route.deaths.values():
+                for day in death.days:
+                    per_day[(death.id, day)] = per_day.get((death.id, day), 0) + 1
+    return totals, per_day
+
+def bench_columns(filename, copies = 20, repeat = 5):
+    if columns.np is None:
+        return {"skipped": "numpy is not installed"}
+    game_tree = parse_game_data(replicated_data(filename, copies))
+    store = columns.ColumnStore(game_tree)
+
+    def fresh_python():
+        # drop the cached totals so the loop pays for them like the arrays do
+        for base_route in game_tree.base_routes.values():
+            for route, depth in preorder(base_route, lambda node: node.child_routes()):
+                route.death_totals = None
+        python_route_totals(game_tree)
+
+    results = {}
+    results["build"] = best_time(lambda: columns.ColumnStore(game_tree), repeat)
+    results["python"] = best_time(fresh_python, repeat)
+    results["numpy"] = best_time(lambda: (store.route_totals(), store.deaths_by_character_day()), repeat)
+    chain = columns.ColumnStore(parse_game_data({"names": [{"id": "a", "full": "A"}], "routes": [build_chain(20000)]}))
+    results["deep_chain_totals"] = best_time(chain.route_totals, repeat)
+    return results
+
+def bench_apply(filename, copies = 20, count = 50000):
+    # a scripted bulk import: deaths, events and retitles spread over every
+    # route. Without undo history an op edits the route's lists in place;
+    # bench_undo's ops each copy the one list they change, O(its length).
+    game_tree = parse_game_data(replicated_data(filename, copies))
+    routes = [route for base_route in game_tree.base_routes.values() for route, depth in preorder(base_route, lambda node: node.child_routes())]
+    paths = [route_path(game_tree, route) for route in routes]
+    ids = list(game_tree.names)
+    lines = []
+    for i in range(count):
+        path = paths[i * 7919 % len(paths)]
+        if i % 3 == 0:
+            op = {"op": "add_death", "path": path, "death": {"id": ids[i % len(ids)], "count": 1, "days": [i % 30]}}
+        elif i % 3 == 1:
+            op = {"op": "add_event", "path": path, "event": {"name": f"Event {i}", "days": [i % 30]}}
+        else:
+            op = {"op": "set_title", "path": path, "name": f"Route {i}"}
+        lines.append(json.dumps(op))
+    start = time.perf_counter()
+    applied, errors = apply_ops(game_tree, lines)
+    elapsed = time.perf_counter() - start
+    return {"ops": applied, "rejected": len(errors), "seconds": elapsed, "ops_per_second": applied / elapsed}
+
+def bench_undo(filename, copies = 20, count = 500):
+    # steps back and forward through a session of edits spread over the tree,
+    # against one copy of it as JSON, the cheapest whole-tree backup
+    game_tree = parse_game_data(replicated_data(filename, copies))
+    history = keep_history(game_tree)
+    routes = [route for base_route in game_tree.base_routes.values() for route, depth in preorder(base_route, lambda node: node.child_routes())]
+    ids = list(game_tree.names)
+    tracemalloc.start()
+    for i in range(count):
+        route = routes[i * 7919 % len(routes)]
+        apply_op(game_tree, {"op": "add_death", "path": route_path(game_tree, route), "death": {"id": ids[i % len(ids)], "count": 1, "days": [i % 30]}})
+    history_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    results = {"edits": len(history.undo), "history_bytes": history_bytes}
+    start = time.perf_counter()
+    for i in range(count):
+        apply_op(game_tree, {"op": "undo"})
+    results["undo_all_seconds"] = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(count):
+        apply_op(game_tree, {"op": "redo"})
+    results["redo_all_seconds"] = time.perf_counter() - start
+    results["json_backup_seconds"] = best_time(lambda: json.dumps(game_tree.as_dict()), 3)
+    results["json_backup_bytes"] = len(json.dumps(game_tree.as_dict()))
+    return results
+
+def bench_validate(filename, copies = 100, jobs = (1, 2, 4, 8)):
+    game_tree = parse_game_data(replicated_data(filename, copies))
+    results = {}
+    reports = []
+    for count in jobs:
+        start = time.perf_counter()
+        reports.append(validate_tree(game_tree, count))
+        results[f"jobs_{count}"] = time.perf_counter() - start
+    results["identical"] = all(report == reports[0] for report in reports)
+    return results
+
+def bench_profiling(filename, repeat = 5):
+    # load and display with profiling off, with phases only and with the
+    # per-function counters patched in
+    def run():
+        with profiling.phase("load"):
+            game_tree = load_game_data(filename)
+        with profiling.phase("display"):
+            print_tree(game_tree, "text", NullWriter())
+
+    results = {"off": best_time(run, repeat)}
+    for name, options in (("phases", {}), ("calls", {"calls": True})):
+        profiler = profiling.Profiler(**options)
+        profiling.active = profiler
+        try:
+            results[name] = best_time(run, repeat)
+        finally:
+            profiler.stop()
+    return results
+
+# Size tiers for the synthetic suite, each a set of synth.generate options.
+# Results come out as JSON so runs from two versions can be compared.
+TIERS = {
+    "small": {"depth": 4, "branching": 2, "deaths": 3, "events": 2, "names": 20},
+    "medium": {"depth": 7, "branching": 3, "deaths": 4, "events": 3, "names": 50},
+    "large": {"depth": 8, "branching": 3, "deaths": 5, "events": 4, "names": 200},
+}
+
+def bench_sqlite(filename, copies = 20, count = 200):
+    # what one edit costs to make durable: a commit of the edited route's
+    # rows against saving the whole tree as JSON
+    game_tree = parse_game_data(replicated_data(filename, copies))
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        json_output = os.path.join(directory, "tree.json")
+        database = os.path.join(directory, "tree.sqlite")
+        results["json_save_seconds"] = best_time(lambda: save_tree(json_output, game_tree), 3)
+        results["sqlite_save_seconds"] = best_time(lambda: save_tree(database, game_tree), 3)
+        results["json_load_seconds"] = best_time(lambda: load_game_data(json_output), 3)
+        results["sqlite_load_seconds"] = best_time(lambda: load_game_data(database).store.close(), 3)
+        stored_tree = load_game_data(database)
+        stored_tree.store.open(stored_tree, database)
+        routes = [route for base_route in stored_tree.base_routes.values() for route, depth in preorder(base_route, lambda node: node.child_routes())]
+        ids = list(stored_tree.names)
+        start = time.perf_counter()
+        for i in range(count):
+            route = routes[i * 7919 % len(routes)]
+            apply_op(stored_tree, {"op": "add_death", "path": route_path(stored_tree, route), "death": {"id": ids[i % len(ids)], "count": 1, "days": [i % 30]}})
+        results["sqlite_op_seconds"] = (time.perf_counter() - start) / count
+        stored_tree.store.close(stored_tree)
+    results["ops_per_json_save"] = results["json_save_seconds"] / results["sqlite_op_seconds"]
+    return results
+
+def bench_export_site(filename, copies = 20, jobs = (1, 2, 4)):
+    # a full export against rebuilds after no change and after one edit
+    game_tree = parse_game_data(replicated_data(filename, copies))
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for job_count in jobs:
+            start = time.perf_counter()
+            export_site(game_tree, directory, job_count, force = True)
+            results[f"full_jobs_{job_count}"] = time.perf_counter() - start
+        start = time.perf_counter()
+        export_site(game_tree, directory)
+        results["unchanged"] = time.perf_counter() - start
+        route = list(game_tree.base_routes.values())[-1]
+        while route.branch:
+            route = route.branch.choices[-1].route
+        apply_op(game_tree, {"op": "add_event", "path": route_path(game_tree, route), "event": {"name": "Benchmark", "days": [1]}})
+        start = time.perf_counter()
+        results["one_leaf_edit_pages"] = export_site(game_tree, directory)[0]
+        results["one_leaf_edit"] = time.perf_counter() - start
+    return results
+
+def bench_serve(filename, copies = 20, clients = 200, requests_per_client = 20):
+    # hundreds of local clients at once against one loaded tree, next to
+    # what loading the file for every lookup would cost
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "tree.json")
+        with open(source, "w") as f:
+            json.dump(replicated_data(filename, copies), f)
+        results["load_seconds"] = best_time(lambda: load_game_data(source), 3)
+        service = Service(source, lambda: load_game_data(source))
+        game_tree = service.game_tree
+        routes = [route for base_route in game_tree.base_routes.values() for route, depth in preorder(base_route, lambda node: node.child_routes())]
+        targets = [f"/{('routes', 'deaths', 'subtree')[i % 3]}/{'/'.join(str(step) for step in route_path(game_tree, routes[i * 7919 % len(routes)]))}" for i in range(clients * requests_per_client)]
+
+        async def client(port, first):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            for target in targets[first : first + requests_per_client]:
+                writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+                await reader.readexactly(length)
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(service.handle, "127.0.0.1", 0, backlog = 1024)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                start = time.perf_counter()
+                await asyncio.gather(*(client(port, i * requests_per_client) for i in range(clients)))
+                return time.perf_counter() - start
+
+        results["cold_requests_per_second"] = len(targets) / asyncio.run(run())
+        results["warm_requests_per_second"] = len(targets) / asyncio.run(run())
+        results["cache_hits"] = service.hits
+    return results
+
+def bench_watch(filename, copies = 20, repeat = 5):
+    # from one base route changing on disk to the refreshed display, next to
+    # loading and displaying the whole file again
+    data = replicated_data(filename, copies)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "tree.json")
+        with open(source, "w") as f:
+            json.dump(data, f, indent = 2)
+        results["full_display_seconds"] = best_time(lambda: print_tree(load_game_data(source), "text", NullWriter()), repeat)
+        watcher = Watcher(source)
+        start = time.perf_counter()
+        watcher.refresh()
+        results["first_refresh_seconds"] = time.perf_counter() - start
+        best = None
+        for i in range(repeat):
+            data["routes"][-1]["name"] = f"Watched {i}"
+            with open(source, "w") as f:
+                json.dump(data, f, indent = 2)
+            start = time.perf_counter()
+            rendered, total = watcher.refresh()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results["one_route_refresh_seconds"] = best
+        results["routes_rendered"] = rendered
+        results["base_routes"] = total
+    return results
+
+EAGER_MODULES = ["parse_game", "print_game", "edit_game", "journal", "edit_ops", "query", "paths", "columns", "diff_game", "validate", "sqlite_store", "export_site", "serve", "watch"]
+
+def run_python(args, **kwargs):
+    # with bytecode caching on, as an installed tool would run
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return subprocess.run([sys.executable] + args, env = env, cwd = os.path.dirname(os.path.abspath(__file__)), **kwargs)
+
+def import_time(args):
+    # total microseconds -X importtime reports for the top level imports
+    result = run_python(["-X", "importtime"] + args, capture_output = True, text = True)
+    total = 0
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and not line.endswith("imported package"):
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2][1 : 2] != " " and fields[1].strip().isdigit():
+                total += int(fields[1])
+    return total
+
+def bench_startup(filename, repeat = 5):
+    # one-shot display of a cached tree, end to end in a fresh interpreter,
+    # next to what importing every command up front would cost
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "tree.json")
+        shutil.copy(filename, source)
+        display = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py"), source, "display", "text", os.devnull]
+        run_python(display, check = True) #writes the snapshot and bytecode
+        results["display_import_us"] = min(import_time(display) for i in range(repeat))
+        results["display_seconds"] = best_time(lambda: run_python(display, check = True), repeat)
+    results["all_commands_import_us"] = min(import_time(["-c", "import " + ", ".join(EAGER_MODULES)]) for i in range(repeat))
+    results["bare_interpreter_seconds"] = best_time(lambda: run_python(["-c", "pass"], check = True), repeat)
+    return results
+
+def measure(fn, repeat):
+    return {"seconds": best_time(fn, repeat), "peak_bytes": peak_memory(fn)}
+
+def bench_tier(options, seed = 0, repeat = 3, edits_per_route = 2):
+    data = synth.generate(seed, **options)
+    results = {"options": options, "routes": synth.route_count(options["depth"], options["branching"])}
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "source.json")
+        with open(source, "w") as f:
+            json.dump(data, f, indent = 2)
+        results["bytes"] = os.path.getsize(source)
+        game_tree = load_game_data(source)
+        routes = [route for base_route in game_tree.base_routes.values() for route, depth in preorder(base_route, lambda node: node.child_routes())]
+        phases = results["phases"] = {}
+        phases["load"] = measure(lambda: load_game_data(source), repeat)
+        phases["save"] = measure(lambda: save_tree(os.path.join(directory, "saved.json"), game_tree), repeat)
+        phases["display"] = measure(lambda: print_tree(game_tree, "text", NullWriter()), repeat)
+        phases["sort_by_days"] = measure(lambda: [sort_by_days(route.deaths.values()) for route in routes], repeat)
+
+        ids = list(game_tree.names)
+        lines = [json.dumps({"op": "add_death", "path": route_path(game_tree, routes[i * 7919 % len(routes)]), "death": {"id": ids[i % len(ids)], "count": 1, "days": [i % 30]}}) for i in range(len(routes) * edits_per_route)]
+        phases["edit"] = measure_edits(source, lines, repeat)
+    return results
+
+def measure_edits(source, lines, repeat):
+    # edits change the tree, so every run gets a fresh load outside the timing
+    best = None
+    for i in range(repeat):
+        game_tree = load_game_data(source)
+        start = time.perf_counter()
+        apply_ops(game_tree, lines)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    game_tree = load_game_data(source)
+    return {"seconds": best, "peak_bytes": peak_memory(lambda: apply_ops(game_tree, lines)), "ops": len(lines)}
+
+def bench_tiers(tiers = None, seed = 0, repeat = 3):
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "tiers": {name: bench_tier(TIERS[name], seed, repeat) for name in (tiers or TIERS)},
+    }
+
+def compare_tiers(old, new, out):
+    for name, tier in new["tiers"].items():
+        old_tier = old["tiers"].get(name)
+        if old_tier is None:
+            continue
+        for phase, result in tier["phases"].items():
+            old_result = old_tier["phases"].get(phase)
+            if old_result:
+                out.write(f"{name} {phase}: {result['seconds'] / old_result['seconds']:.2f}x time, {result['peak_bytes'] / max(old_result['peak_bytes'], 1):.2f}x peak memory\n")
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "tiers":
+        # benchmark.py tiers [output_json] [tier...]
+        results = bench_tiers(sys.argv[3 : ] or None)
+        if len(sys.argv) >= 3:
+            with open(sys.argv[2], "w") as f:
+                json.dump(results, f, indent = 2)
+        else:
+            print(json.dumps(results, indent = 2))
+        sys.exit(0)
+    if len(sys.argv) >= 2 and sys.argv[1] == "compare":
+        # benchmark.py compare old_json new_json
+        with open(sys.argv[2]) as f:
+            old = json.load(f)
+        with open(sys.argv[3]) as f:
+            new = json.load(f)
+        compare_tiers(old, new, sys.stdout)
+        sys.exit(0)
+    filename = sys.argv[1] if len(sys.argv) >= 2 else "game_data.json"
+    for key, value in bench_traversal(filename).items():
+        print(f"{key}: {value * 1000:.3f} ms")
+    for key, value in bench_memory(filename).items():
+        print(f"{key}: {value / 1e6:.2f} MB")
+    for key, value in bench_save(filename).items():
+        print(f"save {key}: {value['seconds'] * 1000:.1f} ms, {value['bytes'] / 1e6:.2f} MB, peak {value['peak_bytes'] / 1e6:.2f} MB, {value['mb_per_second']:.1f} MB/s of pretty JSON")
+    print(bench_deep_tree())
+    for key, value in bench_walk().items():
+        print(f"walk {key}: {value:.2f}x" if key.endswith("_ratio") else f"walk {key}: {value * 1000:.3f} ms")
+    print(bench_paths())
+    for key, value in bench_sharing().items():
+        print(f"sharing {key}: {value}")
+    for key, value in bench_columns(filename).items():
+        print(f"columns {key}: {value * 1000:.3f} ms" if isinstance(value, float) else f"columns {key}: {value}")
+    for key, value in bench_apply(filename).items():
+        print(f"apply {key}: {value}")
+    for key, value in bench_undo(filename).items():
+        print(f"undo {key}: {value}")
+    for key, value in bench_sqlite(filename).items():
+        print(f"sqlite {key}: {value}")
+    for key, value in bench_export_site(filename).items():
+        print(f"export-site {key}: {value * 1000:.1f} ms" if isinstance(value, float) else f"export-site {key}: {value}")
+    for key, value in bench_serve(filename).items():
+        print(f"serve {key}: {value}")
+    for key, value in bench_watch(filename).items():
+        print(f"watch {key}: {value * 1000:.1f} ms" if isinstance(value, float) else f"watch {key}: {value}")
+    for key, value in bench_startup(filename).items():
+        print(f"startup {key}: {value * 1000:.1f} ms" if isinstance(value, float) else f"startup {key}: {value}")
+    for key, value in bench_profiling(filename).items():
+        print(f"profiling {key}: {value * 1000:.3f} ms")
+    for key, value in bench_validate(filename).items():
+        print(f"validate {key}: {value * 1000:.1f} ms" if isinstance(value, float) else f"validate {key}: {value}")
@@ -0,0 +1,133 @@
+from parse_game import Route
+from traverse import preorder
+
+try:
+    import numpy as np
+except ImportError: #only the analytics need numpy
+    np = None
+
+# The whole tree flattened into NumPy columns for analytics. Routes are
+# numbered in preorder, so a route's parent always has a smaller id. Each
+# table is a set of equal-length arrays:
+#   routes:     parent (-1 for base routes), depth
+#   deaths:     route, character, count, one row per Death
+#   death days: route, character, day, one row per day a death lists
+#   event days: route, day, one row per day an event lists
+# Characters are coded by their index in ColumnStore.characters.
+
+class ColumnStore:
+    def __init__(self, game_tree):
+        if np is None:
+            raise RuntimeError("numpy is required for column analytics, install it with pip install numpy")
+        self.characters = list(game_tree.names)
+        codes = {id: code for code, id in enumerate(self.characters)}
+        self.route_names = []
+        ids = {}
+        parents = []
+        depths = []
+        death_columns = ([], [], [])
+        death_day_columns = ([], [], [])
+        event_day_columns = ([], [])
+
+        for base_route in game_tree.base_routes.values():
+            for route, depth in preorder(base_route, Route.child_routes):
+                route_id = ids[route] = len(self.route_names)
+                self.route_names.append(route.name)
+                parents.append(ids[route.parent] if route.parent is not None else -1)
+                depths.append(depth)
+                for death in route.deaths.values():
+                    code = codes.get(death.id)
+                    if code is None:
+                        code = codes[death.id] = len(self.characters)
+                        self.characters.append(death.id)
+                    death_columns[0].append(route_id)
+                    death_columns[1].append(code)
+                    death_columns[2].append(death.count)
+                    for day in death.days:
+                        death_day_columns[0].append(route_id)
+                        death_day_columns[1].append(code)
+                        death_day_columns[2].append(day)
+                for event in route.events:
+                    for day in event.days:
+                        event_day_columns[0].append(route_id)
+                        event_day_columns[1].append(day)
+
+        self.route_parent = np.array(parents, dtype = np.int64)
+        self.route_depth = np.array(depths, dtype = np.int64)
+        self.death_route, self.death_character, self.death_count = (np.array(column, dtype = np.int64) for column in death_columns)
+        self.death_day_route, self.death_day_character, self.death_day = (np.array(column, dtype = np.int64) for column in death_day_columns)
+        self.event_day_route, self.event_day = (np.array(column, dtype = np.int64) for column in event_day_columns)
+
+    def deaths_by_character(self):
+        # summed death counts per character over every route's own deaths
+        return np.bincount(self.death_character, weights = self.death_count, minlength = len(self.characters)).astype(np.int64)
+
+    def deaths_by_character_day(self):
+        # (characters, days, counts): how many death entries name each day
+        return group_count(self.death_day_character, self.death_day)
+
+    def events_by_day(self):
+        days, counts = np.unique(self.event_day, return_counts = True)
+        return days, counts
+
+    def route_deaths(self):
+        return np.bincount(self.death_route, weights = self.death_count, minlength = len(self.route_names)).astype(np.int64)
+
+    def route_totals(self):
+        # deaths along each route's whole ancestor chain, as the display shows them
+        return ancestor_sums(self.route_deaths(), self.route_parent)
+
+    def cumulative_by_character(self):
+        # routes x characters matrix of cumulative death counts
+        own = np.zeros((len(self.route_names), len(self.characters)), dtype = np.int64)
+        np.add.at(own, (self.death_route, self.death_character), self.death_count)
+        return ancestor_sums(own, self.route_parent)
+
+def group_count(first, second):
+    if len(first) == 0:
+        return first, second, np.zeros(0, dtype = np.int64)
+    pairs, counts = np.unique(np.stack([first, second], axis = 1), axis = 0, return_counts = True)
+    return pairs[:, 0], pairs[:, 1], counts
+
+def ancestor_sums(values, parents):
+    # pointer jumping: after round k every route has added the values of its
+    # 2^k nearest ancestors, so a chain of depth d takes log2(d) rounds
+    sums = values.copy()
+    jump = parents.copy()
+    live = np.flatnonzero(jump >= 0)
+    while len(live):
+        targets = jump[live]
+        sums[live] += sums[targets]
+        jump[live] = jump[targets]
+        live = live[jump[live] >= 0]
+    return sums
+
+def write_summary(game_tree, out, store = None):
+    store = store or ColumnStore(game_tree)
+    names = game_tree.names
+
+    def full_name(code):
+        id = store.characters[code]
+        return names[id].full if id in names and names[id].full else id
+
+    out.write("Deaths per character\n")
+    totals = store.deaths_by_character()
+    for code in np.argsort(-totals, kind = "stable"):
+        if totals[code]:
+            out.write(f"  {full_name(code)}: {totals[code]}\n")
+
+    out.write("\nDeath entries per character per day\n")
+    characters, days, counts = store.deaths_by_character_day()
+    for code, day, count in zip(characters.tolist(), days.tolist(), counts.tolist()):
+        out.write(f"  {full_name(code)}, day {day}: {count}\n")
+
+    out.write("\nEvents per day\n")
+    days, counts = store.events_by_day()
+    for day, count in zip(days.tolist(), counts.tolist()):
+        out.write(f"  day {day}: {count}\n")
+
+    out.write("\nDeaths per route (own / including earlier routes)\n")
+    own = store.route_deaths()
+    totals = store.route_totals()
+    for route_id in range(len(store.route_names)):
+        out.write(f"  {'  ' * int(store.route_depth[route_id])}{store.route_names[route_id]}: {own[route_id]} / {totals[route_id]}\n")
@@ -0,0 +1,212 @@
+import sys
+
+# The commands main.py runs, one function each, looked up by name in
+# COMMANDS. A command imports what it needs when it runs, so starting the
+# tool only costs the modules of the command asked for, however many
+# commands there are. Every command gets the loaded tree (None for those in
+# NO_TREE), its own arguments, and the load options: the source file name
+# and the lazy, cache and share flags.
+
+def load(options, filename):
+    from parse_game import load_game_data
+    return load_game_data(filename, lazy = options["lazy"], cache = options["cache"], share = options["share"])
+
+def usage_error(command):
+    print(f"Usage: {command} {USAGES[command]}".rstrip())
+    sys.exit(1)
+
+def edit_session(game_tree, options, output):
+    # edits go straight into a SQLite source, anything else is journaled
+    from edit_game import edit
+    from journal import Journal
+    from sqlite_store import edits_in_place
+    session = game_tree.store if edits_in_place(game_tree, output) else Journal(output)
+    game_tree = session.open(game_tree, options["filename"])
+    edit(game_tree)
+    session.close(game_tree)
+
+def display_command(game_tree, args, options):
+    from print_game import print_tree
+    from render import RENDERERS
+    format = args[0].strip().lower() if args else "text"
+    if format not in RENDERERS:
+        print(f"Unknown display format {format}, expected one of: {', '.join(RENDERERS)}")
+        sys.exit(1)
+    if len(args) >= 2:
+        with open(args[1], "w") as f:
+            print_tree(game_tree, format, f)
+    else:
+        print_tree(game_tree, format)
+
+def edit_command(game_tree, args, options):
+    if not args:
+        print("edit on command line requires output file name!")
+        sys.exit(1)
+    edit_session(game_tree, options, args[0])
+
+def apply_command(game_tree, args, options):
+    from parse_game import save_tree
+    from edit_ops import apply_ops
+    from sqlite_store import edits_in_place
+    if len(args) < 2:
+        print("apply requires an ops file (or - for stdin) and an output file name!")
+        sys.exit(1)
+    store = game_tree.store if edits_in_place(game_tree, args[1]) else None
+    if store:
+        store.open(game_tree, options["filename"])
+    if args[0] == "-":
+        applied, errors = apply_ops(game_tree, sys.stdin)
+    else:
+        with open(args[0], encoding = "utf-8") as f:
+            applied, errors = apply_ops(game_tree, f)
+    for line_no, error in errors:
+        print(f"line {line_no}: {error}")
+    print(f"Applied {applied} op(s), rejected {len(errors)}")
+    if store:
+        store.close(game_tree)
+    else:
+        save_tree(args[1], game_tree)
+
+def validate_command(game_tree, args, options):
+    from validate import validate_tree, write_problems
+    from utils import ChunkWriter
+    try:
+        jobs = int(args[0]) if args else None
+    except ValueError:
+        usage_error("validate")
+    problems = validate_tree(game_tree, jobs)
+    with ChunkWriter(sys.stdout) as out:
+        write_problems(problems, out)
+    print(f"{len(problems)} problem(s) found")
+    if problems:
+        sys.exit(1)
+
+def export_site_command(game_tree, args, options):
+    from export_site import export_site
+    try:
+        if not args:
+            raise ValueError
+        jobs = int(args[1]) if len(args) >= 2 else None
+    except ValueError:
+        usage_error("export-site")
+    rendered, pages, removed = export_site(game_tree, args[0], jobs)
+    print(f"Rendered {rendered} of {pages} page(s), removed {removed}")
+
+def serve_command(game_tree, args, options):
+    from serve import serve
+    try:
+        port = int(args[0]) if args else 8080
+    except ValueError:
+        usage_error("serve")
+    serve(options["filename"], lambda: load(options, options["filename"]), game_tree, port = port)
+
+def watch_command(game_tree, args, options):
+    # reads the file itself, a base route at a time
+    from watch import watch
+    watch(options["filename"], args[0] if args else None)
+
+def save_command(game_tree, args, options):
+    from parse_game import save_tree, SAVE_FORMATS
+    if not args:
+        print("save requires output file name!")
+        sys.exit(1)
+    format = args[1].strip().lower() if len(args) >= 2 else None
+    if format is not None and format not in SAVE_FORMATS:
+        print(f"Unknown save format {format}, expected one of: {', '.join(SAVE_FORMATS)}")
+        sys.exit(1)
+    save_tree(args[0], game_tree, format)
+
+def query_command(game_tree, args, options):
+    from query import QUERY_USAGE, parse_query_args, run_query, write_results
+    from utils import ChunkWriter
+    try:
+        query_options = parse_query_args(game_tree, args)
+    except ValueError as e:
+        print(f"{e}\nUsage: {QUERY_USAGE}")
+        sys.exit(1)
+    with ChunkWriter(sys.stdout) as out:
+        write_results(game_tree, run_query(game_tree, **query_options), out)
+
+def paths_command(game_tree, args, options):
+    from paths import write_paths, write_stats, write_event_paths
+    from utils import ChunkWriter
+    mode = args[0].strip().lower() if args else "list"
+    if mode not in ("list", "stats", "event") or (mode == "event" and len(args) < 2):
+        usage_error("paths")
+    with ChunkWriter(sys.stdout) as out:
+        if mode == "list":
+            write_paths(game_tree, out)
+        elif mode == "stats":
+            write_stats(game_tree, out)
+        else:
+            write_event_paths(game_tree, args[1], out)
+
+def stats_command(game_tree, args, options):
+    from columns import write_summary
+    from utils import ChunkWriter
+    try:
+        with ChunkWriter(sys.stdout) as out:
+            write_summary(game_tree, out)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+def diff_command(game_tree, args, options):
+    from diff_game import diff_trees, write_diff
+    from utils import ChunkWriter
+    if not args:
+        print("diff requires a second json file!")
+        sys.exit(1)
+    changes = diff_trees(game_tree, load(options, args[0]))
+    if not changes:
+        print("No differences")
+    with ChunkWriter(sys.stdout) as out:
+        write_diff(changes, out)
+
+def interactive_command(game_tree, args, options):
+    # what runs when no command is given
+    response = input("1 to display file, 2 to edit: ")
+    if int(response) == 1:
+        from print_game import print_tree
+        print_tree(game_tree)
+    elif int(response) == 2:
+        edit_session(game_tree, options, input("Input filename to save to: "))
+
+COMMANDS = {
+    "display": display_command,
+    "edit": edit_command,
+    "save": save_command,
+    "query": query_command,
+    "paths": paths_command,
+    "stats": stats_command,
+    "diff": diff_command,
+    "apply": apply_command,
+    "validate": validate_command,
+    "export-site": export_site_command,
+    "serve": serve_command,
+    "watch": watch_command,
+    "interactive": interactive_command,
+}
+
+# query's usage lives with query, which is only imported to print it
+USAGES = {
+    "display": "[text|dot|markdown|json] [output_file]",
+    "edit": "output_json",
+    "save": "output_json [pretty|minified|gzip|xz|sqlite]",
+    "query": None,
+    "paths": "[list|stats|event text]",
+    "stats": "",
+    "diff": "other_json",
+    "apply": "ops_file|- output_json",
+    "validate": "[jobs]",
+    "export-site": "output_dir [jobs]",
+    "serve": "[port]",
+    "watch": "[output_file]",
+}
+
+NO_TREE = {"watch"}
+
+def usage():
+    from query import QUERY_USAGE
+    commands = [QUERY_USAGE if command == "query" else f"{command} {arguments}".rstrip() for command, arguments in USAGES.items()]
+    return f"({'|'.join(commands)})"
@@ -0,0 +1,78 @@
+from types import MappingProxyType
+from traverse import walk
+
+# Each route's effective deaths are its own deaths added onto its parent's
+# totals. A route's totals are worked out once from its parent's and cached
+# on the route; routes without deaths share their parent's mapping outright,
+# and each entry keeps a link to the parent entry instead of copying days.
+# An entry's days are joined only when read, and only that entry keeps the
+# result: the entries above it are walked, not filled in, so reading the
+# deepest route of a long chain keeps one tuple rather than one per level.
+# An entry that adds no days shares the tuple it would have copied.
+
+EMPTY = MappingProxyType({})
+
+class CumulativeDeath:
+    __slots__ = ("id", "count", "death", "parent", "_days")
+
+    def __init__(self, death, parent):
+        self.id = death.id
+        self.death = death
+        self.parent = parent
+        self.count = death.count + parent.count if parent else death.count
+        self._days = None
+
+    @property
+    def days(self):
+        if self._days is None:
+            parts = []
+            entry = self
+            while entry is not None and entry._days is None:
+                if entry.death.days:
+                    parts.append(entry.death.days)
+                entry = entry.parent
+            days = entry._days if entry else ()
+            if len(parts) == 1 and not days:
+                days = parts[0]
+            elif parts:
+                days = days + tuple(day for part in reversed(parts) for day in part)
+            self._days = days
+        return self._days
+
+    def __repr__(self):
+        return f"CumulativeDeath{{id: {self.id}, count: {self.count}, days: {list(self.days)}}}"
+
+def extend_deaths(parent_totals, deaths):
+    if not deaths:
+        return parent_totals
+    totals = dict(parent_totals)
+    for death in deaths.values():
+        totals[death.id] = CumulativeDeath(death, parent_totals.get(death.id))
+    return MappingProxyType(totals)
+
+def cumulative_deaths(route):
+    path = []
+    while route is not None and route.death_totals is None:
+        path.append(route)
+        route = route.parent
+    totals = route.death_totals if route else EMPTY
+    for route in reversed(path):
+        totals = extend_deaths(totals, route.deaths)
+        route.death_totals = totals
+    return totals
+
+def loaded_child_routes(route):
+    if not route.branch:
+        return ()
+    return [choice.route for choice in route.branch.choices if choice.is_loaded() and choice.route]
+
+def invalidate_deaths(route):
+    # totals are always filled in from the root down, so a route without
+    # cached totals has none cached below it either
+    def children(node):
+        if node.death_totals is None:
+            return ()
+        node.death_totals = None
+        return loaded_child_routes(node)
+
+    walk(route, children = children)
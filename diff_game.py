@@ -0,0 +1,123 @@
+from collections import Counter
+from merkle import subtree_hash, choice_route_hash
+
+# Compares two trees route by route, only descending where subtree hashes
+# differ, so the work follows the size of the change rather than the tree.
+# Base routes are matched by name and choices by direction (in order, when
+# a branch repeats a direction). Changes come out as (sign, path, text):
+# "+" added, "-" removed, "~" changed.
+
+def format_days(days):
+    return ", ".join(str(day) for day in days)
+
+def match_choices(old_choices, new_choices):
+    seen = Counter()
+    keyed = {}
+    for choice in old_choices:
+        seen[choice.direction] += 1
+        keyed[(choice.direction, seen[choice.direction])] = [choice, None]
+    seen.clear()
+    for choice in new_choices:
+        seen[choice.direction] += 1
+        keyed.setdefault((choice.direction, seen[choice.direction]), [None, None])[1] = choice
+    return keyed.values()
+
+def diff_fields(old, new, path, changes):
+    if old.name != new.name:
+        changes.append(("~", path, f"title \"{old.name}\" -> \"{new.name}\""))
+
+    for id in old.deaths:
+        if id not in new.deaths:
+            death = old.deaths[id]
+            changes.append(("-", path, f"death {id} x{death.count} on day(s) {format_days(death.days)}"))
+    for death in new.deaths.values():
+        old_death = old.deaths.get(death.id)
+        if old_death is None:
+            changes.append(("+", path, f"death {death.id} x{death.count} on day(s) {format_days(death.days)}"))
+        elif old_death.count != death.count or old_death.days != death.days:
+            changes.append(("~", path, f"death {death.id} x{old_death.count} on day(s) {format_days(old_death.days)} -> x{death.count} on day(s) {format_days(death.days)}"))
+
+    old_events = Counter((event.name, event.days) for event in old.events)
+    new_events = Counter((event.name, event.days) for event in new.events)
+    for (name, days), count in (old_events - new_events).items():
+        for i in range(count):
+            changes.append(("-", path, f"event on day(s) {format_days(days)}: {name}"))
+    for (name, days), count in (new_events - old_events).items():
+        for i in range(count):
+            changes.append(("+", path, f"event on day(s) {format_days(days)}: {name}"))
+
+def diff_routes(old_route, new_route, path, changes):
+    stack = [(old_route, new_route, path)]
+    while stack:
+        old, new, path = stack.pop()
+        if subtree_hash(old) == subtree_hash(new):
+            continue
+        diff_fields(old, new, path, changes)
+
+        old_branch = old.branch
+        new_branch = new.branch
+        if old_branch is None and new_branch is None:
+            continue
+        if old_branch is None:
+            changes.append(("+", path, f"branch \"{new_branch.name}\" on day {new_branch.day} with {len(new_branch.choices)} choice(s)"))
+            continue
+        if new_branch is None:
+            changes.append(("-", path, f"branch \"{old_branch.name}\" on day {old_branch.day} with {len(old_branch.choices)} choice(s)"))
+            continue
+        if old_branch.name != new_branch.name or old_branch.day != new_branch.day:
+            changes.append(("~", path, f"branch \"{old_branch.name}\" on day {old_branch.day} -> \"{new_branch.name}\" on day {new_branch.day}"))
+
+        children = []
+        for old_choice, new_choice in match_choices(old_branch.choices, new_branch.choices):
+            if new_choice is None:
+                changes.append(("-", path, f"choice {old_choice.direction} \"{old_choice.name}\""))
+                continue
+            if old_choice is None:
+                changes.append(("+", path, f"choice {new_choice.direction} \"{new_choice.name}\""))
+                continue
+            if old_choice.name != new_choice.name:
+                changes.append(("~", path, f"choice {new_choice.direction} \"{old_choice.name}\" -> \"{new_choice.name}\""))
+            if choice_route_hash(old_choice) == choice_route_hash(new_choice):
+                continue
+            child_path = f"{path} > {new_choice.direction}"
+            if new_choice.route is None:
+                changes.append(("-", child_path, f"route \"{old_choice.route.name}\""))
+            elif old_choice.route is None:
+                changes.append(("+", child_path, f"route \"{new_choice.route.name}\""))
+            else:
+                children.append((old_choice.route, new_choice.route, child_path))
+        stack.extend(reversed(children))
+
+def diff_trees(old_tree, new_tree):
+    changes = []
+    for name in old_tree.names:
+        if name not in new_tree.names:
+            changes.append(("-", "names", name))
+    for name in new_tree.names.values():
+        old_name = old_tree.names.get(name.id)
+        if old_name is None:
+            changes.append(("+", "names", name.id))
+        elif old_name.as_dict() != name.as_dict():
+            changes.append(("~", "names", name.id))
+
+    # base routes left unmatched by name are paired up in order, which is
+    # what a renamed base route looks like
+    removed = [route for key, route in old_tree.base_routes.items() if key not in new_tree.base_routes]
+    added = []
+    for key, route in new_tree.base_routes.items():
+        old_route = old_tree.base_routes.get(key)
+        if old_route is None:
+            added.append(route)
+        else:
+            diff_routes(old_route, route, key, changes)
+    for old_route, route in zip(removed, added):
+        diff_routes(old_route, route, route.name, changes)
+    for route in removed[len(added) : ]:
+        changes.append(("-", route.name, f"route \"{route.name}\""))
+    for route in added[len(removed) : ]:
+        changes.append(("+", route.name, f"route \"{route.name}\""))
+    return changes
+
+def write_diff(changes, out):
+    for sign, path, text in changes:
+        out.write(f"{sign} {path}: {text}\n")
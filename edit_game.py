@@ -1,6 +1,6 @@
-from utils import check_name_id_exists, sort_by_days
-from parse_game import Name, Death, Event, Choice, Branch, Route, Tree, save_tree
-import sys
+from utils import check_name_id_exists
+from edit_ops import OpError, apply_op, keep_history, route_path, death_record, event_record
+from traverse import walk
 
 def get_int(prompt):
     num = None
@@ -51,13 +51,29 @@ def edit_death(game_tree, death):
             case 'x':
                 return
 
+def try_op(game_tree, op):
+    # a rejected op is reported and the session carries on; returns whether it applied
+    try:
+        return True, apply_op(game_tree, op)
+    except OpError as e:
+        print(e)
+        return False, None
+
+def edit_route_op(game_tree, route, op, **fields):
+    try_op(game_tree, {"op": op, "path": route_path(game_tree, route), **fields})
+
+def undo_redo(game_tree, kind):
+    applied, op = try_op(game_tree, {"op": kind})
+    if applied:
+        print(f"{'Undid' if kind == 'undo' else 'Redid'} {op['op']}")
+
 def edit_deaths(game_tree, route):
-    deaths = route.deaths
     while True:
+        deaths = route.deaths
         print(f"\nDeaths in route \"{route.name}\":")
         for key in deaths:
             death = deaths[key]
-            print(f"  ID: \"{death.id}\". Name: {game_tree.names[death.id].full}. Times died (additive): {death.count}. Days died on: {death.days}.")
+            print(f"  ID: \"{death.id}\". Name: {game_tree.names[death.id].full}. Times died (additive): {death.count}. Days died on: {list(death.days)}.")
         response = input("Edit (e) death, remove (r) death, add (a) death, or 'x' to exit: ")
         match response:
             case 'e':
@@ -65,14 +81,16 @@ def edit_deaths(game_tree, route):
                     print("No deaths to edit")
                     continue
                 response = get_from_set("ID to edit: ", deaths)
-                edit_death(game_tree, deaths[response])
+                death = deaths[response].copy()
+                edit_death(game_tree, death)
+                edit_route_op(game_tree, route, "set_death", id = response, death = death_record(death))
                 
             case 'r':
                 if len(deaths) == 0:
                     print("No deaths to remove")
                     continue
                 response = get_from_set("ID to remove: ", deaths)
-                del deaths[response]
+                edit_route_op(game_tree, route, "remove_death", id = response)
                 
             case 'a':
                 id = input("ID to insert: ").lower().strip()
@@ -87,17 +105,14 @@ def edit_deaths(game_tree, route):
                         days.append(int(day.strip()))
                     except ValueError:
                         pass
-                deaths[id] = Death(id, count, days)
-                deaths = {d.id : d for d in sort_by_days([d for d in deaths.values()])}
-                route.set_deaths(deaths)
+                edit_route_op(game_tree, route, "add_death", death = {"id": id, "count": count, "days": days})
                 
             case 'x':
-                route.deaths = deaths
                 return
     
 def edit_event(event):
     while True:
-        print(f"You are editing event on day(s) {event.days} with desc: {event.name}")
+        print(f"You are editing event on day(s) {list(event.days)} with desc: {event.name}")
         response = input("Edit days (d), edit desc (e) 'x' to exit: ")
         match response:
             case 'e':
@@ -119,12 +134,12 @@ def edit_event(event):
                 return
 
 def edit_events(game_tree, route):
-    events = route.events
     while True:
+        events = route.events
         print(f"\nEvents in route \"{route.name}\":")
         for i in range(len(events)):
             event = events[i]
-            print(f"  {i}: Day(s) the event occured on: {event.days}. Desc: \"{event.name}\".")
+            print(f"  {i}: Day(s) the event occured on: {list(event.days)}. Desc: \"{event.name}\".")
         response = input("Edit (e) event, remove (r) event, add (a) event, or 'x' to exit: ")
         match response:
             case 'e':
@@ -137,7 +152,9 @@ def edit_events(game_tree, route):
                         response = int(input("Index to edit: "))
                     except ValueError:
                         pass
-                edit_event(events[response])
+                event = events[response].copy()
+                edit_event(event)
+                edit_route_op(game_tree, route, "set_event", index = response, event = event_record(event))
                 
             case 'r':
                 if len(events) == 0:
@@ -149,7 +166,7 @@ def edit_events(game_tree, route):
                         response = int(input("Index to remove: "))
                     except ValueError:
                         pass
-                del events[response]
+                edit_route_op(game_tree, route, "remove_event", index = response)
                 
             case 'a':
                 name = input("Enter the event description: ")
@@ -160,12 +177,8 @@ def edit_events(game_tree, route):
                         days.append(int(day.strip()))
                     except ValueError:
                         pass
-                days = sorted(days)
-                event = Event(name, days)
-                events.append(event)
-                events = sort_by_days(events)
+                edit_route_op(game_tree, route, "add_event", event = {"name": name, "days": days})
             case 'x':
-                route.events = events
                 return
 
 def edit_branch(game_tree, route, depth):
@@ -179,16 +192,15 @@ def edit_branch(game_tree, route, depth):
             response = input("Edit branch choice (c), edit branch day (d), add new choice (a), edit/descend into choice (index), or 'x' to exit: ")
             match response:
                 case 'c':
-                    route.branch.name = input("Enter new choice name: ")
+                    name = input("Enter new choice name: ")
+                    edit_route_op(game_tree, route, "set_branch", name = name, day = route.branch.day)
                 case 'd':
                     day = get_int("Enter the day this branch occurs on: ")
-                    route.branch.day = day
+                    edit_route_op(game_tree, route, "set_branch", name = route.branch.name, day = day)
                 case 'a':
                     direction = input("Input direction: ").lower().strip()
                     label = input("Input choice label: ")
-                    choice = Choice(route.branch, direction, label)
-                    route_new = Route(route.branch, route.name + f" {direction.upper()} BRANCH")
-                    choice.set_route(route_new)
+                    edit_route_op(game_tree, route, "add_choice", direction = direction, name = label)
                 case 'x':
                     return
                 case _:
@@ -198,12 +210,11 @@ def edit_branch(game_tree, route, depth):
                         response2 = input("Edit label (e), desend (d), remove (r), or 'x' to exit: ")
                         if response2 == 'e':
                             label = input("Enter new label: ")
-                            choice.name = label
+                            edit_route_op(game_tree, route, "set_choice", index = index, name = label)
                         elif response2 == 'd':
-                            edit_recurse(game_tree, choice.route, depth + 1)
-                            return
+                            return choice.route
                         elif response2 == 'r':
-                            del choices[index]
+                            edit_route_op(game_tree, route, "remove_choice", index = index)
                         elif response2 == 'x':
                             continue
                     except ValueError:
@@ -216,32 +227,30 @@ def edit_branch(game_tree, route, depth):
                 case 'a':
                     name = input("Input branch choice: ")
                     day = int(input("Input day: "))
-                    branch = Branch(route, name, day)
                     num_choices = get_int("Input number of choices: ")
+                    choices = []
                     for i in range(num_choices):
                         direction = input("Input direction: ").lower().strip()
                         label = input("Input choice label: ")
-                        choice = Choice(branch, direction, label)
-                        route_new = Route(route, route.name + f" {direction.upper()} BRANCH")
-                        choice.set_route(route_new)
-                    route.set_branch(branch)
+                        choices.append({"direction": direction, "name": label})
+                    edit_route_op(game_tree, route, "add_branch", name = name, day = day, choices = choices)
                 case 'x':
                     return
 
-def edit_recurse(game_tree, route, depth = 0):
+def edit_route(game_tree, route, depth):
     while True:
         print(f"\nRoute title: \"{route.name}\" with depth {depth}")
         if len(route.deaths) > 0:
             print("Deaths:")
             for key in route.deaths:
                 death = route.deaths[key]
-                print(f"  Name: {game_tree.names[death.id].full}. Times died: {death.count}. Days died on: {death.days}.")
+                print(f"  Name: {game_tree.names[death.id].full}. Times died: {death.count}. Days died on: {list(death.days)}.")
         
         if len(route.events) > 0:
             print(f"There are {len(route.events)} events on this route occuring on day collections: ", end = "")
             for event in route.events[ : -1]:
-                print(event.days, end = ", ")
-            print(route.events[-1].days)
+                print(list(event.days), end = ", ")
+            print(list(route.events[-1].days))
         
         if route.branch:
             string = f"This route has a branch choice with title \"{route.branch.name}\", and options "
@@ -249,7 +258,7 @@ def edit_recurse(game_tree, route, depth = 0):
                 string += f"\"{choice.name}\" ({choice.direction}), "
             string += f"on day {route.branch.day}"
             print(string)
-        print("You may edit/add deaths (d), edit/add events (e), or edit/add a branch (b), change the title (t), or 'x' to return to the previous route")
+        print("You may edit/add deaths (d), edit/add events (e), or edit/add a branch (b), change the title (t), undo (u), redo (r), or 'x' to return to the previous route")
         response = input("Selection: ")
         match response:
             case 'd':
@@ -257,28 +266,49 @@ def edit_recurse(game_tree, route, depth = 0):
             case 'e':
                 edit_events(game_tree, route)
             case 'b':
-                edit_branch(game_tree, route, depth)
+                new_route = edit_branch(game_tree, route, depth)
+                if new_route:
+                    yield new_route, depth + 1
             case 't':
                 response = input("Input new route/chapter title: ")
-                route.name = response
+                edit_route_op(game_tree, route, "set_title", name = response)
+            case 'u':
+                undo_redo(game_tree, "undo")
+            case 'r':
+                undo_redo(game_tree, "redo")
             case 'x':
                 return
                 
             case 'ld' | 'rd' | 'td': #hidden for now, allows instant descent from route base
-                branch = route.branch
-                if not branch:
-                    continue
                 values = {"ld": "left", "rd": "right", "td": "top"}
-                for choice in branch.choices:
-                    if choice.direction == values[response]:
-                        new_route = choice.route
-                        break
+                new_route = game_tree.index.child(route, values[response])
                 if new_route:
-                    edit_recurse(game_tree, new_route, depth + 1)
+                    yield new_route, depth + 1
             case 's': #also hidden, save the file
-                save_tree(sys.argv[3], game_tree)
+                game_tree.checkpoint()
+
+def edit_recurse(game_tree, route, depth = 0):
+    # each route's menu is a generator that yields whichever child route the
+    # user descends into, and finishes when they return to the parent
+    walk((route, depth), children = lambda node: edit_route(game_tree, *node))
+
+def select_route(game_tree, title):
+    routes = game_tree.index.find_title(title)
+    if len(routes) <= 1:
+        return routes[0] if routes else None
+    for i in range(len(routes)):
+        print(f"  {i}: {' > '.join(game_tree.index.path(routes[i]))}")
+    response = -1
+    while response >= len(routes) or response < 0:
+        try:
+            response = int(input("Index to edit: "))
+        except ValueError:
+            pass
+    return routes[response]
 
-def edit_name(name):
+NAME_KEYS = {'f': "first", 'l': "last", 'u': "full", 'p': "position", 't': "title", 'w': "web_title"}
+
+def edit_name(game_tree, name):
     while True:
         print(f"\n{name.id}:")
         print(f"  first name: \"{name.first if name.first else "[UNKNOWN]"}\"")
@@ -307,19 +337,7 @@ def edit_name(name):
             case _:
                 continue
         text = input(f"Enter this character's {item}: ")
-        match response:
-            case 'f':
-                name.first = text
-            case 'l':
-                name.last = text
-            case 'u':
-                name.full = text
-            case 'p':
-                name.position = text
-            case 't':
-                name.title = text
-            case 'w':
-                name.web_title = text
+        try_op(game_tree, {"op": "set_name", "id": name.id, "field": NAME_KEYS[response], "value": text})
 
 
 def edit_names(game_tree):
@@ -332,12 +350,13 @@ def edit_names(game_tree):
             return
         elif response == 'a':
             response = input("Enter the new name id: ")
-            game_tree.names[response] = Name(id = response)
+            try_op(game_tree, {"op": "add_name", "id": response})
         else:
             name = game_tree.names[response]
-            edit_name(name)
+            edit_name(game_tree, name)
 
 def edit(game_tree):
+    keep_history(game_tree)
     while True:
         string = f"\nYou can edit {len(game_tree.base_routes)} base routes:\n"
         i = 1
@@ -346,7 +365,7 @@ def edit(game_tree):
             key = keys[i]
             route = game_tree.base_routes[key]
             string += f"  {i}: {route.name}\n"
-        string += "Select a number, 'n' to edit names, or 'x' to exit: "
+        string += "Select a number, 'n' to edit names, 'u' to undo, 'r' to redo, or 'x' to exit: "
         response = input(string)
         try:
             response = int(response)
@@ -354,6 +373,14 @@ def edit(game_tree):
         except ValueError:
             if response == 'n':
                 edit_names(game_tree)
+            elif response == 'u':
+                undo_redo(game_tree, "undo")
+            elif response == 'r':
+                undo_redo(game_tree, "redo")
+            elif response == 'g': #hidden, jump straight to a route by title
+                route = select_route(game_tree, input("Route title: "))
+                if route:
+                    edit_recurse(game_tree, route, len(game_tree.index.path(route)) - 1)
             else:
                 print("Saving file and exiting")
                 return
@@ -0,0 +1,369 @@
+import json
+from collections import deque
+from parse_game import Name, Death, Event, Choice, Branch, Route
+from cumulative import invalidate_deaths
+
+# Every change the editor makes goes through apply_op as a small dict, so
+# it can be journaled, replayed or applied in bulk. An op names what it
+# does in "op" and, for route edits, the route in "path": the position (or
+# key) of its base route followed by the index of each choice taken from
+# there.
+#
+# Death and event records are replaced rather than edited in place, since
+# a shared load can put one record on many routes. The lists holding them
+# are copied first only while a shared load or an undo version holds them
+# too, so with neither an op costs a binary search, and with undo one copy
+# of the edited route's list.
+#
+# A path step may also be a choice's direction instead of its index, which
+# is looked up through the tree's index.
+
+class OpError(ValueError):
+    pass
+
+NAME_FIELDS = ("full", "first", "last", "title", "position", "web_title")
+
+def route_path(game_tree, route):
+    indexes = []
+    while route.parent is not None:
+        parent = route.parent
+        indexes.append(next(i for i, choice in enumerate(parent.branch.choices) if choice.is_loaded() and choice.route is route))
+        route = parent
+    # base routes by position, their keys go stale when one is retitled
+    position = next(i for i, base_route in enumerate(game_tree.base_routes.values()) if base_route is route)
+    return [position] + indexes[ : : -1]
+
+def find_route(game_tree, path):
+    if not path:
+        raise OpError("Empty route path")
+    if isinstance(path[0], int) and 0 <= path[0] < len(game_tree.base_routes):
+        route = list(game_tree.base_routes.values())[path[0]]
+    elif isinstance(path[0], str) and path[0] in game_tree.base_routes:
+        route = game_tree.base_routes[path[0]]
+    else:
+        raise OpError(f"No base route {path[0]!r}")
+    for step in path[1 : ]:
+        if isinstance(step, str):
+            child = game_tree.index.child(route, step.lower())
+            if child is None:
+                raise OpError(f"\"{route.name}\" has no {step} choice")
+        else:
+            child = find_choice(route, step).route
+            if child is None:
+                raise OpError(f"Choice {step} of \"{route.name}\" leads nowhere")
+        route = child
+    return route
+
+def find_choice(route, index):
+    if not route.branch or not isinstance(index, int) or not 0 <= index < len(route.branch.choices):
+        raise OpError(f"\"{route.name}\" has no choice {index}")
+    return route.branch.choices[index]
+
+def death_record(death):
+    return {"id": death.id, "count": death.count, "days": list(death.days)}
+
+def event_record(event):
+    return {"name": event.name, "days": list(event.days)}
+
+def check_days(days):
+    if not isinstance(days, list) or not all(type(day) is int for day in days):
+        raise OpError(f"Days must be a list of whole numbers, not {days!r}")
+    return sorted(days)
+
+def character_id(id):
+    # ids are looked up lowercased, the way Name and Death store them
+    if not isinstance(id, str):
+        raise OpError(f"Character id must be text, not {id!r}")
+    return id.lower()
+
+def make_death(game_tree, record):
+    id = character_id(record["id"])
+    if id not in game_tree.names:
+        raise OpError(f"Unknown character id {record['id']}")
+    if type(record["count"]) is not int:
+        raise OpError(f"Death count must be a whole number, not {record['count']!r}")
+    return Death(id, record["count"], check_days(record["days"]))
+
+def make_event(record):
+    return Event(record["name"], check_days(record["days"]))
+
+def deaths_changed(game_tree, route):
+    invalidate_deaths(route)
+    game_tree.route_edited(route)
+
+def set_title(game_tree, route, op):
+    old_name = route.name
+    route.name = op["name"]
+    game_tree.route_renamed(route, old_name)
+
+def add_death(game_tree, route, op):
+    route.own_deaths().add(make_death(game_tree, op["death"]))
+    deaths_changed(game_tree, route)
+
+def set_death(game_tree, route, op):
+    id = character_id(op["id"])
+    if id not in route.deaths:
+        raise OpError(f"\"{route.name}\" has no death {op['id']}")
+    death = make_death(game_tree, op["death"])
+    deaths = route.own_deaths()
+    del deaths[id]
+    deaths.add(death)
+    deaths_changed(game_tree, route)
+
+def remove_death(game_tree, route, op):
+    id = character_id(op["id"])
+    if id not in route.deaths:
+        raise OpError(f"\"{route.name}\" has no death {op['id']}")
+    del route.own_deaths()[id]
+    deaths_changed(game_tree, route)
+
+def check_event_index(route, index):
+    if not isinstance(index, int) or not 0 <= index < len(route.events):
+        raise OpError(f"\"{route.name}\" has no event {index}")
+
+def add_event(game_tree, route, op):
+    route.own_events().add(make_event(op["event"]))
+    game_tree.route_edited(route)
+
+def set_event(game_tree, route, op):
+    check_event_index(route, op["index"])
+    event = make_event(op["event"])
+    events = route.own_events()
+    del events[op["index"]]
+    events.add(event)
+    game_tree.route_edited(route)
+
+def remove_event(game_tree, route, op):
+    check_event_index(route, op["index"])
+    del route.own_events()[op["index"]]
+    game_tree.route_edited(route)
+
+def choice_fields(choice_op):
+    # checked before anything is built, so a bad choice leaves the route as it was
+    direction, name = choice_op["direction"], choice_op["name"]
+    if not isinstance(direction, str):
+        raise OpError(f"Choice direction must be text, not {direction!r}")
+    if name is not None and not isinstance(name, str):
+        raise OpError(f"Choice name must be text, not {name!r}")
+    return direction.lower().strip(), name
+
+def new_choice(branch, direction, name):
+    route = branch.parent
+    choice = Choice(branch, direction, name)
+    choice.set_route(Route(route, route.name + f" {choice.direction.upper()} BRANCH"))
+    return choice
+
+def add_branch(game_tree, route, op):
+    if route.branch:
+        raise OpError(f"\"{route.name}\" already has a branch")
+    choices = [choice_fields(choice_op) for choice_op in op["choices"]]
+    branch = Branch(route, op["name"], op["day"])
+    for direction, name in choices:
+        new_choice(branch, direction, name)
+    route.set_branch(branch)
+    for choice in branch.choices:
+        game_tree.route_added(choice.route, choice)
+    game_tree.route_edited(route)
+
+def set_branch(game_tree, route, op):
+    if not route.branch:
+        raise OpError(f"\"{route.name}\" has no branch")
+    route.branch.name, route.branch.day = op["name"], op["day"]
+    game_tree.route_edited(route)
+
+def add_choice(game_tree, route, op):
+    if not route.branch:
+        raise OpError(f"\"{route.name}\" has no branch")
+    choice = new_choice(route.branch, *choice_fields(op))
+    game_tree.route_added(choice.route, choice)
+    game_tree.route_edited(route)
+
+def set_choice(game_tree, route, op):
+    find_choice(route, op["index"]).name = op["name"]
+    game_tree.route_edited(route)
+
+def remove_choice(game_tree, route, op):
+    choice = find_choice(route, op["index"])
+    if choice.route:
+        game_tree.route_removed(choice.route)
+    del route.branch.choices[op["index"]]
+    game_tree.route_edited(route)
+
+def add_name(game_tree, op):
+    id = character_id(op["id"])
+    if id in game_tree.names:
+        raise OpError(f"Name {op['id']} already exists")
+    game_tree.names[id] = Name(id = id)
+
+def set_name(game_tree, op):
+    id = character_id(op["id"])
+    if id not in game_tree.names:
+        raise OpError(f"Unknown character id {op['id']}")
+    if op["field"] not in NAME_FIELDS:
+        raise OpError(f"Unknown name field {op['field']}")
+    setattr(game_tree.names[id], op["field"], op["value"])
+
+ROUTE_OPS = {
+    "set_title": set_title,
+    "add_death": add_death,
+    "set_death": set_death,
+    "remove_death": remove_death,
+    "add_event": add_event,
+    "set_event": set_event,
+    "remove_event": remove_event,
+    "add_branch": add_branch,
+    "set_branch": set_branch,
+    "add_choice": add_choice,
+    "set_choice": set_choice,
+    "remove_choice": remove_choice,
+}
+
+NAME_OPS = {
+    "add_name": add_name,
+    "set_name": set_name,
+}
+
+# Undo keeps versions rather than copies. Taking a version marks the
+# route's death and event lists shared, so the next op on the route puts
+# new ones on it instead of changing them, and a version of a route is just
+# what its fields point at: the lists, the branch with its name and day, and
+# the branch's choices with their names. Taking one costs the same however
+# big the tree or the route's subtree is, and stepping back puts those same
+# objects back, with any subtree that had been cut off still hanging from
+# its choice. Name versions are the fields' values.
+
+UNDO_LIMIT = 1000
+
+def route_version(route):
+    route.deaths.shared = route.events.shared = True
+    branch = route.branch
+    if branch is None:
+        return (route.name, route.deaths, route.events, None)
+    return (route.name, route.deaths, route.events, (branch, branch.name, branch.day, list(branch.choices), [choice.name for choice in branch.choices]))
+
+def restore_route(game_tree, route, version):
+    name, deaths, events, branch_version = version
+    old_name = route.name
+    old_choices = route.branch.choices if route.branch else []
+    if branch_version is None:
+        route.branch = None
+        choices = []
+    else:
+        branch, branch_name, branch_day, choices, choice_names = branch_version
+        branch.name, branch.day = branch_name, branch_day
+        branch.choices = list(choices)
+        for choice, choice_name in zip(choices, choice_names):
+            choice.name = choice_name
+        route.branch = branch
+    route.name, route.deaths, route.events = name, deaths, events
+
+    for choice in old_choices:
+        if choice not in choices and choice.route:
+            game_tree.route_removed(choice.route)
+    for choice in choices:
+        if choice not in old_choices and choice.route:
+            game_tree.route_added(choice.route, choice)
+    if name != old_name:
+        game_tree.route_renamed(route, old_name)
+    deaths_changed(game_tree, route)
+
+def name_version(game_tree, id):
+    name = game_tree.names.get(id)
+    return tuple(getattr(name, field) for field in NAME_FIELDS) if name else None
+
+def restore_name(game_tree, id, version):
+    if version is None:
+        del game_tree.names[id]
+        return
+    if id not in game_tree.names:
+        game_tree.names[id] = Name(id = id)
+    for field, value in zip(NAME_FIELDS, version):
+        setattr(game_tree.names[id], field, value)
+
+RESTORE = {"route": restore_route, "name": restore_name}
+
+class History:
+    __slots__ = ("undo", "redo")
+
+    def __init__(self, limit = UNDO_LIMIT):
+        # entries are (kind, route or name id, version before, version after, op)
+        self.undo = deque(maxlen = limit)
+        self.redo = []
+
+    def record(self, entry):
+        self.undo.append(entry)
+        self.redo.clear()
+
+def keep_history(game_tree):
+    if game_tree.history is None:
+        game_tree.history = History()
+    return game_tree.history
+
+def step_history(game_tree, undo):
+    history = game_tree.history
+    source, target = (history.undo, history.redo) if undo else (history.redo, history.undo)
+    if not source:
+        raise OpError(f"Nothing to {'undo' if undo else 'redo'}")
+    entry = source.pop()
+    kind, target_object, before, after, op = entry
+    RESTORE[kind](game_tree, target_object, before if undo else after)
+    target.append(entry)
+    return op
+
+def undo_op(game_tree, op):
+    return step_history(game_tree, True)
+
+def redo_op(game_tree, op):
+    return step_history(game_tree, False)
+
+HISTORY_OPS = {
+    "undo": undo_op,
+    "redo": redo_op,
+}
+
+def apply_op(game_tree, op, notify = True):
+    # returns the op an undo or redo stepped over
+    history = game_tree.history
+    result = None
+    try:
+        kind = op["op"]
+        if kind in ROUTE_OPS:
+            route = find_route(game_tree, op["path"])
+            before = route_version(route) if history else None
+            ROUTE_OPS[kind](game_tree, route, op)
+            if history:
+                history.record(("route", route, before, route_version(route), op))
+        elif kind in NAME_OPS:
+            id = character_id(op["id"])
+            before = name_version(game_tree, id) if history else None
+            NAME_OPS[kind](game_tree, op)
+            if history:
+                history.record(("name", id, before, name_version(game_tree, id), op))
+        elif kind in HISTORY_OPS:
+            if history is None:
+                raise OpError(f"No edit history to {kind}")
+            result = HISTORY_OPS[kind](game_tree, op)
+        else:
+            raise OpError(f"Unknown op {kind!r}")
+    except (KeyError, TypeError, AttributeError) as e:
+        raise OpError(f"Malformed op {op!r}: {e!r}")
+    if notify:
+        game_tree.op_applied(op)
+    return result
+
+def apply_ops(game_tree, lines):
+    # one op per line, blank lines and # comments skipped; a rejected op is
+    # reported with its line number and the rest still go ahead
+    applied = 0
+    errors = []
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            apply_op(game_tree, json.loads(line))
+        except ValueError as e:
+            errors.append((line_no, str(e)))
+            continue
+        applied += 1
+    return applied, errors
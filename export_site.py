@@ -0,0 +1,174 @@
+import html
+import json
+import multiprocessing
+import os
+from cumulative import cumulative_deaths
+from edit_ops import find_route
+from merkle import digest
+
+# One HTML page per route, plus index.html listing the base routes. Pages are
+# named by route path (base route position, then choice indexes) and written
+# by a pool of forked workers sharing the parent's tree, the way validate
+# does it.
+#
+# manifest.json keeps a key for every page written, a hash of everything the
+# page shows: the route's own fields, its branch with each choice's label
+# and child title, its parent's title, and the death totals it inherits,
+# carried down as a hash chained through every ancestor route with deaths.
+# A rebuild works out the keys in one pass without rendering and only hands
+# the pages whose key changed to the workers, so an edit re-renders its own
+# page, the pages linking to it and, for a death change, the pages below it.
+# A change to the names, which any page may show, re-renders everything.
+
+MANIFEST = "manifest.json"
+PAGE_VERSION = 1 #part of every key, bump it when the page layout changes
+PAGES_PER_TASK = 64
+
+worker_tree = None #the tree forked workers render
+worker_directory = None
+
+def page_name(path):
+    return "route-" + "-".join(str(step) for step in path) + ".html"
+
+def plan_pages(game_tree):
+    # (path, key) for every route, in preorder
+    pages = []
+    for position, base_route in enumerate(game_tree.base_routes.values()):
+        stack = [(base_route, (position,), b"")]
+        while stack:
+            route, path, parent_state = stack.pop()
+            deaths = [[death.id, death.count, list(death.days)] for death in route.deaths.values()]
+            state = digest(b"deaths", deaths, [parent_state]) if deaths else parent_state
+            events = [[event.name, list(event.days)] for event in route.events]
+            branch = None
+            children = []
+            if route.branch:
+                choices = []
+                for i, choice in enumerate(route.branch.choices):
+                    child = choice.route
+                    choices.append([choice.direction, choice.name, child.name if child else None])
+                    if child:
+                        children.append((child, path + (i,), state))
+                branch = [route.branch.name, route.branch.day, choices]
+            fields = [PAGE_VERSION, list(path), route.name, route.parent.name if route.parent else None, events, branch]
+            pages.append((path, digest(b"page", fields, [state]).hex()))
+            stack.extend(reversed(children))
+    return pages
+
+def names_key(game_tree):
+    return digest(b"names", [name.as_dict() for name in game_tree.names.values()], []).hex()
+
+def index_key(game_tree):
+    return digest(b"index", [PAGE_VERSION, [route.name for route in game_tree.base_routes.values()]], []).hex()
+
+def days_text(days):
+    return ", ".join(str(day) for day in days) if days else "unknown"
+
+def name_text(names, id):
+    name = names.get(id)
+    if name is None or not name.full:
+        return html.escape(id)
+    text = html.escape(name.full)
+    if name.web_title:
+        text += f" <small>({html.escape(name.web_title)})</small>"
+    return text
+
+def page_start(title):
+    return f"<!DOCTYPE html>\n<html>\n<head><meta charset=\"utf-8\"><title>{html.escape(title)}</title></head>\n<body>\n"
+
+def render_page(game_tree, route, path):
+    escape = html.escape
+    parts = [page_start(route.name or "[UNKNOWN]")]
+    links = ["<a href=\"index.html\">All routes</a>"]
+    if route.parent is not None:
+        links.append(f"<a href=\"{page_name(path[ : -1])}\">Up: {escape(route.parent.name or '[UNKNOWN]')}</a>")
+    parts.append(f"<p>{' | '.join(links)}</p>\n<h1>{escape(route.name or '[UNKNOWN]')}</h1>\n")
+    deaths = cumulative_deaths(route)
+    if deaths:
+        parts.append("<h2>Deaths</h2>\n<ul>\n")
+        for death in deaths.values():
+            parts.append(f"<li>{name_text(game_tree.names, death.id)} died {death.count} time(s) on day(s) {days_text(death.days)}</li>\n")
+        parts.append("</ul>\n")
+    if route.events:
+        parts.append("<h2>Events</h2>\n<ul>\n")
+        for event in route.events:
+            parts.append(f"<li>Day {days_text(event.days)}: {escape(event.name or '[UNKNOWN]')}</li>\n")
+        parts.append("</ul>\n")
+    branch = route.branch
+    if branch:
+        parts.append(f"<h2>{escape(branch.name or '[UNKNOWN]')} (day {branch.day})</h2>\n<ul>\n")
+        for i, choice in enumerate(branch.choices):
+            label = escape(choice.name or "[UNKNOWN]")
+            if choice.route:
+                label = f"<a href=\"{page_name(path + (i,))}\">{label}</a>: {escape(choice.route.name or '[UNKNOWN]')}"
+            parts.append(f"<li>{escape(choice.direction)}: {label}</li>\n")
+        parts.append("</ul>\n")
+    parts.append("</body>\n</html>\n")
+    return "".join(parts)
+
+def render_index(game_tree):
+    parts = [page_start("All routes"), "<h1>All routes</h1>\n<ul>\n"]
+    for position, route in enumerate(game_tree.base_routes.values()):
+        parts.append(f"<li><a href=\"{page_name((position,))}\">{html.escape(route.name or '[UNKNOWN]')}</a></li>\n")
+    parts.append("</ul>\n</body>\n</html>\n")
+    return "".join(parts)
+
+def write_page(directory, filename, text):
+    path = os.path.join(directory, filename)
+    with open(path + ".tmp", "w", encoding = "utf-8") as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
+
+def render_pages(paths):
+    game_tree = worker_tree
+    for path in paths:
+        write_page(worker_directory, page_name(path), render_page(game_tree, find_route(game_tree, list(path)), path))
+    return len(paths)
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding = "utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {"names": None, "pages": {}}
+    return manifest
+
+def export_site(game_tree, directory, jobs = None, force = False):
+    # returns (pages rendered, pages in the site, stale pages removed)
+    global worker_tree, worker_directory
+    jobs = jobs or os.cpu_count() or 1
+    if "fork" not in multiprocessing.get_all_start_methods():
+        jobs = 1
+    os.makedirs(directory, exist_ok = True)
+    old = read_manifest(directory)
+    names = names_key(game_tree)
+    unchanged = {} if force or old["names"] != names else old["pages"]
+
+    pages = {page_name(path): (path, key) for path, key in plan_pages(game_tree)}
+    stale = [path for filename, (path, key) in pages.items() if unchanged.get(filename) != key or not os.path.exists(os.path.join(directory, filename))]
+    tasks = [stale[i : i + PAGES_PER_TASK] for i in range(0, len(stale), PAGES_PER_TASK)]
+    worker_tree, worker_directory = game_tree, directory
+    try:
+        if jobs > 1 and len(tasks) > 1:
+            with multiprocessing.get_context("fork").Pool(min(jobs, len(tasks))) as pool:
+                rendered = sum(pool.imap_unordered(render_pages, tasks))
+        else:
+            rendered = sum(render_pages(task) for task in tasks)
+    finally:
+        worker_tree = worker_directory = None
+
+    index = index_key(game_tree)
+    if unchanged.get("index.html") != index or not os.path.exists(os.path.join(directory, "index.html")):
+        write_page(directory, "index.html", render_index(game_tree))
+        rendered += 1
+    removed = 0
+    for filename in old["pages"]:
+        if filename not in pages and filename != "index.html" and os.path.exists(os.path.join(directory, filename)):
+            os.remove(os.path.join(directory, filename))
+            removed += 1
+
+    # written last, a run cut short leaves the old keys and redoes its pages
+    manifest = {"version": PAGE_VERSION, "names": names, "pages": {filename: key for filename, (path, key) in pages.items()}}
+    manifest["pages"]["index.html"] = index
+    write_page(directory, MANIFEST, json.dumps(manifest, indent = 2) + "\n")
+    return rendered, len(pages) + 1, removed
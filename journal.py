@@ -0,0 +1,212 @@
+import json
+import os
+import traceback
+from parse_game import load_game_data, save_tree, save_format
+from snapshot import source_digest
+from edit_ops import OpError, UNDO_LIMIT, apply_op, keep_history
+
+# An append-only log of the ops applied during an edit session, kept beside
+# the output file so an interrupted session can pick up where it stopped.
+# One JSON object per line:
+#   {"journal": 1, "base": path, "digest": hex}   first line, the file the ops start from
+#   {"seq": n, "op": {...}}                        one per op, fsynced as it is written
+#   {"compacted": n, "digest": hex}               the output now holds every op up to n
+#
+# Every COMPACT_EVERY ops the tree is written out in a forked child while
+# editing carries on. The child saves beside the output, appends the
+# compacted line, then renames over the output, so whichever of the header
+# or the last compacted line matches the files on disk says where to replay
+# from. Once the child is done the journal is rewritten starting from the
+# output. On exit the output is saved one last time and the journal removed.
+#
+# Undo and redo are journaled as ops of their own and replayed through the
+# edit history, which only knows the steps made since the journal's base.
+# One reaching back further is saved straight to the output instead.
+
+COMPACT_EVERY = 200
+
+def journal_path(filename):
+    return filename + ".journal"
+
+def write_line(fd, record):
+    os.write(fd, (json.dumps(record, separators = (",", ":")) + "\n").encode())
+
+def read_journal(filename):
+    # a line cut short by a crash is dropped along with anything after it
+    records = []
+    with open(filename, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+class Journal:
+    def __init__(self, output, sync = True):
+        self.output = output
+        self.path = journal_path(output)
+        self.format = save_format(output)
+        self.sync = sync
+        self.fd = None
+        self.seq = 0
+        self.ops = [] #(seq, op) since the journal's base
+        self.child = None
+        self.undo_depth = 0 #undo and redo steps replay can take
+        self.redo_depth = 0
+
+    def open(self, game_tree, filename):
+        # resumes any journal left behind and returns the tree to edit
+        resumed = self.replay(game_tree, filename) if os.path.exists(self.path) else None
+        if resumed is None:
+            keep_history(game_tree)
+            self.rewrite(os.path.abspath(filename), source_digest(filename).hex())
+        else:
+            game_tree = resumed
+        game_tree.add_listener(self)
+        return game_tree
+
+    def replay(self, game_tree, filename):
+        records = read_journal(self.path)
+        header = records[0] if records and records[0].get("journal") == 1 else None
+        if header is None:
+            return self.set_aside("is unreadable")
+        if header["base"] not in (os.path.abspath(filename), os.path.abspath(self.output)):
+            # left by a session on another file, which would replace this one
+            return self.set_aside(f"was started from {header['base']}, not {filename}")
+        base, digest, after = header["base"], header["digest"], 0
+        output_digest = source_digest(self.output).hex() if os.path.exists(self.output) else None
+        for record in records:
+            if "compacted" in record and record["digest"] == output_digest:
+                base, digest, after = os.path.abspath(self.output), output_digest, record["compacted"]
+        if not os.path.exists(base) or source_digest(base).hex() != digest:
+            return self.set_aside(f"starts from {base}, which has changed since")
+
+        if base != os.path.abspath(filename):
+            game_tree = load_game_data(base)
+        history = keep_history(game_tree)
+        self.ops = []
+        for record in records:
+            if "seq" not in record or record["seq"] <= after:
+                continue
+            try:
+                apply_op(game_tree, record["op"], notify = False)
+            except OpError as e:
+                print(f"Stopped resuming at edit {record['seq']}: {e}")
+                break
+            self.ops.append((record["seq"], record["op"]))
+        self.seq = self.ops[-1][0] if self.ops else after
+        self.undo_depth, self.redo_depth = len(history.undo), len(history.redo)
+        self.rewrite(base, digest)
+        if self.ops:
+            print(f"Resumed {len(self.ops)} unsaved edit(s) from {self.path}")
+        return game_tree
+
+    def set_aside(self, reason):
+        print(f"Journal {self.path} {reason}, moved to {self.path}.old")
+        os.replace(self.path, self.path + ".old")
+
+    def rewrite(self, base, digest):
+        # the journal is replaced whole, never edited in place
+        if self.fd is not None:
+            os.close(self.fd)
+        temp_path = self.path + ".tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            write_line(fd, {"journal": 1, "base": base, "digest": digest})
+            for seq, op in self.ops:
+                write_line(fd, {"seq": seq, "op": op})
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(temp_path, self.path)
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+
+    def replayable(self, kind):
+        if kind == "undo" or kind == "redo":
+            if not (self.undo_depth if kind == "undo" else self.redo_depth):
+                return False
+            step = 1 if kind == "redo" else -1
+            self.undo_depth += step
+            self.redo_depth -= step
+        else:
+            self.undo_depth = min(self.undo_depth + 1, UNDO_LIMIT)
+            self.redo_depth = 0
+        return True
+
+    def op_applied(self, game_tree, op):
+        if not self.replayable(op["op"]):
+            self.compact(game_tree)
+            return
+        self.seq += 1
+        self.ops.append((self.seq, op))
+        write_line(self.fd, {"seq": self.seq, "op": op})
+        if self.sync:
+            os.fsync(self.fd)
+        self.poll()
+        if self.child is None and len(self.ops) >= COMPACT_EVERY:
+            self.compact(game_tree, background = hasattr(os, "fork"))
+
+    def checkpoint(self, game_tree):
+        self.compact(game_tree)
+
+    def compact(self, game_tree, background = False):
+        self.wait()
+        seq = self.seq
+        if background:
+            pid = os.fork()
+            if pid:
+                self.child = (pid, seq)
+                return
+            # the child works on its copy of the tree and leaves without
+            # running any of the parent's cleanup
+            try:
+                self.write_output(game_tree, seq)
+            except BaseException:
+                traceback.print_exc()
+                os._exit(1)
+            os._exit(0)
+        self.write_output(game_tree, seq)
+        self.rebase(seq)
+
+    def write_output(self, game_tree, seq):
+        compact_path = self.output + ".compact"
+        save_tree(compact_path, game_tree, self.format)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        try:
+            write_line(fd, {"compacted": seq, "digest": source_digest(compact_path).hex()})
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(compact_path, self.output)
+
+    def rebase(self, seq):
+        self.ops = [(op_seq, op) for op_seq, op in self.ops if op_seq > seq]
+        # only counts steps replay is sure to have, any more are saved directly
+        self.undo_depth = self.redo_depth = 0
+        self.rewrite(os.path.abspath(self.output), source_digest(self.output).hex())
+
+    def poll(self, block = False):
+        if self.child is None:
+            return
+        pid, seq = self.child
+        done, status = os.waitpid(pid, 0 if block else os.WNOHANG)
+        if not done:
+            return
+        self.child = None
+        if os.waitstatus_to_exitcode(status) == 0:
+            self.rebase(seq)
+        else:
+            print(f"Background save to {self.output} failed, edits are still in {self.path}")
+
+    def wait(self):
+        self.poll(block = True)
+
+    def close(self, game_tree):
+        self.compact(game_tree)
+        game_tree.remove_listener(self)
+        os.close(self.fd)
+        self.fd = None
+        os.remove(self.path)
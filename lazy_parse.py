@@ -0,0 +1,171 @@
+import json
+import mmap
+import re
+from parse_game import RouteStub, Branch, Choice, Tree, parse_route_fields, parse_names, file_compression, open_game_file
+
+# Routes below a choice are left as byte offsets into the mapped file until
+# something reads them. Skipping over a subtree records where every nested
+# route ends, so each byte is scanned once however deep the tree goes.
+
+STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+TOKEN = re.compile(rb'(?:[^"\[\]{}]++|"(?!route"\s*:)[^"\\]*+(?:\\.[^"\\]*+)*+")*+(?:("route"\s*:)|([\[\]{}]))', re.S)
+WHITESPACE = re.compile(rb'[ \t\n\r]*')
+SCALAR_END = re.compile(rb'[,\]}\s]')
+OPEN_OBJECT = ord('{')
+OPEN_ARRAY = ord('[')
+
+class LazySource:
+    __slots__ = ("buf", "route_ends")
+    
+    def __init__(self, buf):
+        self.buf = buf
+        self.route_ends = {}
+
+class LazyRoute(RouteStub):
+    __slots__ = ("source", "start")
+    
+    def __init__(self, source, start, parent):
+        super().__init__(parent)
+        self.source = source
+        self.start = start
+
+    def materialize(self):
+        route, _ = parse_route_lazy(self.source, self.start, self.parent)
+        return route
+
+def skip_ws(buf, pos):
+    return WHITESPACE.match(buf, pos).end()
+
+def expect(buf, pos, char):
+    if buf[pos : pos + 1] != char:
+        raise ValueError(f"Expected {char.decode()} at offset {pos}")
+    return pos + 1
+
+def skip_value(source, pos):
+    buf = source.buf
+    first = buf[pos : pos + 1]
+    if first == b'"':
+        return STRING.match(buf, pos).end()
+    if first != b'[' and first != b'{':
+        match = SCALAR_END.search(buf, pos)
+        return match.start() if match else len(buf)
+    stack = []
+    route_next = False
+    for match in TOKEN.finditer(buf, pos):
+        if match.lastindex == 1:
+            route_next = True
+            continue
+        start = match.end() - 1
+        token = buf[start]
+        if token == OPEN_OBJECT:
+            stack.append(start if route_next else None)
+            route_next = False
+        elif token == OPEN_ARRAY:
+            stack.append(None)
+            route_next = False
+        else:
+            route_start = stack.pop()
+            if route_start is not None:
+                source.route_ends[route_start] = start + 1
+            if not stack:
+                return start + 1
+    raise ValueError(f"Unterminated value at offset {pos}")
+
+def skip_route(source, pos):
+    end = source.route_ends.get(pos)
+    if end is None:
+        end = skip_value(source, pos)
+        source.route_ends[pos] = end
+    return end
+
+def parse_fields(source, pos, handlers = {}):
+    buf = source.buf
+    fields = {}
+    pos = skip_ws(buf, expect(buf, skip_ws(buf, pos), b'{'))
+    if buf[pos : pos + 1] == b'}':
+        return fields, pos + 1
+    while True:
+        key_end = STRING.match(buf, pos).end()
+        key = json.loads(buf[pos : key_end])
+        pos = skip_ws(buf, expect(buf, skip_ws(buf, key_end), b':'))
+        if key in handlers:
+            end = handlers[key](pos)
+        else:
+            end = skip_value(source, pos)
+            fields[key] = json.loads(buf[pos : end])
+        pos = skip_ws(buf, end)
+        if buf[pos : pos + 1] == b'}':
+            return fields, pos + 1
+        pos = skip_ws(buf, expect(buf, pos, b','))
+
+def parse_items(source, pos, parse_item):
+    buf = source.buf
+    pos = skip_ws(buf, expect(buf, skip_ws(buf, pos), b'['))
+    if buf[pos : pos + 1] == b']':
+        return pos + 1
+    while True:
+        pos = skip_ws(buf, parse_item(pos))
+        if buf[pos : pos + 1] == b']':
+            return pos + 1
+        pos = skip_ws(buf, expect(buf, pos, b','))
+
+def parse_route_lazy(source, pos, parent_route):
+    branch_json = None
+    choices_json = []
+
+    def parse_choice_route(choice_pos):
+        choices_json[-1]["route"] = choice_pos
+        return skip_route(source, choice_pos)
+
+    def parse_choice(choice_pos):
+        choices_json.append({})
+        fields, end = parse_fields(source, choice_pos, {"route": parse_choice_route})
+        choices_json[-1].update(fields)
+        return end
+
+    def parse_branch(branch_pos):
+        nonlocal branch_json
+        branch_json, end = parse_fields(source, branch_pos, {"choices": lambda p: parse_items(source, p, parse_choice)})
+        return end
+
+    route_json, end = parse_fields(source, pos, {"branch": parse_branch})
+    route = parse_route_fields(parent_route, route_json)
+
+    if branch_json is not None:
+        branch = Branch(route, branch_json["name"], branch_json["day"])
+        for choice_json in choices_json:
+            choice = Choice(branch, choice_json["direction"], choice_json["name"])
+            if "route" in choice_json:
+                choice.set_route(LazyRoute(source, choice_json["route"], route))
+
+    return route, end
+
+def map_file(filename):
+    if file_compression(filename):
+        with open_game_file(filename, binary = True) as f:
+            return f.read()
+    with open(filename, "rb") as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        except ValueError: #empty files can't be mapped
+            return f.read()
+
+def load_lazy_buffer(buf):
+    source = LazySource(buf)
+    game_tree = Tree({})
+
+    def parse_base_route(route_pos):
+        base_route, end = parse_route_lazy(source, route_pos, None)
+        game_tree.base_routes[base_route.name] = base_route
+        return end
+
+    def parse_names_json(names_pos):
+        end = skip_value(source, names_pos)
+        game_tree.names = parse_names(json.loads(buf[names_pos : end]))
+        return end
+
+    parse_fields(source, 0, {"names": parse_names_json, "routes": lambda p: parse_items(source, p, parse_base_route)})
+    return game_tree
+
+def load_lazy(filename):
+    return load_lazy_buffer(map_file(filename))
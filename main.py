@@ -1,34 +1,45 @@
 import sys
-import json
-from parse_game import parse_game_data, save_tree
-from utils import check_name_id_exists, sort_by_days
-from edit_game import edit
-from print_game import print_tree
+from profiling import Profiler, parse_spec, phase
+from commands import COMMANDS, NO_TREE, load, usage
 
 if __name__ == "__main__":
+    lazy = "--lazy" in sys.argv
+    if lazy:
+        sys.argv.remove("--lazy")
+    cache = "--no-cache" not in sys.argv
+    if not cache:
+        sys.argv.remove("--no-cache")
+    share = "--share" in sys.argv
+    if share:
+        sys.argv.remove("--share")
+    profile = next((arg for arg in sys.argv if arg == "--profile" or arg.startswith("--profile=")), None)
+    if profile:
+        sys.argv.remove(profile)
+        try:
+            profiler = Profiler(**parse_spec(profile.partition("=")[2]))
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        profiler.start()
+    
     if len(sys.argv) < 2:
-        print(f"Usage: {sys.argv[0]} json_file [(display|edit output_json)]")
+        print(f"Usage: {sys.argv[0]} [--lazy] [--no-cache] [--share] [--profile[=table|json|pstats][,calls][,memory][:output_file]] json_file [{usage()}]")
         sys.exit(1)
     
-    with open(sys.argv[1]) as f:
-        data = json.load(f)
+    command = sys.argv[2].strip().lower() if len(sys.argv) >= 3 else "interactive"
+    if command not in COMMANDS:
+        print(f"Unknown command {command}\nUsage: {sys.argv[0]} json_file [{usage()}]")
+        sys.exit(1)
+    options = {"filename": sys.argv[1], "lazy": lazy, "cache": cache, "share": share}
     
-    game_tree = parse_game_data(data)
+    game_tree = None
+    if command not in NO_TREE:
+        with phase("load"):
+            game_tree = load(options, sys.argv[1])
+        if profile:
+            profiler.set_tree(game_tree)
     
-    if len(sys.argv) >= 3:
-        if sys.argv[2].strip().lower() == "display":
-            print_tree(game_tree)
-        elif sys.argv[2].strip().lower() == "edit":
-            if len(sys.argv) < 4:
-                print("edit on command line requires output file name!")
-                sys.exit(1)
-            edit(game_tree)
-            save_tree(sys.argv[3], game_tree)
-
-    else:
-        response = input("1 to display file, 2 to edit: ")
-        if int(response) == 1:
-            print_tree(game_tree)
-        elif int(response) == 2:
-            edit(game_tree)
-            save_tree(input("Input filename to save to: "), game_tree)
+    with phase(command):
+        COMMANDS[command](game_tree, sys.argv[3 : ], options)
+    if game_tree is not None and game_tree.store:
+        game_tree.store.close(game_tree)
@@ -0,0 +1,81 @@
+import hashlib
+import json
+from parse_game import Route, Branch, Choice
+from traverse import postorder
+
+# Every Route, Branch and Choice can carry a 16 byte blake2b hash of its
+# whole subtree in subtree_hash, so two subtrees with equal hashes can be
+# skipped without looking inside. A node's hash covers its own fields and
+# its children's hashes.
+#
+# Hashes are filled in for whole subtrees at a time, so a route without one
+# has no ancestor route with one either. Clearing after an edit can then
+# stop at the first ancestor that is already clear. Routes still behind a
+# snapshot stub report the hash stored in the snapshot.
+
+def digest(kind, fields, child_hashes):
+    data = json.dumps(fields, separators = (",", ":")).encode()
+    h = hashlib.blake2b(kind, digest_size = 16)
+    h.update(len(data).to_bytes(8, "little"))
+    h.update(data)
+    for child_hash in child_hashes:
+        h.update(child_hash)
+    return h.digest()
+
+def route_fields(route):
+    deaths = [[death.id, death.count, list(death.days)] for death in route.deaths.values()]
+    events = [[event.name, list(event.days)] for event in route.events]
+    return [route.name, deaths, events]
+
+def own_hash(node):
+    if isinstance(node, Route):
+        return digest(b"route", route_fields(node), [node.branch.subtree_hash] if node.branch else [])
+    if isinstance(node, Branch):
+        return digest(b"branch", [node.name, node.day], [choice.subtree_hash for choice in node.choices])
+    child_hash = choice_route_hash(node)
+    return digest(b"choice", [node.direction, node.name], [child_hash] if child_hash else [])
+
+def hash_children(node):
+    if node.subtree_hash is not None:
+        return ()
+    if isinstance(node, Choice):
+        stub = node.stub()
+        if stub is not None and stub.known_hash() is not None:
+            return ()
+    return node.children()
+
+def subtree_hash(node):
+    if node.subtree_hash is None:
+        for child, depth in postorder(node, hash_children):
+            if child.subtree_hash is None:
+                child.subtree_hash = own_hash(child)
+    return node.subtree_hash
+
+def choice_route_hash(choice):
+    # the hash of the route behind a choice, without loading it if a
+    # snapshot already knows it
+    stub = choice.stub()
+    if stub is not None:
+        known = stub.known_hash()
+        if known is not None:
+            return known
+    route = choice.route
+    return subtree_hash(route) if route else None
+
+def invalidate_hashes(route):
+    if route.branch:
+        route.branch.subtree_hash = None
+        for choice in route.branch.choices:
+            choice.subtree_hash = None
+    while route.parent is not None:
+        route.subtree_hash = None
+        parent = route.parent
+        if parent.branch:
+            parent.branch.subtree_hash = None
+            for choice in parent.branch.choices:
+                if choice.is_loaded() and choice.route is route:
+                    choice.subtree_hash = None
+        if parent.subtree_hash is None:
+            return
+        route = parent
+    route.subtree_hash = None
@@ -1,11 +1,25 @@
 import json
 from json import JSONEncoder
+from json.encoder import encode_basestring_ascii
+import gzip
+import io
+import lzma
+import os
 import sys
-from utils import sort_by_days
+from utils import ChunkWriter
+from sorted_days import SortedEvents, SortedDeaths
+from traverse import walk
+from tree_index import TreeIndex
+from profiling import phase
+
+# Every node class uses __slots__ and days are stored as tuples; ids and
+# directions are interned since the same few strings repeat across the tree.
 
 class Name:
+    __slots__ = ("id", "full", "first", "last", "title", "position", "web_title")
+    
     def __init__(self, id = None, full = None, first = None, last = None, title = None, position = None, web_title = None):
-        self.id = id.lower()
+        self.id = sys.intern(id.lower())
         self.full = full
         self.first = first
         self.last = last
@@ -32,87 +46,168 @@ class Name:
         return d
 
 class Death:
+    __slots__ = ("id", "count", "_days")
+    
     def __init__(self, id, count, days):
-        self.id = id.lower()
+        self.id = sys.intern(id.lower())
         self.count = count
         self.days = days
     
+    @property
+    def days(self):
+        return self._days
+    
+    @days.setter
+    def days(self, days):
+        self._days = tuple(days)
+    
+    def copy(self):
+        return Death(self.id, self.count, self._days)
+    
     def as_dict(self):
         d = {}
         if self.id:
             d["id"] = self.id
         d["count"] = self.count if self.count else -1
-        d["days"] = self.days if self.days else [-1]
+        d["days"] = list(self.days) if self.days else [-1]
         return d
     
     def __str__(self):
-        return f"Death{{id: {self.id}, count: {self.count}, days: {self.days}}}"
+        return f"Death{{id: {self.id}, count: {self.count}, days: {list(self.days)}}}"
 
     def __repr__(self):
         return self.__str__()
 
 class Event:
+    __slots__ = ("name", "_days")
+    
     def __init__(self, name, days):
         self.name = name
         self.days = days
     
+    @property
+    def days(self):
+        return self._days
+    
+    @days.setter
+    def days(self, days):
+        self._days = tuple(days)
+    
+    def copy(self):
+        return Event(self.name, self._days)
+    
     def as_dict(self):
         d = {}
         d["name"] = self.name if self.name else "[UNKNOWN]"
-        d["days"] = self.days if self.days else [-1]
+        d["days"] = list(self.days) if self.days else [-1]
         return d
 
+# Stands in for a route under a choice that has not been read yet. Each
+# source that loads a route at a time subclasses it: LazyRoute (lazy_parse),
+# SnapshotRoute (snapshot) and SqliteRoute (sqlite_store). Choice.route calls
+# materialize() the first time the route is asked for and keeps the Route it
+# returns, whose parent must be the stub's parent. known_hash() may give the
+# route's subtree hash (see merkle.py) without loading it.
+class RouteStub:
+    __slots__ = ("parent",)
+    
+    def __init__(self, parent):
+        self.parent = parent
+    
+    def materialize(self):
+        raise NotImplementedError(f"{type(self).__name__} does not say how to load its route")
+    
+    def known_hash(self):
+        return None
+
 class Choice:
+    __slots__ = ("branch", "direction", "name", "_route", "subtree_hash")
+    
     def __init__(self, branch, direction, name):
         self.branch = branch
-        self.direction = direction
+        self.direction = sys.intern(direction)
         self.name = name
-        self.route = None
+        self._route = None
+        self.subtree_hash = None
         
         self.branch.set_choice(self)
     
+    @property
+    def route(self):
+        if isinstance(self._route, RouteStub):
+            self._route = self._route.materialize()
+        return self._route
+    
+    @route.setter
+    def route(self, route):
+        self._route = route
+    
     def set_route(self, route):
-        self.route = route
+        self._route = route
     
-    def as_dict(self):
+    def is_loaded(self):
+        return not isinstance(self._route, RouteStub)
+    
+    def stub(self):
+        return None if self.is_loaded() else self._route
+    
+    def children(self):
+        route = self.route
+        return (route,) if route else ()
+    
+    def own_dict(self, child_dicts):
         d = {}
         d["direction"] = self.direction
         d["name"] = self.name if self.name else "[UNKNOWN]"
-        if self.route:
-            d["route"] = self.route.as_dict()
+        if child_dicts:
+            d["route"] = child_dicts[0]
         return d
+    
+    def as_dict(self):
+        route = self.route
+        return self.own_dict([route.as_dict()] if route else [])
 
 class Branch:
+    __slots__ = ("parent", "name", "day", "choices", "subtree_hash")
+    
     def __init__(self, parent, name, day):
         self.parent = parent
         self.name = name
         self.day = day
         self.choices = []
+        self.subtree_hash = None
         
         self.parent.branch = self
         
     def set_choice(self, choice):
         self.choices.append(choice)
     
-    def as_dict(self):
+    def children(self):
+        return self.choices
+    
+    def own_dict(self, child_dicts):
         d = {}
         d["name"] = self.name if self.name else "[UNKNOWN]"
         d["day"] = self.day if self.day else -1
-        choices = []
-        for choice in self.choices:
-            choices.append(choice.as_dict())
-        d["choices"] = choices
+        d["choices"] = child_dicts
         return d
+    
+    def as_dict(self):
+        return self.own_dict([choice.as_dict() for choice in self.choices])
 
 class Route:
+    __slots__ = ("parent", "name", "deaths", "events", "branch", "death_totals", "subtree_hash")
+    
     def __init__(self, parent, name):
         self.parent = parent
         self.name = name
         
-        self.deaths = {}
+        self.deaths = SortedDeaths()
         
-        self.events = []
+        self.events = SortedEvents()
         self.branch = None
+        self.death_totals = None
+        self.subtree_hash = None
     
     def set_deaths(self, deaths):
         self.deaths = deaths
@@ -123,7 +218,28 @@ class Route:
     def set_branch(self, branch):
         self.branch = branch
     
-    def as_dict(self):
+    # a list something else holds too, from a shared load (see SharePool) or
+    # an undo version, is copied before it changes; one the route has to
+    # itself is changed in place
+    def own_deaths(self):
+        if self.deaths.shared:
+            self.deaths = self.deaths.copy()
+        return self.deaths
+    
+    def own_events(self):
+        if self.events.shared:
+            self.events = self.events.copy()
+        return self.events
+    
+    def children(self):
+        return (self.branch,) if self.branch else ()
+    
+    def child_routes(self):
+        if not self.branch:
+            return ()
+        return [choice.route for choice in self.branch.choices if choice.route]
+    
+    def own_dict(self, child_route_dicts):
         d = {}
         d["name"] = self.name if self.name else "[UNKNOWN]"
         if self.deaths:
@@ -135,16 +251,90 @@ class Route:
             for event in self.events:
                 d["events"].append(event.as_dict())
         if self.branch:
-            d["branch"] = self.branch.as_dict()
+            route_dicts = iter(child_route_dicts)
+            choice_dicts = [choice.own_dict([next(route_dicts)] if choice.route else []) for choice in self.branch.choices]
+            d["branch"] = self.branch.own_dict(choice_dicts)
         return d
+    
+    def as_dict(self):
+        return routes_as_dict(self)
 
 class Tree:
+    __slots__ = ("names", "base_routes", "_index", "_queries", "listeners", "history", "store")
+    
     def __init__(self, names):
         self.names = names
         self.base_routes = {}
+        self._index = None
+        self._queries = None
+        self.listeners = []
+        self.history = None #edit_ops.History once undo is wanted
+        self.store = None #sqlite_store.Store the tree was loaded from
     
     def add_route(self, route):
         self.base_routes[route.name] = route
+        self.route_added(route)
+    
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = TreeIndex(self)
+        return self._index
+    
+    @property
+    def queries(self):
+        if self._queries is None:
+            from query import QueryIndex #query builds on this module
+            self._queries = QueryIndex(self)
+        return self._queries
+    
+    # Edits report here so whichever indexes have been built stay current;
+    # one built later simply starts from the edited tree. Subtree hashes are
+    # cleared from the route up, see merkle.py.
+    def route_added(self, route, choice = None):
+        from merkle import invalidate_hashes
+        invalidate_hashes(route)
+        if self._index:
+            self._index.add_route(route, choice)
+        if self._queries:
+            self._queries.add_route(route)
+    
+    def route_removed(self, route):
+        from merkle import invalidate_hashes
+        if route.parent is not None:
+            invalidate_hashes(route.parent)
+        if self._index:
+            self._index.remove_route(route)
+        if self._queries:
+            self._queries.remove_route(route)
+    
+    def route_renamed(self, route, old_name):
+        from merkle import invalidate_hashes
+        invalidate_hashes(route)
+        if self._index:
+            self._index.rename_route(route, old_name)
+    
+    def route_edited(self, route):
+        from merkle import invalidate_hashes
+        invalidate_hashes(route)
+        if self._queries:
+            self._queries.update_route(route)
+    
+    # Listeners (the edit journal, for one) hear about every op applied
+    # through edit_ops and about explicit save points.
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+    
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+    
+    def op_applied(self, op):
+        for listener in self.listeners:
+            listener.op_applied(self, op)
+    
+    def checkpoint(self):
+        for listener in self.listeners:
+            listener.checkpoint(self)
     
     def as_dict(self):
         d = {}
@@ -161,44 +351,286 @@ class CustomEncoder(JSONEncoder):
     def default(self, obj):
         return obj.as_dict()
 
-def parse_route(parent_route, route_json, depth = 0):    
+def routes_as_dict(root):
+    levels = [[], []]
+    
+    def exit(node, depth):
+        while len(levels) < depth + 2:
+            levels.append([])
+        child_dicts = levels[depth + 1]
+        levels[depth + 1] = []
+        levels[depth].append(node.own_dict(child_dicts))
+    
+    walk(root, exit = exit, children = Route.child_routes)
+    return levels[0][0]
+
+class SharePool:
+    # Hash-consing for a shared load: equal strings, day lists, deaths,
+    # events and whole death or event lists are built once and reused.
+    __slots__ = ("strings", "days", "records", "lists")
+    
+    def __init__(self):
+        self.strings = {}
+        self.days = {}
+        self.records = {}
+        self.lists = {}
+    
+    def string(self, text):
+        return self.strings.setdefault(text, text)
+    
+    def day_tuple(self, days):
+        days = tuple(days)
+        return self.days.setdefault(days, days)
+    
+    def event(self, name, days):
+        key = (self.string(name), self.day_tuple(days))
+        event = self.records.get(key)
+        if event is None:
+            event = self.records[key] = Event(*key)
+        return event
+    
+    def death(self, id, count, days):
+        key = (sys.intern(id.lower()), count, self.day_tuple(days))
+        death = self.records.get(key)
+        if death is None:
+            death = self.records[key] = Death(*key)
+        return death
+    
+    def events(self, events):
+        # records are shared already, so equal lists hold the same objects
+        key = tuple(events)
+        shared = self.lists.get(key)
+        if shared is None:
+            shared = self.lists[key] = SortedEvents(key)
+            shared.shared = True
+        return shared
+    
+    def deaths(self, deaths):
+        key = tuple(deaths)
+        shared = self.lists.get(key)
+        if shared is None:
+            shared = self.lists[key] = SortedDeaths(key)
+            shared.shared = True
+        return shared
+
+def parse_route_fields(parent_route, route_json, pool = None):
+    if pool:
+        route = Route(parent_route, pool.string(route_json["name"]))
+        if "events" in route_json:
+            route.set_events(pool.events(pool.event(event_json["name"], event_json["days"]) for event_json in route_json["events"]))
+        if "deaths" in route_json:
+            route.set_deaths(pool.deaths(pool.death(death_json["id"], death_json["count"], death_json["days"]) for death_json in route_json["deaths"]))
+        return route
+    
     route = Route(parent_route, route_json["name"])
     
-    events = []
     if "events" in route_json:
-        for event_json in route_json["events"]:
-            events.append(Event(event_json["name"], event_json["days"]))
-        route.set_events(sort_by_days(events))
+        route.set_events(SortedEvents(Event(event_json["name"], event_json["days"]) for event_json in route_json["events"]))
     
-    deaths = []
     if "deaths" in route_json:
-        for death_json in route_json["deaths"]:
-            deaths.append(Death(death_json["id"], death_json["count"], death_json["days"]))
-        deaths = sort_by_days(deaths)
-        route.set_deaths({d.id:d for d in deaths})
-    
-    if "branch" in route_json:
-        branch_json = route_json["branch"]
-        branch = Branch(route, branch_json["name"], branch_json["day"])
-        for choice_json in branch_json["choices"]:
-            choice = Choice(branch, choice_json["direction"], choice_json["name"])
-            route_ret = parse_route(route, choice_json["route"], depth + 1)
-            choice.set_route(route_ret)
+        route.set_deaths(SortedDeaths(Death(death_json["id"], death_json["count"], death_json["days"]) for death_json in route_json["deaths"]))
     
     return route
 
-def parse_game_data(data_json):
+def parse_route(parent_route, route_json, pool = None):
+    root = []
+    placed = []
+    string = pool.string if pool else (lambda text: text)
+    
+    def enter(node, depth):
+        node_json, parent, choice = node
+        route = parse_route_fields(parent, node_json, pool)
+        if choice:
+            choice.set_route(route)
+        else:
+            root.append(route)
+        
+        placed.clear()
+        if "branch" in node_json:
+            branch_json = node_json["branch"]
+            branch = Branch(route, string(branch_json["name"]), branch_json["day"])
+            for choice_json in branch_json["choices"]:
+                choice = Choice(branch, choice_json["direction"], string(choice_json["name"]))
+                placed.append((choice_json["route"], route, choice))
+    
+    # walk asks for a node's children straight after entering it, so the
+    # choices just created in enter are the ones to descend into
+    walk((route_json, parent_route, None), enter, children = lambda node: tuple(placed))
+    return root[0]
+
+def parse_names(names_json):
     names = {}
-    for name_json in data_json["names"]:
+    for name_json in names_json:
         names[name_json["id"].lower()] = Name(**name_json)
-    game_tree = Tree(names)
+    return names
+
+def parse_game_data(data_json, share = False):
+    game_tree = Tree(parse_names(data_json["names"]))
+    pool = SharePool() if share else None
     
     for route_json in data_json["routes"]:
-        base_route = parse_route(None, route_json)
+        base_route = parse_route(None, route_json, pool)
         game_tree.base_routes[base_route.name] = base_route
     
     return game_tree
 
-def save_tree(filename, game_tree):
-    with open(filename, "w") as f:
-        json.dump(game_tree, f, cls = CustomEncoder, indent = 2)
\ No newline at end of file
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+
+def file_compression(filename):
+    with open(filename, "rb") as f:
+        magic = f.read(6)
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic.startswith(XZ_MAGIC):
+        return "xz"
+    return None
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+
+def is_sqlite(filename):
+    with open(filename, "rb") as f:
+        return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+def open_game_file(filename, binary = False):
+    compression = file_compression(filename)
+    opener = gzip.open if compression == "gzip" else lzma.open if compression == "xz" else open
+    if binary:
+        return opener(filename, "rb")
+    return opener(filename, "rt", encoding = "utf-8")
+
+def load_game_data(filename, lazy = False, cache = False, share = False):
+    # a SQLite file is always loaded a route at a time, see sqlite_store.py
+    if is_sqlite(filename):
+        from sqlite_store import load_store
+        with phase("load_store"):
+            return load_store(filename)
+    # a shared load always parses the whole file, snapshots and lazy loads
+    # build separate objects for every route
+    if share:
+        with phase("json.load"), open_game_file(filename) as f:
+            data = json.load(f)
+        with phase("parse_game_data"):
+            return parse_game_data(data, share = True)
+    if cache:
+        from snapshot import load_snapshot, write_snapshot, source_state
+        with phase("load_snapshot"):
+            game_tree = load_snapshot(filename)
+        if game_tree:
+            return game_tree
+        source = source_state(filename)
+        game_tree = load_game_data(filename, lazy)
+        with phase("write_snapshot"):
+            write_snapshot(filename, game_tree, source)
+        return game_tree
+    if lazy:
+        from lazy_parse import load_lazy
+        with phase("load_lazy"):
+            return load_lazy(filename)
+    with phase("json.load"), open_game_file(filename) as f:
+        data = json.load(f)
+    with phase("parse_game_data"):
+        return parse_game_data(data)
+
+def dump_value(value, indent, level):
+    if indent is None:
+        return json.dumps(value, separators = (",", ":"))
+    return json.dumps(value, indent = indent).replace("\n", "\n" + " " * (indent * level))
+
+def write_tree(out, game_tree, indent = 2):
+    # Encodes straight from the node objects in the same layout json.dump
+    # gives for Tree.as_dict(), without building the intermediate dicts.
+    key_separator = ": " if indent is not None else ":"
+    
+    def pad(level):
+        return "\n" + " " * (indent * level) if indent is not None else ""
+    
+    def field(level, key, value, first = False):
+        out.write(("" if first else ",") + pad(level) + encode_basestring_ascii(key) + key_separator + dump_value(value, indent, level))
+    
+    def route_level(depth):
+        return 2 + (depth // 3) * 4
+    
+    def enter(node, depth):
+        level = route_level(depth)
+        if isinstance(node, Route):
+            out.write("{")
+            field(level + 1, "name", node.name if node.name else "[UNKNOWN]", True)
+            if node.deaths:
+                field(level + 1, "deaths", [death.as_dict() for death in node.deaths.values()])
+            if node.events:
+                field(level + 1, "events", [event.as_dict() for event in node.events])
+            branch = node.branch
+            if branch:
+                out.write("," + pad(level + 1) + "\"branch\"" + key_separator + "{")
+                field(level + 2, "name", branch.name if branch.name else "[UNKNOWN]", True)
+                field(level + 2, "day", branch.day if branch.day else -1)
+                out.write("," + pad(level + 2) + "\"choices\"" + key_separator + ("[" if branch.choices else "[]"))
+        elif isinstance(node, Choice):
+            level += 3
+            out.write(("" if node.branch.choices[0] is node else ",") + pad(level) + "{")
+            field(level + 1, "direction", node.direction, True)
+            field(level + 1, "name", node.name if node.name else "[UNKNOWN]")
+            if node.route:
+                out.write("," + pad(level + 1) + "\"route\"" + key_separator)
+    
+    def exit(node, depth):
+        level = route_level(depth)
+        if isinstance(node, Route):
+            if node.branch:
+                if node.branch.choices:
+                    out.write(pad(level + 2) + "]")
+                out.write(pad(level + 1) + "}")
+            out.write(pad(level) + "}")
+        elif isinstance(node, Choice):
+            out.write(pad(level + 3) + "}")
+    
+    out.write("{")
+    if game_tree.names:
+        field(1, "names", [name.as_dict() for name in game_tree.names.values()], True)
+        out.write(",")
+    out.write(pad(1) + "\"routes\"" + key_separator + ("[" if game_tree.base_routes else "[]"))
+    for i, route in enumerate(game_tree.base_routes.values()):
+        out.write(("," if i else "") + pad(2))
+        walk(route, enter, exit)
+    if game_tree.base_routes:
+        out.write(pad(1) + "]")
+    out.write(pad(0) + "}")
+
+SAVE_FORMATS = ("pretty", "minified", "gzip", "xz", "sqlite")
+
+def save_format(filename):
+    if filename.endswith(".sqlite") or filename.endswith(".db"):
+        return "sqlite"
+    if filename.endswith(".gz"):
+        return "gzip"
+    if filename.endswith(".xz"):
+        return "xz"
+    return "pretty"
+
+def save_tree(filename, game_tree, format = None):
+    if format is None:
+        format = save_format(filename)
+    # written beside the target and renamed over it, so a crash part way
+    # through never leaves a truncated file
+    temp_filename = filename + ".tmp"
+    try:
+        if format == "sqlite":
+            from sqlite_store import write_store
+            write_store(temp_filename, game_tree)
+            os.replace(temp_filename, filename)
+            return
+        with open(temp_filename, "wb") as raw:
+            if format == "gzip":
+                f = io.TextIOWrapper(gzip.GzipFile(filename = filename, mode = "wb", fileobj = raw), encoding = "utf-8")
+            elif format == "xz":
+                f = io.TextIOWrapper(lzma.LZMAFile(raw, "wb"), encoding = "utf-8")
+            else:
+                f = io.TextIOWrapper(raw, encoding = "utf-8")
+            with f, ChunkWriter(f) as out:
+                write_tree(out, game_tree, indent = 2 if format == "pretty" else None)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
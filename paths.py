@@ -0,0 +1,155 @@
+from parse_game import Route
+from cumulative import cumulative_deaths
+from traverse import postorder
+
+# A playthrough is one root-to-leaf path through the branch choices. There
+# can be far too many to list, so iter_paths streams them one at a time and
+# the statistics below are worked out per route bottom-up without ever
+# visiting a path. A choice with no route ends its playthrough there.
+
+class PlayPath:
+    __slots__ = ("choices", "route")
+
+    def __init__(self, choices, route):
+        self.choices = choices
+        self.route = route
+
+    def routes(self):
+        routes = []
+        route = self.route
+        while route is not None:
+            routes.append(route)
+            route = route.parent
+        return routes[ : : -1]
+
+    def deaths(self):
+        return cumulative_deaths(self.route)
+
+    def events(self):
+        for route in self.routes():
+            yield from route.events
+
+def iter_paths(root, prefix = ()):
+    choices = list(prefix)
+    if not root.branch or not root.branch.choices:
+        yield PlayPath(tuple(choices), root)
+        return
+    stack = [(root, iter(root.branch.choices))]
+    while stack:
+        route, pending = stack[-1]
+        for choice in pending:
+            choices.append(choice)
+            child = choice.route
+            if child is None:
+                yield PlayPath(tuple(choices), route)
+                choices.pop()
+            elif child.branch and child.branch.choices:
+                stack.append((child, iter(child.branch.choices)))
+            else:
+                yield PlayPath(tuple(choices), child)
+                choices.pop()
+            break
+        else:
+            stack.pop()
+            if stack:
+                choices.pop()
+
+def choice_prefix(route):
+    # the choices leading from its base route down to route
+    choices = []
+    while route.parent is not None:
+        parent = route.parent
+        choices.append(next(choice for choice in parent.branch.choices if choice.route is route))
+        route = parent
+    return choices[ : : -1]
+
+class DeathStats:
+    __slots__ = ("least", "most", "total")
+
+    def __init__(self, least, most, total):
+        self.least = least
+        self.most = most
+        self.total = total
+
+class RouteStats:
+    # over every playthrough starting at this route: how many there are,
+    # and per character the fewest and most deaths along one and the sum of
+    # deaths over all of them
+    __slots__ = ("paths", "deaths")
+
+    def __init__(self, paths, deaths):
+        self.paths = paths
+        self.deaths = deaths
+
+    def expected(self, id):
+        # every playthrough counted as equally likely
+        stats = self.deaths.get(id)
+        return stats.total / self.paths if stats else 0.0
+
+LEAF = RouteStats(1, {})
+
+def path_stats(root):
+    stats = {}
+    for route, depth in postorder(root, Route.child_routes):
+        branch_stats = [stats.pop(choice.route) if choice.route else LEAF for choice in route.branch.choices] if route.branch else ()
+        if len(branch_stats) > 1:
+            paths = sum(child.paths for child in branch_stats)
+            deaths = {}
+            ids = set()
+            for child in branch_stats:
+                ids.update(child.deaths)
+            for id in ids:
+                counts = [child.deaths.get(id) for child in branch_stats]
+                deaths[id] = DeathStats(min(entry.least if entry else 0 for entry in counts),
+                    max(entry.most if entry else 0 for entry in counts),
+                    sum(entry.total for entry in counts if entry))
+        else:
+            # a lone choice's playthroughs are all of this route's as well
+            child = branch_stats[0] if branch_stats else LEAF
+            paths = child.paths
+            deaths = dict(child.deaths) if route.deaths else child.deaths
+        for death in route.deaths.values():
+            own = deaths.get(death.id)
+            if own:
+                deaths[death.id] = DeathStats(own.least + death.count, own.most + death.count, own.total + death.count * paths)
+            else:
+                deaths[death.id] = DeathStats(death.count, death.count, death.count * paths)
+        stats[route] = RouteStats(paths, deaths)
+    return stats[root]
+
+def event_paths(root, matches):
+    # (route, event, playthroughs through it) for every matching event, and
+    # how many playthroughs meet at least one of them
+    found = []
+    counts = {}
+    for route, depth in postorder(root, Route.child_routes):
+        children = [counts.pop(choice.route) if choice.route else (1, 0) for choice in route.branch.choices] if route.branch else []
+        paths = sum(child[0] for child in children) if children else 1
+        events = [event for event in route.events if matches(event)]
+        found.extend((route, event, paths) for event in events)
+        counts[route] = (paths, paths if events else sum(child[1] for child in children))
+    return found, counts[root][1]
+
+def write_paths(game_tree, out):
+    for base_route in game_tree.base_routes.values():
+        for path in iter_paths(base_route):
+            steps = " > ".join(f"{choice.direction}: {choice.name}" for choice in path.choices)
+            total = sum(death.count for death in path.deaths().values())
+            out.write(f"{base_route.name}{' > ' + steps if steps else ''} => \"{path.route.name}\", {total} death(s)\n")
+
+def write_stats(game_tree, out):
+    for base_route in game_tree.base_routes.values():
+        stats = path_stats(base_route)
+        out.write(f"{base_route.name}: {stats.paths} playthrough(s)\n")
+        for id, deaths in sorted(stats.deaths.items()):
+            out.write(f"  {game_tree.names[id].full}: fewest {deaths.least}, most {deaths.most}, expected {stats.expected(id):.2f}\n")
+
+def write_event_paths(game_tree, text, out):
+    text = text.lower()
+    for base_route in game_tree.base_routes.values():
+        found, total = event_paths(base_route, lambda event: text in event.name.lower())
+        if not found:
+            continue
+        out.write(f"{base_route.name}: {total} of {path_stats(base_route).paths} playthrough(s)\n")
+        for route, event, paths in found:
+            out.write(f"  \"{route.name}\", day(s) {', '.join(str(day) for day in event.days)}, {paths} playthrough(s): {event.name}\n")
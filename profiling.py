@@ -0,0 +1,229 @@
+import atexit
+import contextlib
+import importlib
+import json
+import resource
+import sys
+import time
+from traverse import preorder
+
+# Phase timings for a whole run, switched on with --profile. Code marks a
+# phase with "with phase(name):"; when nothing is profiling that is one
+# global lookup and a shared null context. Phases nest, a phase started
+# inside another is reported as "outer/inner". For each one the wall and CPU
+# time and the peak memory are kept, and for top level phases the nodes
+# loaded in the tree at its end. Peak memory is the process's peak RSS so
+# far, or with the memory option tracemalloc's peak within the phase, which
+# is exact but slows the run down.
+#
+# The calls option also wraps the functions called once per node (COUNTED)
+# with a call counter and timer, so their counts say how many nodes each
+# phase touched. The wrappers replace the functions everywhere they were
+# imported, so without the option there is nothing to pay for.
+
+COUNTED = [
+    ("parse_game", "parse_route_fields"),
+    ("parse_game", "Route.own_dict"),
+    ("lazy_parse", "LazyRoute.materialize"),
+    ("snapshot", "SnapshotRoute.materialize"),
+    ("render", "TextRenderer.enter"),
+    ("render", "DotRenderer.enter"),
+    ("render", "MarkdownRenderer.enter"),
+    ("render", "JsonRenderer.enter"),
+    ("cumulative", "cumulative_deaths"),
+]
+
+FORMATS = ("table", "json", "pstats")
+
+active = None #the running Profiler, if any
+NO_PHASE = contextlib.nullcontext()
+
+def phase(name):
+    return active.phase(name) if active else NO_PHASE
+
+def count_nodes(game_tree):
+    # only what is already loaded, counting must not load a lazy tree
+    from parse_game import Route, Branch, Choice
+
+    def loaded_children(node):
+        if isinstance(node, Choice):
+            return (node.route,) if node.is_loaded() and node.route else ()
+        return node.children()
+
+    counts = {"routes": 0, "branches": 0, "choices": 0, "deaths": 0, "events": 0}
+    for base_route in game_tree.base_routes.values():
+        for node, depth in preorder(base_route, loaded_children):
+            if isinstance(node, Route):
+                counts["routes"] += 1
+                counts["deaths"] += len(node.deaths)
+                counts["events"] += len(node.events)
+            elif isinstance(node, Branch):
+                counts["branches"] += 1
+            else:
+                counts["choices"] += 1
+    return counts
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def parse_spec(spec):
+    # --profile[=option,option...[:path]], options being a format from
+    # FORMATS, calls and memory
+    options, _, path = spec.partition(":")
+    options = [option.strip().lower() for option in options.split(",") if option.strip()]
+    for option in options:
+        if option not in FORMATS and option not in ("calls", "memory"):
+            raise ValueError(f"Unknown profile option {option}, expected any of: {', '.join(FORMATS + ('calls', 'memory'))}")
+    formats = [option for option in options if option in FORMATS]
+    return {"format": formats[-1] if formats else "table", "calls": "calls" in options, "memory": "memory" in options, "path": path or None}
+
+class Profiler:
+    def __init__(self, format = "table", calls = False, memory = False, path = None):
+        self.format = format
+        self.memory = memory
+        self.path = path
+        self.tree = None #counted at the end of each phase once set
+        self.phases = []
+        self.names = []
+        self.carried_peaks = [] #traced peaks seen by each open phase before its inner ones reset it
+        self.calls = {}
+        self.patched = []
+        self.cprofile = None
+        if calls:
+            self.patch_counted()
+
+    def start(self):
+        # reports when the program exits, however it exits
+        global active
+        active = self
+        atexit.register(self.finish)
+        if self.memory:
+            import tracemalloc #only worth its import time when asked for
+            tracemalloc.start()
+        if self.format == "pstats":
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def stop(self):
+        global active
+        active = None
+        if self.cprofile:
+            self.cprofile.disable()
+        if self.memory:
+            import tracemalloc
+            tracemalloc.stop()
+        for owner, name, original in self.patched:
+            setattr(owner, name, original)
+        self.patched = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        self.names.append(name)
+        record = {"phase": "/".join(self.names)}
+        self.phases.append(record)
+        if self.memory:
+            import tracemalloc
+            if self.carried_peaks:
+                self.carried_peaks[-1] = max(self.carried_peaks[-1], tracemalloc.get_traced_memory()[1])
+            self.carried_peaks.append(0)
+            tracemalloc.reset_peak()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            record["wall_seconds"] = time.perf_counter() - wall
+            record["cpu_seconds"] = time.process_time() - cpu
+            if self.memory:
+                import tracemalloc
+                peak = record["peak_bytes"] = max(tracemalloc.get_traced_memory()[1], self.carried_peaks.pop())
+                if self.carried_peaks:
+                    self.carried_peaks[-1] = max(self.carried_peaks[-1], peak)
+            else:
+                record["peak_rss_bytes"] = peak_rss()
+            if self.tree is not None and len(self.names) == 1:
+                # only between top level phases, so the count is never timed
+                record["nodes"] = count_nodes(self.tree)
+            self.names.pop()
+
+    def patch_counted(self):
+        for module_name, qualified_name in COUNTED:
+            module = importlib.import_module(module_name)
+            owner = module
+            *owners, name = qualified_name.split(".")
+            for part in owners:
+                owner = getattr(owner, part)
+            original = owner.__dict__[name]
+            wrapper = self.counter(qualified_name, original)
+            if owner is module:
+                # functions can be bound under their own name in any module
+                # that imported them
+                for other in list(sys.modules.values()):
+                    if other is not None and vars(other).get(name) is original:
+                        setattr(other, name, wrapper)
+                        self.patched.append((other, name, original))
+            else:
+                setattr(owner, name, wrapper)
+                self.patched.append((owner, name, original))
+
+    def counter(self, name, fn):
+        stats = self.calls[name] = {"calls": 0, "seconds": 0.0}
+
+        def counted(*args, **kwargs):
+            stats["calls"] += 1
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                stats["seconds"] += time.perf_counter() - start
+        return counted
+
+    def set_tree(self, game_tree):
+        # the phase that loaded the tree gets its counts too
+        self.tree = game_tree
+        top_level = [record for record in self.phases if "/" not in record["phase"]]
+        if top_level and "wall_seconds" in top_level[-1]:
+            top_level[-1]["nodes"] = count_nodes(game_tree)
+
+    def finish(self):
+        self.stop()
+        self.report()
+
+    def results(self):
+        return {"phases": self.phases, "calls": {name: stats for name, stats in self.calls.items() if stats["calls"]}}
+
+    def write_table(self, out):
+        memory_heading = "peak traced" if self.memory else "peak RSS"
+        out.write(f"{'phase':<32} {'wall ms':>10} {'cpu ms':>10} {memory_heading + ' MB':>15} {'routes':>8} {'deaths':>8} {'events':>8}\n")
+        for record in self.phases:
+            depth = record["phase"].count("/")
+            label = "  " * depth + record["phase"].rsplit("/", 1)[-1]
+            memory = record.get("peak_bytes", record.get("peak_rss_bytes", 0)) / 1e6
+            nodes = record.get("nodes", {})
+            out.write(f"{label:<32} {record['wall_seconds'] * 1000:>10.2f} {record['cpu_seconds'] * 1000:>10.2f} {memory:>15.2f} {nodes.get('routes', ''):>8} {nodes.get('deaths', ''):>8} {nodes.get('events', ''):>8}\n")
+        calls = self.results()["calls"]
+        if calls:
+            out.write(f"\n{'function':<32} {'calls':>10} {'total ms':>10}\n")
+            for name, stats in sorted(calls.items(), key = lambda item: -item[1]["seconds"]):
+                out.write(f"{name:<32} {stats['calls']:>10} {stats['seconds'] * 1000:>10.2f}\n")
+
+    def report(self):
+        if self.format == "pstats":
+            path = self.path or "profile.pstats"
+            self.cprofile.dump_stats(path)
+            self.write_table(sys.stderr)
+            sys.stderr.write(f"cProfile stats written to {path}\n")
+            return
+        out = open(self.path, "w") if self.path else sys.stderr
+        try:
+            if self.format == "json":
+                json.dump(self.results(), out, indent = 2)
+                out.write("\n")
+            else:
+                self.write_table(out)
+        finally:
+            if self.path:
+                out.close()
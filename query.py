@@ -0,0 +1,182 @@
+from bisect import bisect_left, bisect_right, insort
+from parse_game import Route, Death
+from cumulative import cumulative_deaths
+from traverse import preorder
+from utils import day_key
+
+# Inverted indexes over every route's own deaths and events:
+#   characters: name id -> {(route, death)}
+#   day_items:  day -> {(route, death or event)}, with the days in a sorted list
+# The sets are dicts, to keep the order things were indexed in. Pairs rather
+# than items are stored since a shared load can put one record on many routes.
+# Cumulative counts are not stored, they come from the routes' cached totals
+# when a result is printed, so editing a parent's deaths needs no reindexing.
+#
+# The tree tells the index about every edit (see Tree.route_edited and
+# friends), and only the routes involved are reindexed.
+
+class QueryIndex:
+    __slots__ = ("characters", "day_items", "days", "indexed")
+
+    def __init__(self, game_tree):
+        self.characters = {}
+        self.day_items = {}
+        self.days = []
+        self.indexed = {}
+        for route in game_tree.base_routes.values():
+            self.add_route(route)
+
+    def add_route(self, route):
+        for node, depth in preorder(route, Route.child_routes):
+            self.index_route(node)
+
+    def remove_route(self, route):
+        for node, depth in preorder(route, Route.child_routes):
+            self.unindex_route(node)
+
+    def update_route(self, route):
+        self.unindex_route(route)
+        self.index_route(route)
+
+    def index_route(self, route):
+        if route in self.indexed:
+            return
+        # remember what was indexed, the lists change before a reindex
+        entries = []
+        for death in route.deaths.values():
+            self.characters.setdefault(death.id, {})[(route, death)] = None
+            entries.append((death, death.id, death.days))
+        for event in route.events:
+            entries.append((event, None, event.days))
+        for item, id, days in entries:
+            for day in set(days):
+                items = self.day_items.get(day)
+                if items is None:
+                    items = self.day_items[day] = {}
+                    insort(self.days, day)
+                items[(route, item)] = None
+        self.indexed[route] = entries
+
+    def unindex_route(self, route):
+        for item, id, days in self.indexed.pop(route, ()):
+            if id is not None:
+                deaths = self.characters[id]
+                del deaths[(route, item)]
+                if not deaths:
+                    del self.characters[id]
+            for day in set(days):
+                items = self.day_items[day]
+                items.pop((route, item), None)
+                if not items:
+                    del self.day_items[day]
+                    del self.days[bisect_left(self.days, day)]
+
+    def between(self, first, last):
+        hits = {}
+        for day in self.days[bisect_left(self.days, first) : bisect_right(self.days, last)]:
+            hits.update(self.day_items[day])
+        return hits
+
+def within(route, roots):
+    while route is not None:
+        if route in roots:
+            return True
+        route = route.parent
+    return False
+
+def has_day_between(days, first, last):
+    i = bisect_left(days, first)
+    return i < len(days) and days[i] <= last
+
+def run_query(game_tree, characters = (), first = None, last = None, roots = (), kinds = ("deaths", "events")):
+    index = game_tree.queries
+    if first is None and last is not None:
+        first = last
+    if last is None and first is not None:
+        last = first
+
+    # start from whichever index narrows things down the most
+    if characters:
+        hits = {}
+        for id in characters:
+            hits.update(index.characters.get(id, {}))
+    elif first is not None:
+        hits = index.between(first, last)
+    else:
+        hits = {}
+        for root in (roots or game_tree.base_routes.values()):
+            for route, depth in preorder(root, Route.child_routes):
+                hits.update(((route, item), None) for item, id, days in index.indexed.get(route, ()))
+
+    roots = set(roots)
+    results = []
+    for route, item in hits:
+        if ("deaths" if isinstance(item, Death) else "events") not in kinds:
+            continue
+        if first is not None and not has_day_between(sorted(item.days), first, last):
+            continue
+        if roots and not within(route, roots):
+            continue
+        results.append((route, item))
+    results.sort(key = lambda hit: day_key(hit[1]))
+    return results
+
+def choice_path(game_tree, route):
+    steps = []
+    choice = game_tree.index.parents.get(route)
+    while choice is not None:
+        steps.append(f"{choice.direction}: {choice.name}")
+        route = choice.branch.parent
+        choice = game_tree.index.parents.get(route)
+    steps.append(route.name)
+    return " > ".join(steps[ : : -1])
+
+def write_results(game_tree, results, out):
+    for route, item in results:
+        days = ", ".join(str(day) for day in item.days)
+        if isinstance(item, Death):
+            total = cumulative_deaths(route)[item.id].count
+            out.write(f"{game_tree.names[item.id].full} died on day(s) {days} in \"{route.name}\" ({total} time(s) by then)\n")
+        else:
+            out.write(f"Day(s) {days}: {item.name} in \"{route.name}\"\n")
+        out.write(f"  {choice_path(game_tree, route)}\n")
+
+def parse_day_range(text):
+    first, _, last = text.partition("-")
+    return int(first), int(last) if last else int(first)
+
+QUERY_USAGE = "query [--character id]... [--days first[-last]] [--route title] [--path base_title/direction/...] [--deaths|--events]"
+
+def parse_query_args(game_tree, args):
+    options = {"characters": [], "roots": []}
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "--deaths":
+            options["kinds"] = ("deaths",)
+        elif arg == "--events":
+            options["kinds"] = ("events",)
+        elif not args:
+            raise ValueError(f"{arg} needs a value")
+        elif arg == "--character":
+            id = args.pop(0).lower().strip()
+            if id not in game_tree.names:
+                raise ValueError(f"Unknown character id {id}")
+            options["characters"].append(id)
+        elif arg == "--days":
+            options["first"], options["last"] = parse_day_range(args.pop(0))
+        elif arg == "--route":
+            title = args.pop(0)
+            routes = game_tree.index.find_title(title)
+            if not routes:
+                raise ValueError(f"No route titled \"{title}\"")
+            options["roots"].extend(routes)
+        elif arg == "--path":
+            path = args.pop(0)
+            route = game_tree.index.find_path(path.split("/"))
+            if route is None:
+                raise ValueError(f"No route at path {path}")
+            options["roots"].append(route)
+        else:
+            raise ValueError(f"Unknown query option {arg}")
+    return options
@@ -0,0 +1,163 @@
+import json
+from parse_game import Route, Choice
+from cumulative import cumulative_deaths
+from traverse import walk
+from utils import ChunkWriter
+
+# Renderers turn the walk over a route into text on a writer. Routes sit at
+# walk depths 0, 3, 6... with their Branch and Choice nodes in between.
+
+class Renderer:
+    def __init__(self, out, names):
+        self.out = out
+        self.names = names
+
+    def begin(self):
+        pass
+
+    def end(self):
+        pass
+
+    def begin_route(self, route, depth = 0):
+        self.depth = depth
+
+    def end_route(self, route):
+        pass
+
+    def enter(self, node, node_depth):
+        pass
+
+    def exit(self, node, node_depth):
+        pass
+
+class TextRenderer(Renderer):
+    multiplier = 2
+
+    def end_route(self, route):
+        self.out.write("\n")
+
+    def enter(self, node, node_depth):
+        indent = " " * ((self.depth + node_depth // 3) * self.multiplier)
+        if isinstance(node, Route):
+            self.out.write(f"{indent}Title: {node.name}\n")
+            if len(node.deaths) > 0:
+                self.out.write(f"{indent}Deaths: ")
+            deaths = cumulative_deaths(node)
+            if len(deaths) > 0:
+                for death in deaths.values():
+                    self.out.write(f"{self.names[death.id].full} died {death.count} time(s) on day(s) {str(list(death.days))[1 : -1]}; ")
+                self.out.write("\n")
+        elif isinstance(node, Choice):
+            self.out.write(f"{indent}Decide: {node.name} on {node.branch.name}\n")
+
+def dot_escape(text):
+    return str(text).replace("\\", "\\\\").replace("\"", "\\\"")
+
+class DotRenderer(Renderer):
+    def begin(self):
+        self.next_id = 0
+        self.out.write("digraph routes {\n  node [shape=box];\n")
+
+    def end(self):
+        self.out.write("}\n")
+
+    def begin_route(self, route, depth = 0):
+        self.route_ids = []
+        self.pending_choice = None
+
+    def enter(self, node, node_depth):
+        if isinstance(node, Route):
+            node_id = f"r{self.next_id}"
+            self.next_id += 1
+            lines = [dot_escape(node.name)]
+            for death in cumulative_deaths(node).values():
+                lines.append(dot_escape(f"{self.names[death.id].full} x{death.count} ({', '.join(str(day) for day in death.days)})"))
+            label = "\\n".join(lines)
+            self.out.write(f"  {node_id} [label=\"{label}\"];\n")
+            if self.pending_choice:
+                self.out.write(f"  {self.route_ids[-1]} -> {node_id} [label=\"{dot_escape(self.pending_choice.name)}\"];\n")
+                self.pending_choice = None
+            self.route_ids.append(node_id)
+        elif isinstance(node, Choice):
+            self.pending_choice = node
+
+    def exit(self, node, node_depth):
+        if isinstance(node, Route):
+            self.route_ids.pop()
+
+def markdown_escape(text):
+    text = str(text)
+    for char in "\\`*_[]":
+        text = text.replace(char, "\\" + char)
+    return text
+
+class MarkdownRenderer(Renderer):
+    def end_route(self, route):
+        self.out.write("\n")
+
+    def enter(self, node, node_depth):
+        level = self.depth + (node_depth // 3) * 2
+        if isinstance(node, Route):
+            self.out.write(f"{'  ' * level}- **{markdown_escape(node.name)}**\n")
+            deaths = cumulative_deaths(node)
+            if deaths:
+                parts = [f"{markdown_escape(self.names[death.id].full)} ×{death.count} (day {', '.join(str(day) for day in death.days)})" for death in deaths.values()]
+                self.out.write(f"{'  ' * (level + 1)}- Deaths: {'; '.join(parts)}\n")
+            for event in node.events:
+                self.out.write(f"{'  ' * (level + 1)}- Day {', '.join(str(day) for day in event.days)}: {markdown_escape(event.name)}\n")
+        elif isinstance(node, Choice):
+            self.out.write(f"{'  ' * (level + 1)}- Decide *{markdown_escape(node.name)}* on *{markdown_escape(node.branch.name)}*\n")
+
+class JsonRenderer(Renderer):
+    def begin(self):
+        names = {name.id: name.full for name in self.names.values()}
+        self.out.write("{\"names\":" + json.dumps(names, separators = (",", ":")) + ",\"routes\":[")
+        self.first_route = True
+
+    def end(self):
+        self.out.write("]}\n")
+
+    def begin_route(self, route, depth = 0):
+        if not self.first_route:
+            self.out.write(",")
+        self.first_route = False
+
+    def enter(self, node, node_depth):
+        if isinstance(node, Route):
+            deaths = [{"id": death.id, "count": death.count, "days": list(death.days)} for death in cumulative_deaths(node).values()]
+            events = [{"name": event.name, "days": list(event.days)} for event in node.events]
+            text = json.dumps({"name": node.name, "deaths": deaths, "events": events}, separators = (",", ":"))[ : -1]
+            if node.branch:
+                branch = json.dumps({"name": node.branch.name, "day": node.branch.day}, separators = (",", ":"))
+                text += ",\"branch\":" + branch[ : -1] + ",\"choices\":["
+            self.out.write(text)
+        elif isinstance(node, Choice):
+            text = json.dumps({"direction": node.direction, "name": node.name}, separators = (",", ":"))
+            if node.branch.choices[0] is not node:
+                text = "," + text
+            self.out.write(text[ : -1] + (",\"route\":" if node.route else ""))
+
+    def exit(self, node, node_depth):
+        if isinstance(node, Route):
+            self.out.write("]}}" if node.branch else "}")
+        elif isinstance(node, Choice):
+            self.out.write("}")
+
+RENDERERS = {
+    "text": TextRenderer,
+    "dot": DotRenderer,
+    "markdown": MarkdownRenderer,
+    "json": JsonRenderer,
+}
+
+def render_routes(renderer, routes):
+    renderer.begin()
+    for route in routes:
+        renderer.begin_route(route)
+        walk(route, renderer.enter, renderer.exit)
+        renderer.end_route(route)
+    renderer.end()
+
+def render_tree(game_tree, target, format = "text"):
+    with ChunkWriter(target) as out:
+        render_routes(RENDERERS[format](out, game_tree.names), game_tree.base_routes.values())
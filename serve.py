@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from urllib.parse import urlsplit, unquote
+from cumulative import cumulative_deaths
+from edit_ops import OpError, find_route, route_path
+from merkle import digest, subtree_hash
+
+# A read-only JSON service over one loaded tree, for tools that would
+# otherwise run main.py and parse the whole file for each lookup:
+#   GET /names                 every character
+#   GET /routes/<path>         one route, its branch and choices without the routes below them
+#   GET /subtree/<path>        a route with everything below it
+#   GET /deaths/<path>         the cumulative deaths at a route
+# A path is the base route's position or title, then for each choice its
+# index or direction, e.g. /routes/1/left/0.
+#
+# Responses are cached by what they were built from: a route's subtree
+# hash (see merkle.py), or for deaths a hash of the deaths on the route and
+# every route above it, together with the names. The same key is the
+# response's ETag, so clients can revalidate with If-None-Match. The source
+# file is polled and reloaded in a thread when it changes; the cache
+# survives the swap, and subtrees the change did not touch keep their
+# cached responses and their ETags.
+
+CACHE_SIZE = 4096
+POLL_SECONDS = 1.0
+MAX_HEADERS = 100
+
+STATUS_TEXT = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+def path_step(segment):
+    return int(segment) if segment.isdecimal() else segment
+
+def death_state(route):
+    deaths = []
+    while route is not None:
+        deaths.append([[death.id, death.count, list(death.days)] for death in route.deaths.values()])
+        route = route.parent
+    return digest(b"deaths", deaths, [])
+
+def route_json(game_tree, route):
+    d = {"path": route_path(game_tree, route), "name": route.name}
+    d["deaths"] = [death.as_dict() for death in route.deaths.values()]
+    d["events"] = [event.as_dict() for event in route.events]
+    if route.branch:
+        choices = [{"direction": choice.direction, "name": choice.name, "route": choice.route.name if choice.route else None} for choice in route.branch.choices]
+        d["branch"] = {"name": route.branch.name, "day": route.branch.day, "choices": choices}
+    return d
+
+def deaths_json(game_tree, route):
+    deaths = []
+    for death in cumulative_deaths(route).values():
+        name = game_tree.names.get(death.id)
+        deaths.append({"id": death.id, "name": name.full if name else None, "count": death.count, "days": list(death.days)})
+    return {"path": route_path(game_tree, route), "deaths": deaths}
+
+def file_state(filename):
+    # a SQLite source takes its writes in the -wal file first
+    state = []
+    for path in (filename, filename + "-wal"):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            state.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(state)
+
+def prepare(game_tree):
+    # everything requests would otherwise build on first use
+    game_tree.index
+    for route in game_tree.base_routes.values():
+        subtree_hash(route)
+    # hashing read every route, a SQLite source has nothing left to load
+    if game_tree.store:
+        game_tree.store.close(game_tree)
+    return game_tree, digest(b"names", [name.as_dict() for name in game_tree.names.values()], [])
+
+class Service:
+    def __init__(self, filename, load, game_tree = None):
+        self.filename = filename
+        self.load = load
+        self.state = file_state(filename)
+        self.game_tree, self.names_version = prepare(game_tree if game_tree is not None else load())
+        self.cache = OrderedDict() #key -> (etag, body), least recently used first
+        self.requests = 0
+        self.hits = 0
+
+    def cached(self, key, build):
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return entry
+        body = json.dumps(build(), separators = (",", ":")).encode()
+        entry = self.cache[key] = ("\"" + hashlib.blake2b(repr(key).encode(), digest_size = 12).hexdigest() + "\"", body)
+        if len(self.cache) > CACHE_SIZE:
+            self.cache.popitem(last = False)
+        return entry
+
+    def lookup(self, segments):
+        game_tree = self.game_tree
+        if segments == ["names"]:
+            return self.cached(("names", self.names_version), lambda: [name.as_dict() for name in game_tree.names.values()])
+        if len(segments) < 2 or segments[0] not in ("routes", "subtree", "deaths"):
+            raise LookupError(f"No such resource /{'/'.join(segments)}")
+        kind = segments[0]
+        route = find_route(game_tree, [path_step(segment) for segment in segments[1 : ]])
+        path = tuple(route_path(game_tree, route))
+        if kind == "routes":
+            return self.cached((kind, path, subtree_hash(route)), lambda: route_json(game_tree, route))
+        if kind == "subtree":
+            return self.cached((kind, path, subtree_hash(route)), route.as_dict)
+        # deaths show the characters' names as well
+        return self.cached((kind, path, death_state(route), self.names_version), lambda: deaths_json(game_tree, route))
+
+    def respond(self, method, target, headers):
+        # returns (status, extra headers, body)
+        self.requests += 1
+        if method not in ("GET", "HEAD"):
+            return 405, {"Allow": "GET, HEAD"}, b""
+        segments = [unquote(segment) for segment in urlsplit(target).path.split("/") if segment]
+        try:
+            etag, body = self.lookup(segments)
+        except (LookupError, OpError) as e:
+            return 404, {}, json.dumps({"error": str(e)}).encode()
+        if_none_match = headers.get("if-none-match", "")
+        if if_none_match == "*" or etag in (tag.strip() for tag in if_none_match.split(",")):
+            return 304, {"ETag": etag}, b""
+        return 200, {"ETag": etag, "Cache-Control": "no-cache"}, body
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    writer.write(response_bytes(400, {"Connection": "close"}, b""))
+                    break
+                headers = {}
+                for i in range(MAX_HEADERS):
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = header.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                status, extra, body = self.respond(method, target, headers)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                if not keep_alive:
+                    extra["Connection"] = "close"
+                writer.write(response_bytes(status, extra, body, method != "HEAD"))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def load_state(self):
+        # the file's state is taken right before it is read, so a write that
+        # lands during the load shows up as a change at the next poll
+        state = file_state(self.filename)
+        return (state,) + prepare(self.load())
+
+    async def reload(self):
+        state, game_tree, names_version = await asyncio.get_running_loop().run_in_executor(None, self.load_state)
+        self.state = state
+        self.game_tree, self.names_version = game_tree, names_version
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(POLL_SECONDS)
+            if file_state(self.filename) == self.state:
+                continue
+            try:
+                await self.reload()
+            except Exception as e:
+                # likely caught part way through a write, the next poll retries
+                print(f"Reload of {self.filename} failed: {e}")
+                continue
+            print(f"Reloaded {self.filename}")
+
+    async def run(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port, backlog = 1024)
+        watcher = asyncio.create_task(self.watch())
+        print(f"Serving {self.filename} on http://{host}:{server.sockets[0].getsockname()[1]}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+def response_bytes(status, headers, body, send_body = True):
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT[status]}"]
+    if status != 304:
+        lines.append("Content-Type: application/json")
+        lines.append(f"Content-Length: {len(body)}")
+    lines.extend(f"{key}: {value}" for key, value in headers.items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (body if send_body and status != 304 else b"")
+
+def serve(filename, load, game_tree = None, host = "127.0.0.1", port = 8080):
+    try:
+        asyncio.run(Service(filename, load, game_tree).run(host, port))
+    except KeyboardInterrupt:
+        pass
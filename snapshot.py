@@ -0,0 +1,266 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from parse_game import RouteStub, Route, Branch, Choice, Death, Event, Tree, parse_names
+from sorted_days import SortedEvents, SortedDeaths
+from merkle import subtree_hash
+from traverse import preorder
+
+# A snapshot is a flat binary copy of a parsed tree kept next to its source
+# as <source>.snap. Every route, choice, death and event is a fixed-size
+# record pointing into a shared string table and day array, so loading maps
+# the file and builds routes only as they are reached, like the lazy loader.
+#
+# Layout: header, string offsets, string bytes, base route indices, route
+# records, choice records, death records, event records, days. Route records
+# end with the route's subtree hash, so stubs can report it unloaded.
+
+MAGIC = b"HLTSNAP\x00"
+VERSION = 2
+NONE = 0xFFFFFFFF
+NO_DAY = -0x80000000
+
+HEADER = struct.Struct("<8sIQq16sIIIIIIIIII")
+ROUTE = struct.Struct("<iIIIIIIIiII16s")
+ROUTE_HASH = ROUTE.size - 16
+CHOICE = struct.Struct("<III")
+DEATH = struct.Struct("<IiII")
+EVENT = struct.Struct("<III")
+INDEX = struct.Struct("<I")
+DAY = struct.Struct("<i")
+
+class SnapshotError(Exception):
+    pass
+
+def snapshot_path(filename):
+    return filename + ".snap"
+
+def source_digest(filename):
+    digest = hashlib.blake2b(digest_size = 16)
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+def source_state(filename):
+    # (size, mtime, digest) of the source, taken before it is parsed so an
+    # edit made during the parse leaves the snapshot looking stale, not fresh
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns, source_digest(filename)
+
+class Snapshot:
+    def __init__(self, buf):
+        self.buf = buf
+        if len(buf) < HEADER.size:
+            raise SnapshotError("snapshot is truncated")
+        (magic, version, self.source_size, self.source_mtime, self.source_hash, self.crc,
+            self.string_count, string_bytes, route_count, choice_count, death_count,
+            event_count, day_count, base_count, self.names_string) = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotError("not a snapshot of this version")
+
+        self.string_offsets = HEADER.size
+        self.string_data = self.string_offsets + (self.string_count + 1) * INDEX.size
+        self.base_offset = self.string_data + string_bytes
+        self.route_offset = self.base_offset + base_count * INDEX.size
+        self.choice_offset = self.route_offset + route_count * ROUTE.size
+        self.death_offset = self.choice_offset + choice_count * CHOICE.size
+        self.event_offset = self.death_offset + death_count * DEATH.size
+        self.day_offset = self.event_offset + event_count * EVENT.size
+        end = self.day_offset + day_count * DAY.size
+        if end != len(buf):
+            raise SnapshotError("snapshot size does not match its header")
+        self.counts = {"route": route_count, "choice": choice_count, "death": death_count, "event": event_count, "day": day_count, "base": base_count}
+        self.strings = {}
+
+    def check_body(self):
+        with memoryview(self.buf) as view:
+            if zlib.crc32(view[HEADER.size : ]) != self.crc:
+                raise SnapshotError("snapshot checksum mismatch")
+
+    def string(self, index):
+        if index == NONE:
+            return None
+        text = self.strings.get(index)
+        if text is None:
+            if index >= self.string_count:
+                raise SnapshotError(f"string {index} out of range")
+            start, = INDEX.unpack_from(self.buf, self.string_offsets + index * INDEX.size)
+            end, = INDEX.unpack_from(self.buf, self.string_offsets + (index + 1) * INDEX.size)
+            text = self.buf[self.string_data + start : self.string_data + end].decode()
+            self.strings[index] = text
+        return text
+
+    def days(self, start, count):
+        if start + count > self.counts["day"]:
+            raise SnapshotError("day range out of range")
+        return struct.unpack_from(f"<{count}i", self.buf, self.day_offset + start * DAY.size)
+
+    def route(self, index, parent):
+        if index >= self.counts["route"]:
+            raise SnapshotError(f"route {index} out of range")
+        (_, name, death_start, death_count, event_start, event_count, has_branch,
+            branch_name, branch_day, choice_start, choice_count, route_hash) = ROUTE.unpack_from(self.buf, self.route_offset + index * ROUTE.size)
+        route = Route(parent, self.string(name))
+        route.subtree_hash = route_hash
+
+        deaths = []
+        for i in range(death_start, death_start + death_count):
+            death_id, count, day_start, day_count = DEATH.unpack_from(self.buf, self.death_offset + i * DEATH.size)
+            deaths.append(Death(self.string(death_id), count, self.days(day_start, day_count)))
+        route.set_deaths(SortedDeaths(deaths))
+
+        events = []
+        for i in range(event_start, event_start + event_count):
+            event_name, day_start, day_count = EVENT.unpack_from(self.buf, self.event_offset + i * EVENT.size)
+            events.append(Event(self.string(event_name), self.days(day_start, day_count)))
+        route.set_events(SortedEvents(events))
+
+        if has_branch:
+            branch = Branch(route, self.string(branch_name), None if branch_day == NO_DAY else branch_day)
+            for i in range(choice_start, choice_start + choice_count):
+                direction, choice_name, child = CHOICE.unpack_from(self.buf, self.choice_offset + i * CHOICE.size)
+                choice = Choice(branch, self.string(direction), self.string(choice_name))
+                if child != NONE:
+                    choice.set_route(SnapshotRoute(self, child, route))
+        return route
+
+    def route_hash(self, index):
+        if index >= self.counts["route"]:
+            raise SnapshotError(f"route {index} out of range")
+        start = self.route_offset + index * ROUTE.size + ROUTE_HASH
+        return bytes(self.buf[start : start + 16])
+
+    def tree(self):
+        game_tree = Tree(parse_names(json.loads(self.string(self.names_string))))
+        for i in range(self.counts["base"]):
+            index, = INDEX.unpack_from(self.buf, self.base_offset + i * INDEX.size)
+            game_tree.add_route(self.route(index, None))
+        return game_tree
+
+class SnapshotRoute(RouteStub):
+    __slots__ = ("snapshot", "index")
+
+    def __init__(self, snapshot, index, parent):
+        super().__init__(parent)
+        self.snapshot = snapshot
+        self.index = index
+
+    def materialize(self):
+        return self.snapshot.route(self.index, self.parent)
+
+    def known_hash(self):
+        return self.snapshot.route_hash(self.index)
+
+MTIME_OFFSET = 20
+
+def source_matches(snapshot, filename):
+    stat = os.stat(filename)
+    if stat.st_size != snapshot.source_size:
+        return False
+    if stat.st_mtime_ns == snapshot.source_mtime:
+        return True
+    # touched but possibly unchanged, only now is the content worth hashing
+    if source_digest(filename) != snapshot.source_hash:
+        return False
+    try:
+        with open(snapshot_path(filename), "r+b") as f:
+            f.seek(MTIME_OFFSET)
+            f.write(struct.pack("<q", stat.st_mtime_ns))
+    except OSError:
+        pass
+    return True
+
+def load_snapshot(filename):
+    try:
+        with open(snapshot_path(filename), "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        snapshot = Snapshot(buf)
+        if not source_matches(snapshot, filename):
+            return None
+        snapshot.check_body()
+        return snapshot.tree()
+    except (OSError, ValueError, struct.error, UnicodeDecodeError, SnapshotError):
+        return None
+
+def encode_snapshot(game_tree):
+    strings = {}
+    string_parts = []
+    string_offsets = array("I", [0])
+
+    def string_index(text):
+        if text is None:
+            return NONE
+        index = strings.get(text)
+        if index is None:
+            index = strings[text] = len(string_parts)
+            data = text.encode()
+            string_parts.append(data)
+            string_offsets.append(string_offsets[-1] + len(data))
+        return index
+
+    names_string = string_index(json.dumps([name.as_dict() for name in game_tree.names.values()]))
+    routes = []
+    for base_route in game_tree.base_routes.values():
+        subtree_hash(base_route)
+        routes.extend(route for route, depth in preorder(base_route, Route.child_routes))
+    route_indices = {route: i for i, route in enumerate(routes)}
+    base_indices = array("I", (route_indices[route] for route in game_tree.base_routes.values()))
+
+    route_records = []
+    choice_records = []
+    death_records = []
+    event_records = []
+    days = array("i")
+
+    def add_days(values):
+        start = len(days)
+        days.extend(values)
+        return start, len(values)
+
+    for route in routes:
+        death_start = len(death_records)
+        for death in route.deaths.values():
+            death_records.append(DEATH.pack(string_index(death.id), death.count, *add_days(death.days)))
+        event_start = len(event_records)
+        for event in route.events:
+            event_records.append(EVENT.pack(string_index(event.name), *add_days(event.days)))
+        choice_start = len(choice_records)
+        branch = route.branch
+        if branch:
+            for choice in branch.choices:
+                child = route_indices[choice.route] if choice.route else NONE
+                choice_records.append(CHOICE.pack(string_index(choice.direction), string_index(choice.name), child))
+        parent = route_indices.get(route.parent, -1) if route.parent else -1
+        route_records.append(ROUTE.pack(parent, string_index(route.name), death_start, len(route.deaths),
+            event_start, len(route.events), 1 if branch else 0, string_index(branch.name) if branch else NONE,
+            (NO_DAY if branch.day is None else branch.day) if branch else 0, choice_start, len(choice_records) - choice_start, route.subtree_hash))
+
+    body = b"".join([string_offsets.tobytes(), b"".join(string_parts), base_indices.tobytes(), b"".join(route_records),
+        b"".join(choice_records), b"".join(death_records), b"".join(event_records), days.tobytes()])
+    counts = (len(string_parts), string_offsets[-1], len(routes), len(choice_records), len(death_records), len(event_records), len(days), len(base_indices), names_string)
+    return body, counts
+
+def write_snapshot(filename, game_tree, source):
+    # source is the source_state the tree was parsed from
+    try:
+        body, counts = encode_snapshot(game_tree)
+    except (struct.error, OverflowError, TypeError): #values that don't fit the fixed-size records
+        return
+    header = HEADER.pack(MAGIC, VERSION, *source, zlib.crc32(body), *counts)
+    path = snapshot_path(filename)
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(header)
+            f.write(body)
+        os.replace(temp_path, path)
+    except OSError: #the cache is optional, a read-only directory just means no snapshot
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
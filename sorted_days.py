@@ -0,0 +1,119 @@
+from bisect import bisect_left, bisect_right
+from utils import day_key
+
+# A route's events and deaths stay ordered by first day, so adding one is a
+# binary search instead of a resort of the whole list. Items are replaced
+# rather than edited in place, since a shared load can put one on many routes.
+# A list is marked shared while something besides its route holds it, a
+# shared load or an undo version, and is then copied before a change.
+#
+# Range queries go through a DayIndex of every (day, item) pair. Days are
+# separate values rather than spans, so this answers "anything on days
+# 10-14" exactly. It is built on the first query and dropped on any change.
+
+class DayIndex:
+    __slots__ = ("days", "items")
+
+    def __init__(self, items):
+        pairs = sorted((day, i) for i, item in enumerate(items) for day in item.days)
+        self.days = [day for day, i in pairs]
+        self.items = [items[i] for day, i in pairs]
+
+    def between(self, first, last):
+        start = bisect_left(self.days, first)
+        end = bisect_right(self.days, last)
+        return list(dict.fromkeys(self.items[start : end]))
+
+def insert_by_day(items, item):
+    items.insert(bisect_right(items, day_key(item), key = day_key), item)
+
+class SortedEvents(list):
+    __slots__ = ("_day_index", "shared")
+
+    def __init__(self, events = ()):
+        super().__init__(events)
+        if len(self) > 1:
+            self.sort(key = day_key)
+        self._day_index = None
+        self.shared = False
+
+    def add(self, event):
+        insert_by_day(self, event)
+        self._day_index = None
+
+    def copy(self):
+        events = SortedEvents()
+        events.extend(self)
+        return events
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._day_index = None
+
+    def between(self, first, last):
+        if self._day_index is None:
+            self._day_index = DayIndex(self)
+        return self._day_index.between(first, last)
+
+class SortedDeaths:
+    # reads like the {id: death} dict it replaces, iterating in day order
+    __slots__ = ("by_id", "order", "_day_index", "shared")
+
+    def __init__(self, deaths = ()):
+        deaths = sorted(deaths, key = day_key)
+        self.by_id = {death.id: death for death in deaths}
+        self.order = deaths if len(self.by_id) == len(deaths) else list(self.by_id.values())
+        self._day_index = None
+        self.shared = False
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, id):
+        return id in self.by_id
+
+    def __getitem__(self, id):
+        return self.by_id[id]
+
+    def __setitem__(self, id, death):
+        if id in self.by_id:
+            self.order.remove(self.by_id.pop(id))
+        self.add(death)
+
+    def __delitem__(self, id):
+        self.order.remove(self.by_id.pop(id))
+        self._day_index = None
+
+    def __iter__(self):
+        return (death.id for death in self.order)
+
+    def get(self, id, default = None):
+        return self.by_id.get(id, default)
+
+    def keys(self):
+        return [death.id for death in self.order]
+
+    def values(self):
+        return iter(self.order)
+
+    def items(self):
+        return ((death.id, death) for death in self.order)
+
+    def add(self, death):
+        # a death for an id already present replaces it, as dict assignment did
+        if death.id in self.by_id:
+            self.order.remove(self.by_id.pop(death.id))
+        insert_by_day(self.order, death)
+        self.by_id[death.id] = death
+        self._day_index = None
+
+    def copy(self):
+        deaths = SortedDeaths()
+        deaths.by_id = dict(self.by_id)
+        deaths.order = list(self.order)
+        return deaths
+
+    def between(self, first, last):
+        if self._day_index is None:
+            self._day_index = DayIndex(self.order)
+        return self._day_index.between(first, last)
@@ -0,0 +1,258 @@
+import os
+import sqlite3
+from parse_game import RouteStub, Route, Branch, Choice, Death, Event, Name, Tree
+from sorted_days import SortedEvents, SortedDeaths
+from edit_ops import NAME_FIELDS, NAME_OPS, character_id, find_route, keep_history
+
+# The tree as normalized SQLite tables instead of one JSON document. Every
+# route is a row with a link to its parent; its branch, choices, deaths and
+# events hang off it in their own tables, and days get a row each so they
+# can be indexed. seq columns keep everything in the order the JSON has it.
+#
+# Loading reads the names and base routes only. The routes behind choices
+# stay as SqliteRoute stubs until something reads them, then come in one
+# at a time. A Store that is a listener on its tree writes each applied op
+# back as one transaction touching only the edited route's own rows, so an
+# edit costs the size of the route, not of the file.
+#
+# A removed choice only loses its choice row; its subtree stays until the
+# store is closed, so undo can link it back.
+#
+# Only a store opened for edits switches the file to WAL, so readers such as
+# serve are not locked out while it writes. A load that is only read leaves
+# the file as it found it and is closed once the command is done with it.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS names (id TEXT PRIMARY KEY, seq INTEGER, "full" TEXT, "first" TEXT, "last" TEXT, "title" TEXT, "position" TEXT, "web_title" TEXT);
+CREATE TABLE IF NOT EXISTS routes (id INTEGER PRIMARY KEY, parent INTEGER REFERENCES routes, seq INTEGER, name TEXT);
+CREATE TABLE IF NOT EXISTS branches (route INTEGER PRIMARY KEY REFERENCES routes, name TEXT, day INTEGER);
+CREATE TABLE IF NOT EXISTS choices (route INTEGER REFERENCES routes, seq INTEGER, direction TEXT, name TEXT, child INTEGER REFERENCES routes, PRIMARY KEY (route, seq));
+CREATE TABLE IF NOT EXISTS deaths (id INTEGER PRIMARY KEY, route INTEGER REFERENCES routes, seq INTEGER, character TEXT, count INTEGER);
+CREATE TABLE IF NOT EXISTS death_days (death INTEGER REFERENCES deaths, seq INTEGER, day INTEGER);
+CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY, route INTEGER REFERENCES routes, seq INTEGER, name TEXT);
+CREATE TABLE IF NOT EXISTS event_days (event INTEGER REFERENCES events, seq INTEGER, day INTEGER);
+CREATE INDEX IF NOT EXISTS routes_parent ON routes (parent);
+CREATE INDEX IF NOT EXISTS deaths_route ON deaths (route);
+CREATE INDEX IF NOT EXISTS deaths_character ON deaths (character);
+CREATE INDEX IF NOT EXISTS death_days_death ON death_days (death);
+CREATE INDEX IF NOT EXISTS death_days_day ON death_days (day);
+CREATE INDEX IF NOT EXISTS events_route ON events (route);
+CREATE INDEX IF NOT EXISTS event_days_event ON event_days (event);
+CREATE INDEX IF NOT EXISTS event_days_day ON event_days (day);
+"""
+
+NAME_COLUMNS = ("id",) + NAME_FIELDS
+NAME_INSERT = f"INSERT INTO names (seq, {', '.join(f'"{column}"' for column in NAME_COLUMNS)}) VALUES (?{', ?' * len(NAME_COLUMNS)})"
+
+def name_row(seq, name):
+    return (seq,) + tuple(getattr(name, column) for column in NAME_COLUMNS)
+
+class SqliteRoute(RouteStub):
+    __slots__ = ("store", "id")
+
+    def __init__(self, store, id, parent):
+        super().__init__(parent)
+        self.store = store
+        self.id = id
+
+    def materialize(self):
+        return self.store.load_route(self.id, self.parent)
+
+class Store:
+    def __init__(self, filename):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.ids = {} #loaded route -> its row id
+        self.writing = False #whether open() has made this store its tree's listener
+
+    # reading
+
+    def load_tree(self):
+        game_tree = Tree({})
+        for row in self.connection.execute(f"SELECT {', '.join(f'"{column}"' for column in NAME_COLUMNS)} FROM names ORDER BY seq"):
+            game_tree.names[row[0]] = Name(**dict(zip(NAME_COLUMNS, row)))
+        for (id,) in self.connection.execute("SELECT id FROM routes WHERE parent IS NULL ORDER BY seq").fetchall():
+            route = self.load_route(id, None)
+            game_tree.base_routes[route.name] = route
+        game_tree.store = self
+        return game_tree
+
+    def load_route(self, id, parent):
+        execute = self.connection.execute
+        (name,) = execute("SELECT name FROM routes WHERE id = ?", (id,)).fetchone()
+        route = Route(parent, name)
+        self.ids[route] = id
+
+        deaths = {}
+        for death_id, character, count, day in execute("SELECT d.id, d.character, d.count, dd.day FROM deaths d LEFT JOIN death_days dd ON dd.death = d.id WHERE d.route = ? ORDER BY d.seq, dd.seq", (id,)):
+            days = deaths.setdefault(death_id, (character, count, []))[2]
+            if day is not None:
+                days.append(day)
+        route.set_deaths(SortedDeaths(Death(*death) for death in deaths.values()))
+        events = {}
+        for event_id, event_name, day in execute("SELECT e.id, e.name, ed.day FROM events e LEFT JOIN event_days ed ON ed.event = e.id WHERE e.route = ? ORDER BY e.seq, ed.seq", (id,)):
+            days = events.setdefault(event_id, (event_name, []))[1]
+            if day is not None:
+                days.append(day)
+        route.set_events(SortedEvents(Event(*event) for event in events.values()))
+
+        row = execute("SELECT name, day FROM branches WHERE route = ?", (id,)).fetchone()
+        if row:
+            branch = Branch(route, *row)
+            for direction, choice_name, child in execute("SELECT direction, name, child FROM choices WHERE route = ? ORDER BY seq", (id,)):
+                choice = Choice(branch, direction, choice_name)
+                if child is not None:
+                    choice.set_route(SqliteRoute(self, child, route))
+        return route
+
+    # writing
+
+    def write_names(self, game_tree):
+        self.connection.execute("DELETE FROM names")
+        self.connection.executemany(NAME_INSERT, (name_row(seq, name) for seq, name in enumerate(game_tree.names.values())))
+
+    def write_tree(self, game_tree):
+        with self.connection:
+            self.write_names(game_tree)
+            for seq, route in enumerate(game_tree.base_routes.values()):
+                self.ids[route] = self.connection.execute("INSERT INTO routes (parent, seq, name) VALUES (NULL, ?, ?)", (seq, route.name)).lastrowid
+                self.fill_routes([route])
+
+    def fill_routes(self, routes):
+        # writes the rows under routes that already have a routes row, and
+        # goes on into any child route the store has not seen before
+        stack = list(routes)
+        while stack:
+            route = stack.pop()
+            self.write_fields(route)
+            stack.extend(self.write_branch(route))
+
+    def write_fields(self, route):
+        execute = self.connection.execute
+        id = self.ids[route]
+        for seq, death in enumerate(route.deaths.values()):
+            death_id = execute("INSERT INTO deaths (route, seq, character, count) VALUES (?, ?, ?, ?)", (id, seq, death.id, death.count)).lastrowid
+            self.connection.executemany("INSERT INTO death_days (death, seq, day) VALUES (?, ?, ?)", ((death_id, i, day) for i, day in enumerate(death.days)))
+        for seq, event in enumerate(route.events):
+            event_id = execute("INSERT INTO events (route, seq, name) VALUES (?, ?, ?)", (id, seq, event.name)).lastrowid
+            self.connection.executemany("INSERT INTO event_days (event, seq, day) VALUES (?, ?, ?)", ((event_id, i, day) for i, day in enumerate(event.days)))
+
+    def write_branch(self, route):
+        # returns the child routes that got a new routes row
+        execute = self.connection.execute
+        id = self.ids[route]
+        if not route.branch:
+            return []
+        execute("INSERT INTO branches (route, name, day) VALUES (?, ?, ?)", (id, route.branch.name, route.branch.day))
+        new_routes = []
+        for seq, choice in enumerate(route.branch.choices):
+            stub = choice.stub()
+            if isinstance(stub, SqliteRoute) and stub.store is self:
+                child = stub.id
+            elif choice.route is None:
+                child = None
+            elif choice.route in self.ids:
+                # back under a choice after an undo
+                child = self.ids[choice.route]
+                execute("UPDATE routes SET parent = ?, seq = ? WHERE id = ?", (id, seq, child))
+            else:
+                child = self.ids[choice.route] = execute("INSERT INTO routes (parent, seq, name) VALUES (?, ?, ?)", (id, seq, choice.route.name)).lastrowid
+                new_routes.append(choice.route)
+            execute("INSERT INTO choices (route, seq, direction, name, child) VALUES (?, ?, ?, ?, ?)", (id, seq, choice.direction, choice.name, child))
+        return new_routes
+
+    def clear_route(self, id):
+        execute = self.connection.execute
+        execute("DELETE FROM death_days WHERE death IN (SELECT id FROM deaths WHERE route = ?)", (id,))
+        execute("DELETE FROM deaths WHERE route = ?", (id,))
+        execute("DELETE FROM event_days WHERE event IN (SELECT id FROM events WHERE route = ?)", (id,))
+        execute("DELETE FROM events WHERE route = ?", (id,))
+        execute("DELETE FROM choices WHERE route = ?", (id,))
+        execute("DELETE FROM branches WHERE route = ?", (id,))
+
+    def sync_route(self, route):
+        # the route's own rows are rewritten, routes below it are untouched
+        id = self.ids[route]
+        self.clear_route(id)
+        self.connection.execute("UPDATE routes SET name = ? WHERE id = ?", (route.name, id))
+        self.fill_routes([route])
+
+    # as a tree listener, the way a Journal is for other files
+
+    def open(self, game_tree, filename):
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.writing = True
+        keep_history(game_tree)
+        game_tree.add_listener(self)
+        return game_tree
+
+    def op_applied(self, game_tree, op):
+        kind = op["op"]
+        with self.connection:
+            if kind in ("undo", "redo"):
+                history = game_tree.history
+                # the step just taken is on top of the other list now
+                entry_kind, target, before, after, stepped = (history.redo if kind == "undo" else history.undo)[-1]
+                if entry_kind == "route":
+                    self.sync_route(target)
+                else:
+                    self.sync_name(game_tree, target)
+            elif kind in NAME_OPS:
+                self.sync_name(game_tree, character_id(op["id"]))
+            else:
+                self.sync_route(find_route(game_tree, op["path"]))
+
+    def sync_name(self, game_tree, id):
+        name = game_tree.names.get(id)
+        self.connection.execute("DELETE FROM names WHERE id = ?", (id,))
+        if name is not None:
+            self.connection.execute(NAME_INSERT, name_row(list(game_tree.names).index(id), name))
+
+    def checkpoint(self, game_tree):
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def prune(self):
+        # drops routes no base route reaches any more
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TEMP TABLE reachable AS
+                    WITH RECURSIVE walk(id) AS (
+                        SELECT id FROM routes WHERE parent IS NULL
+                        UNION ALL SELECT c.child FROM choices c JOIN walk ON c.route = walk.id WHERE c.child IS NOT NULL)
+                    SELECT id FROM walk;
+                DELETE FROM death_days WHERE death IN (SELECT id FROM deaths WHERE route NOT IN reachable);
+                DELETE FROM deaths WHERE route NOT IN reachable;
+                DELETE FROM event_days WHERE event IN (SELECT id FROM events WHERE route NOT IN reachable);
+                DELETE FROM events WHERE route NOT IN reachable;
+                DELETE FROM choices WHERE route NOT IN reachable;
+                DELETE FROM branches WHERE route NOT IN reachable;
+                DELETE FROM routes WHERE id NOT IN reachable;
+                DROP TABLE reachable;
+            """)
+
+    def close(self, game_tree = None):
+        # safe to call again, a read-only store just lets go of the file
+        if game_tree is not None and self in game_tree.listeners:
+            game_tree.remove_listener(self)
+        if self.writing:
+            self.prune()
+            self.checkpoint(game_tree)
+            self.writing = False
+        self.connection.close()
+
+def edits_in_place(game_tree, output):
+    # edits to the database a tree came from go straight into it
+    return game_tree.store is not None and os.path.exists(output) and os.path.samefile(output, game_tree.store.filename)
+
+def load_store(filename):
+    return Store(filename).load_tree()
+
+def write_store(filename, game_tree):
+    # a fresh database holding the whole tree
+    if os.path.exists(filename):
+        os.remove(filename)
+    store = Store(filename)
+    store.connection.executescript(SCHEMA)
+    store.write_tree(game_tree)
+    store.close()
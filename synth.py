@@ -0,0 +1,56 @@
+import json
+import random
+import sys
+
+# Seeded synthetic game data in the same layout as game_data.json, for
+# measuring how things scale past the one real file. Every route on a level
+# has the same number of choices, so a tree of depth d and branching b has
+# (b^(d+1) - 1) / (b - 1) routes. Days only move forward down the tree and
+# branches come after their route's events, so the data passes validate.
+
+DIRECTIONS = ["left", "right", "top"]
+
+def direction(i):
+    return DIRECTIONS[i] if i < len(DIRECTIONS) else f"choice{i}"
+
+def route_count(depth, branching):
+    return depth + 1 if branching == 1 else (branching ** (depth + 1) - 1) // (branching - 1)
+
+def generate(seed = 0, depth = 5, branching = 2, deaths = 3, events = 2, names = 20, days_per_route = 5):
+    rng = random.Random(seed)
+    ids = [f"character{i}" for i in range(names)]
+    data = {"names": [{"id": id, "full": f"Character {i}", "first": "Character", "last": str(i)} for i, id in enumerate(ids)], "routes": []}
+
+    def make_route(name, first_day):
+        last_day = first_day + days_per_route - 1
+        route_json = {"name": name}
+        route_json["deaths"] = [{"id": id, "count": rng.randint(1, 3), "days": sorted(rng.randint(first_day, last_day) for i in range(rng.randint(1, 2)))}
+            for id in rng.sample(ids, min(deaths, len(ids)))]
+        route_json["events"] = sorted(({"name": f"Event {rng.randrange(1000)} on {name}", "days": [rng.randint(first_day, last_day)]} for i in range(events)), key = lambda event: event["days"][0])
+        return route_json
+
+    # built top down with an explicit stack, deep trees never touch the
+    # recursion limit
+    root = make_route("Synthetic Chapter 00", 1)
+    data["routes"].append(root)
+    stack = [(root, 0, 1)]
+    while stack:
+        route_json, level, first_day = stack.pop()
+        if level == depth:
+            continue
+        branch_day = first_day + days_per_route - 1
+        choices = []
+        for i in range(branching):
+            child = make_route(f"{route_json['name']} {direction(i).upper()} BRANCH", branch_day + 1)
+            choices.append({"direction": direction(i), "name": f"Option {i}", "route": child})
+            stack.append((child, level + 1, branch_day + 1))
+        route_json["branch"] = {"name": f"Decision {level}", "day": branch_day, "choices": choices}
+    return data
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} output_json [seed] [depth] [branching] [deaths] [events] [names]")
+        sys.exit(1)
+    options = [int(arg) for arg in sys.argv[2 : 8]]
+    with open(sys.argv[1], "w") as f:
+        json.dump(generate(*options), f, indent = 2)
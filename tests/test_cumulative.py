@@ -0,0 +1,39 @@
+from parse_game import parse_game_data
+from cumulative import cumulative_deaths
+
+NAMES = [{"id": "a", "full": "A"}, {"id": "b", "full": "B"}]
+
+def chain(depth, deaths):
+    # deaths(level) gives the deaths on the route at that level
+    route_json = {"name": f"Route {depth}", "deaths": deaths(depth)}
+    for level in range(depth - 1, -1, -1):
+        route_json = {"name": f"Route {level}", "deaths": deaths(level), "branch": {"name": "B", "day": level, "choices": [
+            {"direction": "left", "name": "Next", "route": route_json}]}}
+    return parse_game_data({"names": NAMES, "routes": [route_json]}).base_routes["Route 0"]
+
+def routes_down(route):
+    routes = [route]
+    while route.branch:
+        route = route.branch.choices[0].route
+        routes.append(route)
+    return routes
+
+def test_totals_match_a_plain_sum():
+    deaths = lambda level: [{"id": "a", "count": 1, "days": [level]}] + ([{"id": "b", "count": 2, "days": []}] if level % 3 == 0 else [])
+    for level, route in enumerate(routes_down(chain(30, deaths))):
+        totals = cumulative_deaths(route)
+        assert totals["a"].count == level + 1
+        assert list(totals["a"].days) == list(range(level + 1))
+        assert totals["b"].count == 2 * (level // 3 + 1)
+        assert list(totals["b"].days) == []
+
+def test_deep_chain_keeps_one_tuple():
+    routes = routes_down(chain(2000, lambda level: [{"id": "a", "count": 1, "days": [level]}]))
+    deepest = cumulative_deaths(routes[-1])["a"]
+    assert list(deepest.days) == list(range(2001))
+    assert all(cumulative_deaths(route)["a"]._days is None for route in routes[ : -1])
+
+def test_entries_without_days_share_their_parents_tuple():
+    routes = routes_down(chain(5, lambda level: [{"id": "a", "count": 1, "days": [7] if level == 0 else []}]))
+    top = cumulative_deaths(routes[0])["a"].days
+    assert all(cumulative_deaths(route)["a"].days is top for route in routes)
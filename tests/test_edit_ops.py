@@ -0,0 +1,139 @@
+import io
+import json
+import os
+import random
+import pytest
+from parse_game import parse_game_data, load_game_data, save_tree
+from print_game import print_tree
+from edit_ops import OpError, apply_op, apply_ops, keep_history, route_path
+from traverse import preorder
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "game_data.json")
+
+def small_tree():
+    return parse_game_data({
+        "names": [{"id": "hiruko", "full": "Hiruko Shizuhara"}],
+        "routes": [{"name": "Start", "deaths": [{"id": "hiruko", "count": 1, "days": [3]}]}],
+    })
+
+def snapshot(game_tree):
+    return json.dumps(game_tree.as_dict())
+
+def test_add_branch_with_bad_choice_changes_nothing():
+    game_tree = small_tree()
+    before = snapshot(game_tree)
+    op = {"op": "add_branch", "path": [0], "name": "Pick", "day": 4, "choices": [
+        {"direction": "Left ", "name": "Go"},
+        {"direction": 7, "name": "Stay"},
+    ]}
+    with pytest.raises(OpError):
+        apply_op(game_tree, op)
+    assert game_tree.base_routes["Start"].branch is None
+    assert snapshot(game_tree) == before
+
+def test_add_branch_normalizes_directions():
+    game_tree = small_tree()
+    apply_op(game_tree, {"op": "add_branch", "path": [0], "name": "Pick", "day": 4, "choices": [{"direction": " Left", "name": "Go"}]})
+    choice = game_tree.base_routes["Start"].branch.choices[0]
+    assert choice.direction == "left"
+    assert game_tree.index.child(game_tree.base_routes["Start"], "left") is choice.route
+
+def test_mixed_case_ids():
+    game_tree = small_tree()
+    keep_history(game_tree)
+    apply_op(game_tree, {"op": "add_name", "id": "NewGuy"})
+    apply_op(game_tree, {"op": "set_name", "id": "NEWGUY", "field": "full", "value": "New Guy"})
+    apply_op(game_tree, {"op": "add_death", "path": [0], "death": {"id": "newGuy", "count": 1, "days": [5]}})
+    apply_op(game_tree, {"op": "add_death", "path": [0], "death": {"id": "Hiruko", "count": 2, "days": [6]}})
+    assert list(game_tree.names) == ["hiruko", "newguy"]
+    deaths = game_tree.base_routes["Start"].deaths
+    assert deaths["newguy"].id == "newguy" and deaths["hiruko"].count == 2
+    out = io.StringIO()
+    print_tree(game_tree, "text", out)
+    assert "New Guy died 1 time(s)" in out.getvalue()
+
+    with pytest.raises(OpError):
+        apply_op(game_tree, {"op": "add_name", "id": "HIRUKO"})
+    apply_op(game_tree, {"op": "remove_death", "path": [0], "id": "NewGuy"})
+    assert "newguy" not in game_tree.base_routes["Start"].deaths
+    for i in range(3):
+        apply_op(game_tree, {"op": "undo"})
+    apply_op(game_tree, {"op": "undo"})
+    assert game_tree.names["newguy"].full is None
+    apply_op(game_tree, {"op": "undo"})
+    assert "newguy" not in game_tree.names
+
+def test_apply_ops_reports_rejected_lines(tmp_path):
+    game_tree = small_tree()
+    lines = [
+        '{"op": "set_title", "path": [0], "name": "Opening"}',
+        "",
+        "# a comment",
+        '{"op": "add_death", "path": [0], "death": {"id": "nobody", "count": 1, "days": [1]}}',
+        "{not json",
+        '{"op": "fly", "path": [0]}',
+        '{"op": "add_event", "path": [0]}',
+        '{"op": "add_event", "path": [0], "event": {"name": "Arrival", "days": [1]}}',
+    ]
+    applied, errors = apply_ops(game_tree, lines)
+    assert applied == 2
+    assert [line_no for line_no, error in errors] == [4, 5, 6, 7]
+    assert "nobody" in errors[0][1]
+
+    route = game_tree.base_routes["Start"]
+    assert route.name == "Opening"
+    assert [event.name for event in route.events] == ["Arrival"]
+    assert list(route.deaths) == ["hiruko"]
+    filename = str(tmp_path / "out.json")
+    save_tree(filename, game_tree)
+    assert snapshot(load_game_data(filename)) == snapshot(game_tree)
+
+def random_op(game_tree, rng, i):
+    routes = [route for base_route in game_tree.base_routes.values() for route, depth in preorder(base_route, lambda node: node.child_routes())]
+    route = rng.choice(routes)
+    path = route_path(game_tree, route)
+    kind = rng.randrange(8)
+    if kind == 0:
+        return {"op": "add_death", "path": path, "death": {"id": rng.choice(list(game_tree.names)), "count": 1, "days": [rng.randrange(50)]}}
+    if kind == 1 and route.deaths:
+        return {"op": "remove_death", "path": path, "id": rng.choice(list(route.deaths))}
+    if kind == 2:
+        return {"op": "add_event", "path": path, "event": {"name": f"Event {i}", "days": [rng.randrange(50)]}}
+    if kind == 3 and route.events:
+        return {"op": "remove_event", "path": path, "index": rng.randrange(len(route.events))}
+    if kind == 4 and not route.branch:
+        return {"op": "add_branch", "path": path, "name": f"Branch {i}", "day": i, "choices": [{"direction": "left", "name": "L"}, {"direction": "right", "name": "R"}]}
+    if kind == 5 and route.branch and len(route.branch.choices) > 1 and rng.random() < 0.3:
+        return {"op": "remove_choice", "path": path, "index": rng.randrange(len(route.branch.choices))}
+    if kind == 6:
+        return {"op": "set_name", "id": rng.choice(list(game_tree.names)), "field": "full", "value": f"Name {i}"}
+    return {"op": "set_title", "path": path, "name": f"Title {i}"}
+
+@pytest.mark.parametrize("share", [False, True])
+def test_undo_redo_round_trip(share):
+    rng = random.Random(17)
+    game_tree = load_game_data(SOURCE, share = share)
+    keep_history(game_tree)
+    states = [snapshot(game_tree)]
+    for i in range(300):
+        apply_op(game_tree, random_op(game_tree, rng, i))
+        states.append(snapshot(game_tree))
+    for state in reversed(states[ : -1]):
+        apply_op(game_tree, {"op": "undo"})
+        assert snapshot(game_tree) == state
+    with pytest.raises(OpError):
+        apply_op(game_tree, {"op": "undo"})
+    for state in states[1 : ]:
+        apply_op(game_tree, {"op": "redo"})
+        assert snapshot(game_tree) == state
+
+def test_new_op_clears_redo():
+    game_tree = small_tree()
+    keep_history(game_tree)
+    apply_op(game_tree, {"op": "set_title", "path": [0], "name": "One"})
+    apply_op(game_tree, {"op": "undo"})
+    apply_op(game_tree, {"op": "set_title", "path": [0], "name": "Two"})
+    with pytest.raises(OpError):
+        apply_op(game_tree, {"op": "redo"})
+    apply_op(game_tree, {"op": "undo"})
+    assert game_tree.base_routes["Start"].name == "Start"
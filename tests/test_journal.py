@@ -0,0 +1,83 @@
+import os
+import shutil
+from parse_game import load_game_data
+from edit_ops import apply_op
+import journal as journal_module
+from journal import Journal, journal_path, read_journal
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "game_data.json")
+
+def start_session(tmp_path, source = SOURCE):
+    output = str(tmp_path / "out.json")
+    journal = Journal(output, sync = False)
+    return output, journal, journal.open(load_game_data(source), source)
+
+def crash(journal):
+    # the process goes away without saving or removing the journal
+    os.close(journal.fd)
+    journal.fd = None
+
+def title_op(name):
+    return {"op": "set_title", "path": [0], "name": name}
+
+def first_title(game_tree):
+    return next(iter(game_tree.base_routes.values())).name
+
+def test_journal_from_another_source_is_set_aside(tmp_path, capsys):
+    other = str(tmp_path / "other.json")
+    shutil.copy(SOURCE, other)
+    output, journal, game_tree = start_session(tmp_path, other)
+    apply_op(game_tree, title_op("From other"))
+    crash(journal)
+
+    resumed = Journal(output, sync = False).open(load_game_data(SOURCE), SOURCE)
+    assert first_title(resumed) != "From other"
+    assert "was started from" in capsys.readouterr().out
+    assert os.path.exists(journal_path(output) + ".old")
+    assert read_journal(journal_path(output))[0]["base"] == os.path.abspath(SOURCE)
+
+def test_resume_after_crash(tmp_path):
+    output, journal, game_tree = start_session(tmp_path)
+    for name in ("One", "Two", "Three"):
+        apply_op(game_tree, title_op(name))
+    apply_op(game_tree, {"op": "undo"})
+    crash(journal)
+
+    journal = Journal(output, sync = False)
+    resumed = journal.open(load_game_data(SOURCE), SOURCE)
+    assert first_title(resumed) == "Two"
+    # the replayed steps are in the history again
+    apply_op(resumed, {"op": "redo"})
+    assert first_title(resumed) == "Three"
+    journal.close(resumed)
+    assert not os.path.exists(journal_path(output))
+    assert first_title(load_game_data(output)) == "Three"
+
+def test_truncated_journal_line_is_dropped(tmp_path):
+    output, journal, game_tree = start_session(tmp_path)
+    apply_op(game_tree, title_op("One"))
+    apply_op(game_tree, title_op("Two"))
+    crash(journal)
+    with open(journal_path(output), "rb+") as f:
+        data = f.read()
+        f.seek(0)
+        f.truncate()
+        # the last op was cut off part way through being written
+        f.write(data[ : -10])
+
+    resumed = Journal(output, sync = False).open(load_game_data(SOURCE), SOURCE)
+    assert first_title(resumed) == "One"
+
+def test_resume_after_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(journal_module, "COMPACT_EVERY", 5)
+    output, journal, game_tree = start_session(tmp_path)
+    for i in range(12):
+        apply_op(game_tree, title_op(f"Title {i}"))
+    journal.wait()
+    assert read_journal(journal_path(output))[0]["base"] == os.path.abspath(output)
+    assert first_title(load_game_data(output)) != first_title(load_game_data(SOURCE))
+    crash(journal)
+
+    resumed = Journal(output, sync = False).open(load_game_data(SOURCE), SOURCE)
+    assert first_title(resumed) == "Title 11"
+    assert len(resumed.base_routes) == len(load_game_data(SOURCE).base_routes)
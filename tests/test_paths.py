@@ -0,0 +1,22 @@
+import pytest
+import synth
+from benchmark import build_chain, path_stats_mismatches
+from parse_game import parse_game_data, load_game_data
+from paths import path_stats
+from test_edit_ops import SOURCE
+
+@pytest.mark.parametrize("depth, branching", [(0, 2), (4, 1), (5, 2), (4, 3)])
+def test_path_stats_match_enumeration(depth, branching):
+    game_tree = parse_game_data(synth.generate(seed = depth * 10 + branching, depth = depth, branching = branching))
+    for base_route in game_tree.base_routes.values():
+        assert path_stats_mismatches(base_route) == []
+
+def test_path_stats_match_enumeration_on_game_data():
+    for base_route in load_game_data(SOURCE).base_routes.values():
+        assert path_stats_mismatches(base_route) == []
+
+def test_deep_chain_paths():
+    game_tree = parse_game_data({"names": [{"id": "a", "full": "A"}], "routes": [build_chain(20000)]})
+    stats = path_stats(game_tree.base_routes["Route 0"])
+    assert stats.paths == 20001
+    assert (stats.deaths["a"].least, stats.deaths["a"].most, stats.deaths["a"].total) == (0, 1, 1)
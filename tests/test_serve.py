@@ -0,0 +1,59 @@
+import asyncio
+import json
+import os
+from parse_game import load_game_data
+from serve import Service, file_state
+
+def write_source(filename, full):
+    with open(filename, "w") as f:
+        json.dump({
+            "names": [{"id": "hiruko", "full": full}],
+            "routes": [{"name": "Start", "deaths": [{"id": "hiruko", "count": 1, "days": [3]}]}],
+        }, f)
+
+def make_service(tmp_path):
+    filename = str(tmp_path / "tree.json")
+    write_source(filename, "Hiruko Shizuhara")
+    return filename, Service(filename, lambda: load_game_data(filename))
+
+def test_etag_revalidates(tmp_path):
+    filename, service = make_service(tmp_path)
+    status, headers, body = service.respond("GET", "/deaths/0", {})
+    assert status == 200
+    assert json.loads(body)["deaths"][0]["name"] == "Hiruko Shizuhara"
+    status, headers, body = service.respond("GET", "/deaths/0", {"if-none-match": headers["ETag"]})
+    assert status == 304 and body == b""
+
+def test_unknown_route_is_404(tmp_path):
+    filename, service = make_service(tmp_path)
+    assert service.respond("GET", "/routes/0/²", {})[0] == 404
+    assert service.respond("GET", "/nothing", {})[0] == 404
+
+def test_name_change_changes_deaths_etag(tmp_path):
+    filename, service = make_service(tmp_path)
+    etag = service.respond("GET", "/deaths/0", {})[1]["ETag"]
+    write_source(filename, "Hiruko S.")
+    asyncio.run(service.reload())
+    status, headers, body = service.respond("GET", "/deaths/0", {"if-none-match": etag})
+    assert status == 200 and headers["ETag"] != etag
+    assert json.loads(body)["deaths"][0]["name"] == "Hiruko S."
+
+def test_write_during_reload_is_seen_next_poll(tmp_path):
+    filename, service = make_service(tmp_path)
+    load = service.load
+
+    def load_then_write():
+        game_tree = load()
+        write_source(filename, "Hiruko S.")
+        os.utime(filename, ns = (0, 0))
+        return game_tree
+
+    write_source(filename, "Hiruko Shizuhara ")
+    service.load = load_then_write
+    asyncio.run(service.reload())
+    # the tree is from before the write, so the next poll must still differ
+    assert service.state != file_state(filename)
+    service.load = load
+    asyncio.run(service.reload())
+    assert service.state == file_state(filename)
+    assert json.loads(service.respond("GET", "/deaths/0", {})[2])["deaths"][0]["name"] == "Hiruko S."
@@ -0,0 +1,37 @@
+import json
+import os
+import shutil
+import parse_game
+from parse_game import load_game_data
+from snapshot import snapshot_path
+from test_edit_ops import SOURCE
+
+def snapshot(game_tree):
+    return json.dumps(game_tree.as_dict())
+
+def test_snapshot_round_trip(tmp_path):
+    filename = str(tmp_path / "tree.json")
+    shutil.copy(SOURCE, filename)
+    parsed = load_game_data(filename, cache = True)
+    assert os.path.exists(snapshot_path(filename))
+    assert snapshot(load_game_data(filename, cache = True)) == snapshot(parsed) == snapshot(load_game_data(SOURCE))
+
+def test_edit_during_parse_is_not_cached_as_fresh(tmp_path, monkeypatch):
+    filename = str(tmp_path / "tree.json")
+    shutil.copy(SOURCE, filename)
+    with open(filename) as f:
+        data = json.load(f)
+    parse = parse_game.parse_game_data
+
+    def parse_then_edit(data_json, share = False):
+        game_tree = parse(data_json, share)
+        edited = dict(data, routes = [dict(data["routes"][0], name = "Edited meanwhile")] + data["routes"][1 : ])
+        with open(filename, "w") as f:
+            json.dump(edited, f, indent = 2)
+        return game_tree
+
+    monkeypatch.setattr(parse_game, "parse_game_data", parse_then_edit)
+    load_game_data(filename, cache = True)
+    monkeypatch.setattr(parse_game, "parse_game_data", parse)
+    game_tree = load_game_data(filename, cache = True)
+    assert next(iter(game_tree.base_routes.values())).name == "Edited meanwhile"
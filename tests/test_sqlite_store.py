@@ -0,0 +1,47 @@
+import json
+import os
+import random
+from parse_game import load_game_data, save_tree
+from edit_ops import apply_op
+from test_edit_ops import SOURCE, random_op
+
+def snapshot(game_tree):
+    return json.dumps(game_tree.as_dict())
+
+def saved_database(tmp_path):
+    database = str(tmp_path / "tree.db")
+    save_tree(database, load_game_data(SOURCE), "sqlite")
+    return database
+
+def test_round_trip(tmp_path):
+    database = saved_database(tmp_path)
+    game_tree = load_game_data(database)
+    assert snapshot(game_tree) == snapshot(load_game_data(SOURCE))
+    game_tree.store.close(game_tree)
+
+def test_read_only_load_leaves_file_alone(tmp_path):
+    database = saved_database(tmp_path)
+    with open(database, "rb") as f:
+        before = f.read()
+    game_tree = load_game_data(database)
+    snapshot(game_tree)
+    game_tree.store.close(game_tree)
+    with open(database, "rb") as f:
+        assert f.read() == before
+    assert sorted(os.listdir(tmp_path)) == ["tree.db"]
+
+def test_edits_in_place(tmp_path):
+    database = saved_database(tmp_path)
+    game_tree = load_game_data(database)
+    game_tree.store.open(game_tree, database)
+    rng = random.Random(21)
+    for i in range(150):
+        apply_op(game_tree, random_op(game_tree, rng, i))
+    for i in range(20):
+        apply_op(game_tree, {"op": "undo"})
+    expected = snapshot(game_tree)
+    game_tree.store.close(game_tree)
+
+    reloaded = load_game_data(database)
+    assert snapshot(reloaded) == expected
+    reloaded.store.close(reloaded)
@@ -0,0 +1,65 @@
+from benchmark import build_chain, build_binary, recursive_walk, recursive_preorder, recursive_postorder
+from parse_game import parse_game_data, load_game_data, save_tree
+from print_game import print_routes
+from traverse import walk, preorder, postorder
+
+DEPTH = 20000
+NAMES = [{"id": "a", "full": "A"}]
+
+def chain_end(route):
+    # (levels followed, last route) down the first choice of every branch
+    levels = 0
+    while route.branch:
+        route = route.branch.choices[0].route
+        levels += 1
+    return levels, route
+
+def visits(traverse, root):
+    seen = []
+    traverse(root, lambda node, depth: seen.append(("enter", id(node), depth)), lambda node, depth: seen.append(("exit", id(node), depth)))
+    return seen
+
+def test_deep_chain_parses():
+    route = parse_game_data({"names": NAMES, "routes": [build_chain(DEPTH)]}).base_routes["Route 0"]
+    levels, last = chain_end(route)
+    assert levels == DEPTH
+    assert last.name == f"Route {DEPTH}"
+    assert last.deaths["a"].count == 1
+
+def test_deep_chain_prints(capsys):
+    game_tree = parse_game_data({"names": NAMES, "routes": [build_chain(DEPTH)]})
+    print_routes(game_tree.names, game_tree.base_routes["Route 0"])
+    out = capsys.readouterr().out
+    assert f"Route {DEPTH}" in out
+    assert f"Leaf {DEPTH - 1}" in out
+    assert out.count("Continue") == DEPTH
+
+def test_deep_chain_saves_and_loads(tmp_path):
+    game_tree = parse_game_data({"names": NAMES, "routes": [build_chain(DEPTH)]})
+    filename = str(tmp_path / "deep.json")
+    save_tree(filename, game_tree, format = "minified")
+    # json.load itself recurses, so only the lazy load can read it back
+    reloaded = load_game_data(filename, lazy = True)
+    levels, last = chain_end(reloaded.base_routes["Route 0"])
+    assert levels == DEPTH
+    assert last.name == f"Route {DEPTH}"
+    assert list(last.deaths["a"].days) == [DEPTH]
+    # nested dicts compare recursively too, so the round trip is checked on the saved bytes
+    save_tree(str(tmp_path / "again.json"), reloaded, format = "minified")
+    assert (tmp_path / "again.json").read_bytes() == (tmp_path / "deep.json").read_bytes()
+
+def test_walk_matches_recursion():
+    route = parse_game_data({"names": NAMES, "routes": [build_binary(6)]}).base_routes["Route 0"]
+    assert visits(walk, route) == visits(recursive_walk, route)
+    assert list(preorder(route)) == list(recursive_preorder(route))
+    assert list(postorder(route)) == list(recursive_postorder(route))
+
+def test_walk_deep_chain_depths():
+    route = parse_game_data({"names": NAMES, "routes": [build_chain(DEPTH)]}).base_routes["Route 0"]
+    deepest = max(depth for node, depth in preorder(route))
+    # route, branch and choice make three levels per step down the chain
+    assert deepest == DEPTH * 3
+    assert max(depth for node, depth in postorder(route)) == deepest
+    exits = []
+    walk(route, exit = lambda node, depth: exits.append(depth))
+    assert max(exits) == deepest and exits[-1] == 0
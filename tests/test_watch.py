@@ -0,0 +1,92 @@
+import io
+import json
+import os
+import pytest
+from parse_game import load_game_data
+from print_game import print_tree
+from watch import Watcher
+from test_edit_ops import SOURCE
+
+def full_display(filename):
+    out = io.StringIO()
+    print_tree(load_game_data(filename), "text", out)
+    return out.getvalue()
+
+def write(filename, data, tick):
+    with open(filename, "w") as f:
+        json.dump(data, f, indent = 2)
+    # a distinct mtime, so the stat always sees the write
+    os.utime(filename, ns = (tick * 10 ** 9, tick * 10 ** 9))
+
+@pytest.fixture
+def source(tmp_path):
+    with open(SOURCE) as f:
+        data = json.load(f)
+    filename = str(tmp_path / "tree.json")
+    write(filename, data, 1)
+    return filename, data
+
+def test_first_refresh_renders_everything(source):
+    filename, data = source
+    watcher = Watcher(filename)
+    assert watcher.refresh() == (len(data["routes"]), len(data["routes"]))
+    assert watcher.display() == full_display(filename)
+    assert watcher.refresh() is None
+
+def test_route_edit_renders_only_that_route(source):
+    filename, data = source
+    watcher = Watcher(filename)
+    watcher.refresh()
+    data["routes"][1]["name"] = "Edited title"
+    write(filename, data, 2)
+    assert watcher.refresh() == (1, len(data["routes"]))
+    assert watcher.display() == full_display(filename)
+
+    # a longer route shifts the ones after it
+    data["routes"][0]["events"] = data["routes"][0].get("events", []) + [{"name": "Added event", "days": [1]}]
+    write(filename, data, 3)
+    assert watcher.refresh() == (1, len(data["routes"]))
+    assert watcher.display() == full_display(filename)
+
+def test_moved_and_added_routes(source):
+    filename, data = source
+    watcher = Watcher(filename)
+    watcher.refresh()
+    data["routes"].reverse()
+    data["routes"].append({"name": "New route"})
+    write(filename, data, 2)
+    assert watcher.refresh()[1] == len(data["routes"])
+    assert watcher.display() == full_display(filename)
+
+def test_names_change_renders_everything(source):
+    filename, data = source
+    watcher = Watcher(filename)
+    watcher.refresh()
+    data["names"][0]["full"] = "Someone else"
+    write(filename, data, 2)
+    assert watcher.refresh() == (len(data["routes"]), len(data["routes"]))
+    assert watcher.display() == full_display(filename)
+
+def test_half_saved_file_then_recovers(source):
+    filename, data = source
+    watcher = Watcher(filename)
+    watcher.refresh()
+    before = watcher.display()
+    with open(filename, "r+") as f:
+        text = f.read()
+        f.seek(0)
+        f.truncate()
+        f.write(text[ : len(text) // 2])
+    os.utime(filename, ns = (2 * 10 ** 9, 2 * 10 ** 9))
+    with pytest.raises(ValueError):
+        watcher.refresh()
+    assert watcher.display() == before
+
+    data["routes"][0]["deaths"] = [{"id": "nobody", "count": 1, "days": [1]}]
+    write(filename, data, 3)
+    with pytest.raises(KeyError):
+        watcher.refresh()
+    del data["routes"][0]["deaths"]
+    write(filename, data, 4)
+    watcher.refresh()
+    assert watcher.display() == full_display(filename)
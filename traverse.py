@@ -0,0 +1,46 @@
+# Shared explicit-stack traversal, so tree depth is never bounded by the
+# interpreter's recursion limit.
+#
+# children(node) is only called after enter(node, depth) has run, so enter
+# may create the objects children() goes on to return. children() may also
+# be a generator, it is advanced one child at a time.
+
+def node_children(node):
+    return node.children()
+
+def walk(root, enter = None, exit = None, children = node_children):
+    if enter:
+        enter(root, 0)
+    nodes = [root]
+    stack = [iter(children(root))]
+    while stack:
+        for child in stack[-1]:
+            if enter:
+                enter(child, len(stack))
+            nodes.append(child)
+            stack.append(iter(children(child)))
+            break
+        else:
+            stack.pop()
+            node = nodes.pop()
+            if exit:
+                exit(node, len(stack))
+
+def preorder(root, children = node_children):
+    stack = [(root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        yield node, depth
+        stack.extend((child, depth + 1) for child in reversed(list(children(node))))
+
+def postorder(root, children = node_children):
+    nodes = [root]
+    stack = [iter(children(root))]
+    while stack:
+        for child in stack[-1]:
+            nodes.append(child)
+            stack.append(iter(children(child)))
+            break
+        else:
+            stack.pop()
+            yield nodes.pop(), len(stack)
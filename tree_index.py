@@ -0,0 +1,88 @@
+# Lookup tables over a whole tree, so the editor never has to walk it to find
+# a route. Routes are keyed by identity:
+#   titles:  route title -> routes with that title
+#   edges:   (parent route, direction) -> child route, (None, name) for base
+#            routes, so following any path costs one lookup per step
+#   parents: route -> the choice leading to it, None for base routes
+#
+# Building the index loads every route of a lazy tree, so Tree only builds
+# it the first time a lookup is needed; after that the editor keeps it in
+# step through add_route, remove_route and rename_route. Those are safe to call
+# on an index built after the change was made, they leave it as it is.
+
+class TreeIndex:
+    __slots__ = ("titles", "edges", "parents")
+
+    def __init__(self, game_tree):
+        self.titles = {}
+        self.edges = {}
+        self.parents = {}
+        for route in game_tree.base_routes.values():
+            self.add_route(route)
+
+    def edge(self, route, choice):
+        return (choice.branch.parent, choice.direction) if choice else (None, route.name)
+
+    def add_route(self, route, choice = None):
+        stack = [(route, choice)]
+        while stack:
+            route, choice = stack.pop()
+            if route in self.parents:
+                continue
+            self.titles.setdefault(route.name, []).append(route)
+            self.parents[route] = choice
+            self.edges.setdefault(self.edge(route, choice), route)
+            if route.branch:
+                stack.extend((child.route, child) for child in reversed(route.branch.choices) if child.route)
+
+    def remove_route(self, route):
+        stack = [route]
+        while stack:
+            route = stack.pop()
+            choice = self.parents.pop(route, None)
+            routes = self.titles.get(route.name)
+            if routes and route in routes:
+                routes.remove(route)
+                if not routes:
+                    del self.titles[route.name]
+            key = self.edge(route, choice)
+            if self.edges.get(key) is route:
+                del self.edges[key]
+            stack.extend(route.child_routes())
+
+    def rename_route(self, route, old_name):
+        routes = self.titles.get(old_name)
+        if routes and route in routes:
+            routes.remove(route)
+            if not routes:
+                del self.titles[old_name]
+        routes = self.titles.setdefault(route.name, [])
+        if route not in routes:
+            routes.append(route)
+        if self.parents.get(route) is None and self.edges.get((None, old_name)) is route:
+            del self.edges[(None, old_name)]
+            self.edges.setdefault((None, route.name), route)
+
+    def find_title(self, title):
+        return self.titles.get(title, [])
+
+    def child(self, route, direction):
+        return self.edges.get((route, direction))
+
+    def find_path(self, path):
+        route = None
+        for step in path:
+            route = self.edges.get((route, step))
+            if route is None:
+                return None
+        return route
+
+    def path(self, route):
+        steps = []
+        choice = self.parents.get(route)
+        while choice is not None:
+            steps.append(choice.direction)
+            route = choice.branch.parent
+            choice = self.parents.get(route)
+        steps.append(route.name)
+        return steps[ : : -1]
@@ -1,8 +1,47 @@
+import os
+
 def check_name_id_exists(game_tree, name_id):
-    for name in game_tree.names.values():
-        if name_id == name.id:
-            return True
-    return False
+    return name_id in game_tree.names
+
+def day_key(item):
+    # undated items sort with the -1 placeholder save writes for them
+    return item.days[0] if item.days else -1
 
 def sort_by_days(array):
-    return sorted(array, key = lambda item: item.days[0])
+    return sorted(array, key = day_key)
+
+
+class ChunkWriter:
+    # Collects small writes and hands them to the underlying stream in large
+    # chunks. The target is either a file object or a raw file descriptor.
+    def __init__(self, target, chunk_size = 1 << 16):
+        self.target = target
+        self.chunk_size = chunk_size
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.parts:
+            return
+        chunk = "".join(self.parts)
+        self.parts = []
+        self.size = 0
+        if isinstance(self.target, int):
+            data = chunk.encode()
+            while data:
+                written = os.write(self.target, data)
+                data = data[written : ]
+        else:
+            self.target.write(chunk)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
@@ -0,0 +1,123 @@
+import multiprocessing
+import os
+from edit_ops import find_route
+
+# Data checks over a whole tree. The tree is cut into units, single routes
+# near the top and whole subtrees below them, and the units are checked by a
+# pool of forked workers that share the parent's tree instead of being sent
+# a copy. Each problem carries its route's path of choice indexes, which
+# sorts in preorder, so merging by path gives the same report for any number
+# of workers. Without fork everything runs in this process.
+
+PLACEHOLDER = "[UNKNOWN]"
+UNITS_PER_JOB = 4
+
+worker_tree = None #the tree forked workers check
+
+def is_placeholder(text):
+    return not text or text == PLACEHOLDER
+
+def check_days(days, what, problems):
+    if not days or -1 in days:
+        problems.append(f"{what} has an unknown day (-1)")
+    known = [day for day in days if day != -1]
+    if any(day < 0 for day in known):
+        problems.append(f"{what} has a negative day: {list(days)}")
+    if known != sorted(known):
+        problems.append(f"{what} has days out of order: {list(days)}")
+
+def check_route(game_tree, route):
+    problems = []
+    if is_placeholder(route.name):
+        problems.append("route title is unknown")
+    for death in route.deaths.values():
+        what = f"death {death.id}"
+        if death.id not in game_tree.names:
+            problems.append(f"{what} names no known character")
+        if not death.count or death.count < 0:
+            problems.append(f"{what} has an unknown count ({death.count})")
+        check_days(death.days, what, problems)
+    last_event_day = -1
+    for i, event in enumerate(route.events):
+        what = f"event {i}"
+        if is_placeholder(event.name):
+            problems.append(f"{what} has an unknown description")
+        check_days(event.days, what, problems)
+        last_event_day = max([last_event_day] + list(event.days))
+
+    branch = route.branch
+    if branch:
+        if is_placeholder(branch.name):
+            problems.append("branch choice is unknown")
+        if not branch.day or branch.day < 0:
+            problems.append(f"branch has an unknown day ({branch.day})")
+        elif branch.day < last_event_day:
+            problems.append(f"branch on day {branch.day} comes before an event on day {last_event_day}")
+        seen = set()
+        for choice in branch.choices:
+            if choice.direction in seen:
+                problems.append(f"branch has more than one {choice.direction} choice")
+            seen.add(choice.direction)
+            if is_placeholder(choice.name):
+                problems.append(f"{choice.direction} choice label is unknown")
+    return problems
+
+def check_names(game_tree):
+    problems = []
+    for id, name in game_tree.names.items():
+        if is_placeholder(name.full):
+            problems.append(((), "names", f"{id} has no full name"))
+        for field in ("first", "last", "title", "position", "web_title"):
+            if getattr(name, field) == PLACEHOLDER:
+                problems.append(((), "names", f"{id} {field} is {PLACEHOLDER}"))
+    return problems
+
+def check_unit(unit):
+    # unit is (path, text path, whole subtree or just the route)
+    path, text, deep = unit
+    game_tree = worker_tree
+    problems = []
+    stack = [(find_route(game_tree, list(path)), path, text)]
+    while stack:
+        route, path, text = stack.pop()
+        problems.extend((path, text, problem) for problem in check_route(game_tree, route))
+        if deep and route.branch:
+            children = [(choice.route, path + (i,), f"{text} > {choice.direction}") for i, choice in enumerate(route.branch.choices) if choice.route]
+            stack.extend(reversed(children))
+    return problems
+
+def plan_units(game_tree, count):
+    # routes are taken off the top breadth first, each becoming a unit of
+    # its own, until the subtrees left below them are enough units
+    units = []
+    frontier = [((i,), route.name, route) for i, route in enumerate(game_tree.base_routes.values())]
+    while frontier and len(frontier) < count and len(units) < count * UNITS_PER_JOB:
+        path, text, route = frontier.pop(0)
+        units.append((path, text, False))
+        if route.branch:
+            frontier.extend((path + (i,), f"{text} > {choice.direction}", choice.route) for i, choice in enumerate(route.branch.choices) if choice.route)
+    units.extend((path, text, True) for path, text, route in frontier)
+    return units
+
+def validate_tree(game_tree, jobs = None):
+    global worker_tree
+    jobs = jobs or os.cpu_count() or 1
+    if "fork" not in multiprocessing.get_all_start_methods():
+        jobs = 1
+    units = plan_units(game_tree, jobs * UNITS_PER_JOB if jobs > 1 else 1)
+    worker_tree = game_tree
+    try:
+        if jobs > 1:
+            with multiprocessing.get_context("fork").Pool(jobs) as pool:
+                results = pool.map(check_unit, units)
+        else:
+            results = [check_unit(unit) for unit in units]
+    finally:
+        worker_tree = None
+    problems = [problem for result in results for problem in result]
+    problems.sort(key = lambda problem: problem[0])
+    return check_names(game_tree) + problems
+
+def write_problems(problems, out):
+    for path, text, problem in problems:
+        out.write(f"{text}: {problem}\n")
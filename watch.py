@@ -0,0 +1,239 @@
+import io
+import json
+import os
+import re
+import sys
+import time
+from parse_game import Tree, parse_route, parse_names, open_game_file
+from render import TextRenderer
+from traverse import walk
+
+# Keeps the display of a file up to date while it is being edited. The file
+# is stat'ed every poll and only read when that changes. The new text is
+# compared with the last one from both ends, which finds the one changed
+# stretch at memory speed, and only the base routes overlapping it are
+# decoded, parsed and rendered again. Every other base route keeps its
+# parsed Route and rendered text, and the positions of those after the
+# change are shifted by the change in length.
+#
+# When the change reaches outside the routes (the names, or the file's
+# layout) the whole file is decoded again instead, and base routes whose
+# text is the same as before are still reused; a names change renders them
+# again without parsing them. The display is the base routes' texts joined
+# up, exactly what display prints.
+
+POLL_SECONDS = 0.5
+# what a file saved half way through an edit can raise, besides bad JSON:
+# a route missing a field, or a death naming an id not in names yet
+MALFORMED = (ValueError, KeyError, TypeError, AttributeError)
+COMPARE_BLOCK = 1 << 16
+
+DECODER = json.JSONDecoder()
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+def skip_ws(text, pos):
+    return WHITESPACE.match(text, pos).end()
+
+def expect(text, pos, char):
+    if text[pos : pos + 1] != char:
+        raise ValueError(f"Expected {char} at offset {pos}")
+    return pos + 1
+
+def common_prefix(a, b, limit):
+    # compared a block at a time, then narrowed down inside the block that differs
+    pos = 0
+    while pos < limit:
+        end = min(pos + COMPARE_BLOCK, limit)
+        if a[pos : end] != b[pos : end]:
+            while a[pos] == b[pos]:
+                pos += 1
+            return pos
+        pos = end
+    return limit
+
+def common_suffix(a, b, limit):
+    length = 0
+    while length < limit:
+        size = min(COMPARE_BLOCK, limit - length)
+        if a[len(a) - length - size : len(a) - length] != b[len(b) - length - size : len(b) - length]:
+            while a[len(a) - length - 1] == b[len(b) - length - 1]:
+                length += 1
+            return length
+        length += size
+    return limit
+
+def scan_source(text):
+    # (names, (start, end) of the names value, [(start, end) of each base
+    # route], [each base route's JSON])
+    names, names_span, spans, routes_json = [], None, [], []
+    pos = skip_ws(text, expect(text, skip_ws(text, 0), "{"))
+    while text[pos : pos + 1] != "}":
+        key, pos = DECODER.raw_decode(text, pos)
+        pos = skip_ws(text, expect(text, skip_ws(text, pos), ":"))
+        if key == "routes":
+            pos = skip_ws(text, expect(text, pos, "["))
+            while text[pos : pos + 1] != "]":
+                route_json, end = DECODER.raw_decode(text, pos)
+                spans.append((pos, end))
+                routes_json.append(route_json)
+                pos = skip_ws(text, end)
+                if text[pos : pos + 1] != "]":
+                    pos = skip_ws(text, expect(text, pos, ","))
+            pos += 1
+        else:
+            value, end = DECODER.raw_decode(text, pos)
+            if key == "names":
+                names, names_span = value, (pos, end)
+            pos = end
+        pos = skip_ws(text, pos)
+        if text[pos : pos + 1] != "}":
+            pos = skip_ws(text, expect(text, pos, ","))
+    return names, names_span, spans, routes_json
+
+def rescan_change(old_text, text, names_span, spans):
+    # (first, last) of the old base routes replaced, and the new spans and
+    # JSON in their place, or None if the change reaches past the routes
+    limit = min(len(old_text), len(text))
+    prefix = common_prefix(old_text, text, limit)
+    suffix = common_suffix(old_text, text, limit - prefix)
+    old_end = len(old_text) - suffix
+    shift = len(text) - len(old_text)
+    if names_span and names_span[0] <= old_end and prefix <= names_span[1]:
+        return None
+    first = next((i for i, (start, end) in enumerate(spans) if end >= prefix), None)
+    if first is None:
+        return None
+    if spans[first][0] > prefix:
+        # changed between two routes, scanning starts at the one before
+        first -= 1
+        if first < 0:
+            return None
+    last = max(i for i, (start, end) in enumerate(spans) if start <= old_end)
+    next_start = spans[last + 1][0] + shift if last + 1 < len(spans) else None
+
+    new_spans, routes_json = [], []
+    pos = spans[first][0]
+    while True:
+        route_json, end = DECODER.raw_decode(text, pos)
+        new_spans.append((pos, end))
+        routes_json.append(route_json)
+        pos = skip_ws(text, end)
+        if text[pos : pos + 1] == "]":
+            # only the end of the routes if nothing after them changed
+            return (first, last, new_spans, routes_json) if next_start is None and pos >= len(text) - suffix else None
+        pos = skip_ws(text, expect(text, pos, ","))
+        if next_start is not None and pos >= next_start:
+            return (first, last, new_spans, routes_json) if pos == next_start else None
+
+def render_route(names, route):
+    out = io.StringIO()
+    renderer = TextRenderer(out, names)
+    renderer.begin_route(route)
+    walk(route, renderer.enter, renderer.exit)
+    renderer.end_route(route)
+    return out.getvalue()
+
+class Watcher:
+    def __init__(self, filename):
+        self.filename = filename
+        self.state = None
+        self.text = ""
+        self.names_span = None
+        self.spans = [] #where each base route's JSON is in self.text
+        self.routes = [] #(route, rendered text) for each base route
+        self.game_tree = Tree({})
+
+    def refresh(self):
+        # returns (routes rendered, routes in the file), or None if the
+        # file's contents are unchanged
+        stat = os.stat(self.filename)
+        state = (stat.st_mtime_ns, stat.st_size)
+        if state == self.state:
+            return None
+        with open_game_file(self.filename) as f:
+            text = f.read()
+        if text == self.text:
+            self.state = state
+            return None
+
+        change = rescan_change(self.text, text, self.names_span, self.spans) if self.routes else None
+        if change:
+            first, last, new_spans, routes_json = change
+            names = self.game_tree.names
+            shift = len(text) - len(self.text)
+            spans = self.spans[ : first] + new_spans + [(start + shift, end + shift) for start, end in self.spans[last + 1 : ]]
+            routes = self.routes[ : first] + [None] * len(routes_json) + self.routes[last + 1 : ]
+            names_span = self.names_span
+            rendered = 0
+            for i, route_json in enumerate(routes_json):
+                route = parse_route(None, route_json)
+                routes[first + i] = (route, render_route(names, route))
+                rendered += 1
+        else:
+            routes, rendered, names, names_span, spans = self.rescan_all(text)
+
+        game_tree = Tree(names)
+        for route, route_text in routes:
+            game_tree.base_routes[route.name] = route
+        self.game_tree, self.routes = game_tree, routes
+        self.state, self.text, self.names_span, self.spans = state, text, names_span, spans
+        return rendered, len(routes)
+
+    def rescan_all(self, text):
+        names_json, names_span, spans, routes_json = scan_source(text)
+        names_changed = self.names_span is None or text[names_span[0] : names_span[1]] != self.text[self.names_span[0] : self.names_span[1]]
+        names = parse_names(names_json) if names_changed else self.game_tree.names
+        # routes are matched by their text, so moving one around costs nothing
+        old = {}
+        for (start, end), entry in zip(self.spans, self.routes):
+            old.setdefault(self.text[start : end], []).append(entry)
+        routes = []
+        rendered = 0
+        for (start, end), route_json in zip(spans, routes_json):
+            reused = old.get(text[start : end])
+            if reused:
+                route, route_text = reused.pop()
+                if not names_changed:
+                    routes.append((route, route_text))
+                    continue
+            else:
+                route = parse_route(None, route_json)
+            routes.append((route, render_route(names, route)))
+            rendered += 1
+        return routes, rendered, names, names_span, spans
+
+    def display(self):
+        return "".join(route_text for route, route_text in self.routes)
+
+def write_display(text, output):
+    if output is None:
+        sys.stdout.write("\x1b[2J\x1b[H" + text)
+        sys.stdout.flush()
+        return
+    with open(output + ".tmp", "w") as f:
+        f.write(text)
+    os.replace(output + ".tmp", output)
+
+def watch(filename, output = None, poll = POLL_SECONDS):
+    watcher = Watcher(filename)
+    failed = None
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                result = watcher.refresh()
+            except (OSError,) + MALFORMED as e:
+                # most likely read part way through a save, tried again next poll
+                message = str(e) if isinstance(e, (OSError, ValueError)) else f"{type(e).__name__} {e}"
+                if message != failed:
+                    sys.stderr.write(f"Could not read {filename}: {message}\n")
+                failed = message
+                result = None
+            if result:
+                failed = None
+                write_display(watcher.display(), output)
+                rendered, total = result
+                sys.stderr.write(f"Rendered {rendered} of {total} route(s) in {(time.perf_counter() - start) * 1000:.1f} ms\n")
+            time.sleep(poll)
+    except KeyboardInterrupt:
+        pass